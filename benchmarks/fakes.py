@@ -0,0 +1,435 @@
+"""Local stand-ins for Ollama and Azure AI Search, for benchmarks and offline runs.
+
+Both servers run in a background thread on 127.0.0.1 and speak just enough of the real
+HTTP APIs for the notebook pipeline (src/ingest_pipeline.py, ollama_batch_client.py,
+search_uploader.py) and the app's search path (src/search_service.py) to run unchanged.
+
+    python benchmarks/fakes.py --ollama-port 11434 --azure-port 8443
+"""
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from embedding_store import EmbeddingStore, is_embedding_store # noqa: E402
+from local_text_search import HYBRID_KEYWORD_CANDIDATES, hybrid_search, tokenize # noqa: E402
+from local_vector_search import cosine_to_search_score, top_k_indices # noqa: E402
+from movie_documents import combine_text # noqa: E402
+
+RESULT_FIELDS = ("movie_id", "title", "overview", "tagline", "genres")
+
+
+def deterministic_vector(text: str, dimension: int) -> list:
+    """Unit-length pseudo-random vector seeded by the text, so the same text always embeds the same way."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+
+def load_replay_vectors(paths, dimension: int) -> dict:
+    """Maps embedded text -> vector from processed backups (JSONL files or embedding stores).
+
+    The text is rebuilt from each record's metadata with `combine_text`, which is what the
+    ingestion pipeline sends to Ollama, so replayed documents get their real embeddings.
+    """
+    vectors = {}
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)):
+            if is_embedding_store(path):
+                store = EmbeddingStore(path)
+                if store.dimension != dimension:
+                    continue
+                for batch in store.iter_documents():
+                    for doc in batch:
+                        vectors[combine_text(doc)] = doc["embedding"]
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    embedding = record.get("embedding")
+                    if isinstance(embedding, list) and len(embedding) == dimension:
+                        vectors[combine_text(record)] = embedding
+    return vectors
+
+
+class _FakeServer:
+    """Runs a ThreadingHTTPServer in a daemon thread; usable as a context manager."""
+
+    def __init__(self, port: int = 0):
+        self._port = port
+        self._server = None
+        self._thread = None
+
+    def _handler(self):
+        raise NotImplementedError
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", self._port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real services
+    disable_nagle_algorithm = True # Headers and body go out in separate writes; avoid 40 ms delayed-ACK stalls
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: int, text: str):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# --- Ollama ---
+class FakeOllamaServer(_FakeServer):
+    """Serves /api/embed (batch), /api/embeddings (single prompt) and the root health check.
+
+    Each request sleeps `latency_ms + per_text_ms * len(input)`. With `serial=True`
+    requests are processed one at a time, like a CPU-only Ollama host with one runner.
+    Texts found in `replay_vectors` return those vectors; others get deterministic ones.
+    The first embed request also waits `load_ms`, like Ollama loading the model into memory.
+    """
+
+    def __init__(self, port: int = 0, dimension: int = 768, latency_ms: float = 5.0, per_text_ms: float = 2.0,
+                 serial: bool = False, replay_vectors: dict = None, load_ms: float = 0.0):
+        super().__init__(port)
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.serial = serial
+        self.replay_vectors = replay_vectors or {}
+        self.load_ms = load_ms
+        self.loaded = load_ms <= 0
+        self.requests = 0
+        self.texts = 0
+        self._runner = threading.Lock()
+        self._loader = threading.Lock()
+
+    def embed(self, texts: list) -> list:
+        with self._loader: # Requests arriving during the load wait for it, as with a real model load
+            if not self.loaded:
+                time.sleep(self.load_ms / 1000)
+                self.loaded = True
+        delay = (self.latency_ms + self.per_text_ms * len(texts)) / 1000
+        if self.serial:
+            with self._runner:
+                time.sleep(delay)
+        else:
+            time.sleep(delay)
+        self.requests += 1
+        self.texts += len(texts)
+        return [self.replay_vectors.get(text) or deterministic_vector(text, self.dimension) for text in texts]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(_JsonHandler):
+            def do_GET(self):
+                self._send_text(200, "Ollama is running")
+
+            def do_POST(self):
+                body = self._read_json()
+                if self.path.startswith("/api/embeddings"):
+                    self._send_json(200, {"embedding": fake.embed([body.get("prompt", "")])[0]})
+                elif self.path.startswith("/api/embed"):
+                    texts = body.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    self._send_json(200, {"model": body.get("model"), "embeddings": fake.embed(texts)})
+                else:
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+        return Handler
+
+
+# --- Azure AI Search ---
+class FakeAzureSearchServer(_FakeServer):
+    """An in-memory index behind Azure AI Search's REST routes.
+
+    Supports index create/update (PUT), docs/search.index (upload, merge, mergeOrUpload,
+    delete with 200/207 responses), docs/search (keyword, vector, hybrid and semantic
+    queries, with counts, captions and answers) and docs/$count. `latency_ms` is added to
+    every request; `throttle_rate` is the share of index requests answered with 503.
+
+    For deterministic failures, `request_failures` lists statuses for the next index requests
+    (e.g. [429, 503]), and `document_failures` maps a key to per-document statuses returned
+    on its next attempts (e.g. {"7": [409]} answers 409 once inside a 207, then succeeds).
+    """
+
+    def __init__(self, port: int = 0, latency_ms: float = 10.0, throttle_rate: float = 0.0,
+                 max_request_bytes: int = 16 * 1024 * 1024):
+        super().__init__(port)
+        self.latency_ms = latency_ms
+        self.throttle_rate = throttle_rate
+        self.max_request_bytes = max_request_bytes
+        self.documents = {} # movie_id -> document
+        self.requests = 0
+        self.index_requests = [] # Number of actions in each index request that was processed
+        self.request_failures = []
+        self.document_failures = {}
+        self._lock = threading.Lock()
+        self._postings = {} # token -> set of movie_ids
+        self._matrix = None # (ids, normalized vectors), rebuilt lazily after writes
+
+    # --- Index Writes ---
+    def _index_tokens(self, document: dict, add: bool):
+        text = " ".join(str(document.get(field) or "") for field in ("title", "overview", "tagline", "genres"))
+        for token in set(tokenize(text)):
+            postings = self._postings.setdefault(token, set())
+            (postings.add if add else postings.discard)(document["movie_id"])
+
+    def index_actions(self, actions: list) -> list:
+        results = []
+        with self._lock:
+            for action in actions:
+                action = dict(action)
+                kind = action.pop("@search.action", "upload")
+                key = action.get("movie_id")
+                if self.document_failures.get(key):
+                    status_code = self.document_failures[key].pop(0)
+                    results.append({"key": key, "status": False, "errorMessage": f"Injected {status_code}", "statusCode": status_code})
+                    continue
+                existing = self.documents.get(key)
+                if kind == "delete":
+                    if existing:
+                        self._index_tokens(existing, add=False)
+                        del self.documents[key]
+                    results.append({"key": key, "status": True, "errorMessage": None, "statusCode": 200})
+                    continue
+                if kind == "merge" and existing is None:
+                    results.append({"key": key, "status": False, "errorMessage": "Document not found.", "statusCode": 404})
+                    continue
+                document = {**existing, **action} if existing and kind in ("merge", "mergeOrUpload") else action
+                if existing:
+                    self._index_tokens(existing, add=False)
+                self.documents[key] = document
+                self._index_tokens(document, add=True)
+                results.append({"key": key, "status": True, "errorMessage": None, "statusCode": 201 if not existing else 200})
+            self._matrix = None
+        return results
+
+    # --- Queries ---
+    def _vectors(self):
+        with self._lock:
+            if self._matrix is None:
+                ids = [key for key, doc in self.documents.items() if doc.get("embedding")]
+                vectors = np.asarray([self.documents[key]["embedding"] for key in ids], dtype=np.float32)
+                if len(ids):
+                    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                self._matrix = (ids, vectors)
+            return self._matrix
+
+    def _row(self, key: str, score: float) -> dict:
+        document = self.documents[key]
+        return {"@search.score": score, **{field: document.get(field) for field in RESULT_FIELDS}}
+
+    def keyword_search(self, text: str, k: int) -> tuple:
+        scores = {}
+        with self._lock:
+            total = len(self.documents)
+            for token in set(tokenize(text or "")):
+                postings = self._postings.get(token)
+                if postings:
+                    weight = np.log(1 + total / len(postings))
+                    for key in postings:
+                        scores[key] = scores.get(key, 0.0) + weight
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [self._row(key, float(score)) for key, score in best], len(scores)
+
+    def vector_search(self, vector: list, k: int) -> list:
+        ids, vectors = self._vectors()
+        if not ids:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        similarities = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+        best = top_k_indices(similarities, k)
+        with self._lock:
+            return [self._row(ids[i], float(cosine_to_search_score(similarities[i]))) for i in best]
+
+    def search(self, body: dict) -> dict:
+        top = int(body.get("top") or 50)
+        text = body.get("search")
+        vector_queries = body.get("vectorQueries") or []
+        text = None if text in (None, "", "*") else text
+        if vector_queries and text:
+            keyword_rows, _ = self.keyword_search(text, HYBRID_KEYWORD_CANDIDATES)
+            vector_rows = self.vector_search(vector_queries[0]["vector"], vector_queries[0].get("k", top))
+            rows, count = hybrid_search(keyword_rows, vector_rows, k=top)
+        elif vector_queries:
+            rows = self.vector_search(vector_queries[0]["vector"], vector_queries[0].get("k", top))
+            count = len(rows)
+        else:
+            rows, count = self.keyword_search(text, top)
+
+        response = {"value": rows}
+        if body.get("count"):
+            response["@odata.count"] = count
+        if body.get("queryType") == "semantic":
+            for rank, row in enumerate(rows):
+                row["@search.rerankerScore"] = round(4.0 - rank * 0.1, 3)
+                if body.get("captions"):
+                    caption = (row.get("overview") or row.get("title") or "")[:200]
+                    row["@search.captions"] = [{"text": caption, "highlights": caption}]
+            if body.get("answers") and rows:
+                top_row = rows[0]
+                response["@search.answers"] = [{"key": top_row["movie_id"], "text": (top_row.get("overview") or "")[:200],
+                                                "highlights": None, "score": 0.9}]
+        return response
+
+    def _handler(self):
+        fake = self
+
+        class Handler(_JsonHandler):
+            def _delay(self):
+                fake.requests += 1
+                time.sleep(fake.latency_ms / 1000)
+
+            def do_GET(self):
+                self._delay()
+                if "/docs/$count" in self.path:
+                    self._send_text(200, str(len(fake.documents)))
+                else:
+                    self._send_json(200, {"value": []})
+
+            def do_PUT(self):
+                self._delay()
+                self._send_json(201, self._read_json()) # Index definitions are accepted as-is
+
+            def do_POST(self):
+                self._delay()
+                length = int(self.headers.get("Content-Length", 0))
+                if "search.index" in self.path:
+                    if length > fake.max_request_bytes:
+                        self.rfile.read(length)
+                        return self._send_json(413, {"error": {"message": "Request Entity Too Large"}})
+                    with fake._lock:
+                        failure = fake.request_failures.pop(0) if fake.request_failures else None
+                    if failure is None and fake.throttle_rate and random.random() < fake.throttle_rate:
+                        failure = 503
+                    if failure is not None:
+                        self.rfile.read(length)
+                        return self._send_json(failure, {"error": {"code": str(failure), "message": "Throttled"}})
+                    actions = self._read_json().get("value", [])
+                    with fake._lock:
+                        fake.index_requests.append(len(actions))
+                    results = fake.index_actions(actions)
+                    return self._send_json(200 if all(r["status"] for r in results) else 207, {"value": results})
+                if "/docs/search" in self.path:
+                    return self._send_json(200, fake.search(self._read_json()))
+                self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+        return Handler
+
+
+# --- Out-of-Process Fakes ---
+def _serve(connection, ollama_options: dict, azure_options: dict, replay_paths):
+    replay = load_replay_vectors(replay_paths, ollama_options.get("dimension", 768)) if replay_paths else {}
+    with FakeOllamaServer(replay_vectors=replay, **ollama_options) as ollama, FakeAzureSearchServer(**azure_options) as azure:
+        connection.send((ollama.url, azure.url, len(replay)))
+        while True:
+            time.sleep(3600) # Until the parent terminates us
+
+
+class FakeServices:
+    """Runs both fakes in a child process, so their JSON and numpy work doesn't compete with
+    the code under test for the GIL. Exposes `ollama_url`, `azure_url` and `replayed_vectors`.
+    """
+
+    def __init__(self, ollama_options: dict = None, azure_options: dict = None, replay_paths=()):
+        self.ollama_options = ollama_options or {}
+        self.azure_options = azure_options or {}
+        self.replay_paths = list(replay_paths)
+        self.ollama_url = self.azure_url = None
+        self.replayed_vectors = 0
+        self._process = None
+
+    def start(self):
+        parent, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, name="benchmark-fakes", daemon=True,
+                                                args=(child, self.ollama_options, self.azure_options, self.replay_paths))
+        self._process.start()
+        self.ollama_url, self.azure_url, self.replayed_vectors = parent.recv()
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+# --- Command Line: run both fakes until interrupted ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local stand-ins for Ollama and Azure AI Search.")
+    parser.add_argument("--ollama-port", type=int, default=11434)
+    parser.add_argument("--azure-port", type=int, default=8443)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--ollama-latency-ms", type=float, default=5.0)
+    parser.add_argument("--ollama-per-text-ms", type=float, default=2.0)
+    parser.add_argument("--ollama-serial", action="store_true", help="Process one embedding request at a time.")
+    parser.add_argument("--azure-latency-ms", type=float, default=10.0)
+    parser.add_argument("--replay", nargs="*", default=[], help="Processed JSONL files/stores whose vectors are replayed.")
+    args = parser.parse_args()
+
+    replay = load_replay_vectors(args.replay, args.dimension) if args.replay else {}
+    with FakeOllamaServer(args.ollama_port, args.dimension, args.ollama_latency_ms, args.ollama_per_text_ms,
+                          serial=args.ollama_serial, replay_vectors=replay) as ollama, \
+            FakeAzureSearchServer(args.azure_port, args.azure_latency_ms) as azure:
+        print(f"Fake Ollama:       {ollama.url}/api/embed ({len(replay)} replayed vectors)")
+        print(f"Fake Azure Search: {azure.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,391 @@
+"""Benchmarks ingestion throughput and query latency against local Ollama/Azure fakes.
+
+Runs the notebook's ingestion pipeline (IngestionPipeline + OllamaBatchEmbedder +
+SearchUploader + manifest) over a CSV, then times every search mode through the app's
+code paths (search_service.run_search for Azure, LocalVectorIndex/BM25Index for the
+local backend). Results are written as JSON; pass `--baseline` with an earlier report to
+fail (exit code 1) when throughput drops or latency rises beyond `--tolerance`.
+
+    python benchmarks/run_benchmarks.py --rows 5000
+    python benchmarks/run_benchmarks.py --csv movies_metadata.csv --rows 46000 \
+        --replay "data/processed/*.jsonl" --baseline benchmarks/results/before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCHMARKS_DIR, "..", "src"))
+from fakes import FakeServices # noqa: E402
+from embedding_store import EmbeddingStore # noqa: E402
+from ingest_manifest import IngestManifest # noqa: E402
+from ingest_pipeline import IngestionPipeline, StoreBackupSink # noqa: E402
+from local_text_search import HYBRID_KEYWORD_CANDIDATES, BM25Index, hybrid_search # noqa: E402
+from local_vector_search import LocalVectorIndex # noqa: E402
+from ollama_batch_client import OllamaBatchEmbedder # noqa: E402
+from search_service import SEARCH_MODES, MODE_HYBRID, MODE_KEYWORD, MODE_VECTOR, VECTOR_MODES, get_ollama_session, get_search_client, run_search # noqa: E402
+from search_uploader import SearchUploader # noqa: E402
+
+# --- Configuration Defaults ---
+REPORT_SCHEMA = 1 # Bump when the report layout changes incompatibly
+DEFAULT_RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+MODEL = "nomic-embed-text"
+INDEX_NAME = "movies-benchmark-index"
+API_KEY = "benchmark-key"
+LOCAL_MODES = (MODE_KEYWORD, MODE_VECTOR, MODE_HYBRID)
+TUNING_ENV_PREFIXES = ("OLLAMA_", "UPLOAD_", "CSV_CHUNK_SIZE", "EMBED_GROUP_SIZE", "PIPELINE_QUEUE_SIZE") # Recorded in the report
+REGRESSION_TOLERANCE = 0.2 # 20% slower than the baseline counts as a regression
+MIN_LATENCY_DELTA_MS = 5.0 # ...but latency changes smaller than this are noise, whatever the percentage
+
+# The notebook 2 examples plus a spread of short, long and genre-style queries
+QUERIES = [
+    "lonely robot cleaning up a polluted earth",
+    "philosophical look at artificial intelligence in space",
+    "movies about charming thieves who pull off a big heist",
+    "what are some critically acclaimed romantic comedies from the 90s?",
+    "dystopian future where society is divided into factions",
+    "haunted house",
+    "toys that come to life when nobody is watching",
+    "a detective hunting a serial killer in a rainy city",
+    "family road trip comedy",
+    "survival drama stranded on a desert island",
+    "time travel paradox",
+    "coming of age story about friendship in a small town",
+    "war film about soldiers trying to get home",
+    "animated musical fairy tale with a princess",
+    "space crew discovers an alien creature aboard their ship",
+    "sports underdog team wins the championship",
+    "documentary about climate change",
+    "vampire romance",
+    "political thriller about a government conspiracy",
+    "martial arts revenge",
+]
+
+# Synthetic catalog: enough vocabulary for keyword search to have realistic posting lists
+_GENRES = [(28, "Action"), (12, "Adventure"), (16, "Animation"), (35, "Comedy"), (80, "Crime"), (99, "Documentary"),
+           (18, "Drama"), (10751, "Family"), (14, "Fantasy"), (27, "Horror"), (10749, "Romance"),
+           (878, "Science Fiction"), (53, "Thriller"), (10752, "War")]
+_WORDS = ("robot earth space heist thief detective killer city family road trip island survival time travel "
+          "friendship town soldier war home princess musical alien ship crew team championship climate vampire "
+          "romance government conspiracy revenge martial arts haunted house toys life love secret journey dark "
+          "young old world mission escape past future lost kingdom dream hero villain night storm sea mountain").split()
+
+
+def generate_movies_csv(path: str, rows: int, seed: int = 7):
+    """Writes a movies_metadata.csv look-alike (same columns and genre format as the Kaggle file)."""
+    import pandas as pd # Only needed for the synthetic catalog
+
+    rng = random.Random(seed)
+    records = []
+    for movie_id in range(1, rows + 1):
+        genres = rng.sample(_GENRES, rng.randint(1, 3))
+        records.append({
+            "id": movie_id,
+            "title": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 4))).title(),
+            "overview": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(20, 80))).capitalize() + ".",
+            "tagline": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 8))).capitalize() if rng.random() < 0.6 else None,
+            "genres": str([{"id": genre_id, "name": name} for genre_id, name in genres]),
+        })
+    pd.DataFrame.from_records(records).to_csv(path, index=False)
+
+
+def percentiles(samples_ms: list) -> dict:
+    """Latency summary in milliseconds."""
+    if not samples_ms:
+        return {}
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "count": int(samples.size),
+        "p50": round(float(np.percentile(samples, 50)), 3),
+        "p95": round(float(np.percentile(samples, 95)), 3),
+        "p99": round(float(np.percentile(samples, 99)), 3),
+        "mean": round(float(samples.mean()), 3),
+        "max": round(float(samples.max()), 3),
+    }
+
+
+def git_revision() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCHMARKS_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+# --- Ingestion ---
+def run_ingestion_pass(csv_path: str, rows: int, ollama_url: str, azure_url: str, args, store_path: str,
+                       manifest: IngestManifest, carry_over_stores=()) -> dict:
+    """One notebook-equivalent ingestion run; returns its throughput figures."""
+    # The clients read the same OLLAMA_*/UPLOAD_* variables as the notebook, pointed at the fakes
+    os.environ["OLLAMA_ENDPOINTS"] = f"{ollama_url}/api/embed"
+    embedder = OllamaBatchEmbedder.from_env(model=MODEL, dimension=args.dimension)
+    uploader = SearchUploader.from_env(azure_url, INDEX_NAME, API_KEY)
+    sink = StoreBackupSink(store_path, MODEL, args.dimension)
+    pipeline = IngestionPipeline(
+        embed_fn=embedder.embed,
+        upload_fn=lambda documents: uploader.upload(documents).succeeded,
+        sinks=[sink],
+        dimension=args.dimension,
+        csv_chunk_size=int(os.getenv("CSV_CHUNK_SIZE", 1000)),
+        embed_batch_size=int(os.getenv("EMBED_GROUP_SIZE", 512)),
+        upload_batch_size=int(os.getenv("UPLOAD_GROUP_SIZE", 1000)),
+        queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", 4)),
+        progress_interval=3600, # Keep the benchmark output to the summary
+        manifest=manifest,
+        carry_over_stores=carry_over_stores,
+    )
+    try:
+        report = pipeline.run(csv_path, nrows=rows)
+    finally:
+        embedder_stats = embedder.stats()
+        embedder.close()
+        uploader.close()
+    report.print_summary()
+    elapsed = report.elapsed_seconds
+    return {
+        "rows_read": report.rows_read,
+        "embedded": report.embedded,
+        "uploaded": report.uploaded,
+        "unchanged": report.unchanged,
+        "failed": report.failed,
+        "backup_rows": sink.count,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(report.rows_read / elapsed, 2) if elapsed else 0.0,
+        "stages": {
+            name: {"items": stage.items, "busy_seconds": round(stage.busy_seconds, 3),
+                   "rows_per_second": round(stage.rows_per_second, 2)}
+            for name, stage in report.stages.items()
+        },
+        "ollama": embedder_stats,
+    }
+
+
+def benchmark_ingestion(csv_path: str, rows: int, fakes: FakeServices, args, work_dir: str) -> dict:
+    """A full pass into an empty index, then an incremental pass with nothing changed."""
+    manifest = IngestManifest(os.path.join(work_dir, "manifest.sqlite3"), MODEL, args.dimension)
+    store_path = os.path.join(work_dir, "embeddings.embstore")
+    try:
+        print(f"\n--- Ingestion: full pass ({rows} rows) ---")
+        full = run_ingestion_pass(csv_path, rows, fakes.ollama_url, fakes.azure_url, args, store_path, manifest)
+        print("\n--- Ingestion: incremental pass (no changes) ---")
+        previous = EmbeddingStore(store_path)
+        incremental = run_ingestion_pass(csv_path, rows, fakes.ollama_url, fakes.azure_url, args, store_path + ".next",
+                                         manifest, carry_over_stores=[previous])
+        previous = None # Release the memory map
+    finally:
+        manifest.close()
+    count = requests.get(f"{fakes.azure_url}/indexes('{INDEX_NAME}')/docs/$count", headers={"api-key": API_KEY}, timeout=30)
+    return {"full": full, "incremental": incremental, "index_documents": int(count.text)}
+
+
+# --- Queries ---
+def embed_query(ollama_url: str, text: str) -> list:
+    """Same request the app makes for a query embedding, without the embedding cache."""
+    response = get_ollama_session().post(f"{ollama_url}/api/embed", json={"model": MODEL, "input": [text]}, timeout=60)
+    response.raise_for_status()
+    return response.json()["embeddings"][0]
+
+
+def time_queries(run_one, modes, queries: list, warmup: int) -> dict:
+    """Calls run_one(mode, query) for every mode/query; returns latency percentiles per mode.
+
+    run_one returns (embedding milliseconds or None, number of result rows).
+    """
+    results = {}
+    for mode in modes:
+        for query in queries[:warmup]:
+            run_one(mode, query)
+        totals, embeds, empty = [], [], 0
+        for query in queries:
+            start = time.perf_counter()
+            embed_ms, hits = run_one(mode, query)
+            totals.append((time.perf_counter() - start) * 1000)
+            if embed_ms is not None:
+                embeds.append(embed_ms)
+            empty += not hits
+        results[mode] = {"latency_ms": percentiles(totals), "empty_results": empty}
+        if embeds:
+            results[mode]["embedding_ms"] = percentiles(embeds)
+        print(f"  {mode:<42} p50 {results[mode]['latency_ms']['p50']:8.2f} ms | "
+              f"p95 {results[mode]['latency_ms']['p95']:8.2f} ms | p99 {results[mode]['latency_ms']['p99']:8.2f} ms")
+    return results
+
+
+def benchmark_queries(fakes: FakeServices, store_path: str, args) -> dict:
+    queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+    search_client = get_search_client(fakes.azure_url, INDEX_NAME, API_KEY)
+
+    def run_azure(mode, query):
+        embed_ms = None
+        query_vector = None
+        if mode in VECTOR_MODES:
+            start = time.perf_counter()
+            query_vector = embed_query(fakes.ollama_url, query)
+            embed_ms = (time.perf_counter() - start) * 1000
+        results = run_search(search_client, mode, query, query_vector=query_vector, top_k=args.top_k,
+                             semantic_configuration_name="default")
+        return embed_ms, len(results.rows)
+
+    print(f"\n--- Queries: Azure AI Search backend ({len(queries)} per mode) ---")
+    report = {"azure": time_queries(run_azure, SEARCH_MODES, queries, args.warmup)}
+
+    load_start = time.perf_counter()
+    vector_index = LocalVectorIndex.from_path(store_path, expected_dimension=args.dimension)
+    text_index = BM25Index.build(dict(zip(vector_index.metadata, values)) for values in zip(*vector_index.metadata.values()))
+    load_seconds = time.perf_counter() - load_start
+
+    def run_local(mode, query):
+        if mode == MODE_KEYWORD:
+            rows, _ = text_index.search(query, k=args.top_k)
+            return None, len(rows)
+        start = time.perf_counter()
+        query_vector = embed_query(fakes.ollama_url, query)
+        embed_ms = (time.perf_counter() - start) * 1000
+        rows = vector_index.search(query_vector, k=args.top_k)
+        if mode == MODE_HYBRID:
+            keyword_rows, _ = text_index.search(query, k=HYBRID_KEYWORD_CANDIDATES)
+            rows, _ = hybrid_search(keyword_rows, rows, k=args.top_k)
+        return embed_ms, len(rows)
+
+    print(f"\n--- Queries: local backend (indexes loaded in {load_seconds:.2f}s) ---")
+    report["local"] = time_queries(run_local, LOCAL_MODES, queries, args.warmup)
+    report["local_load_seconds"] = round(load_seconds, 3)
+    return report
+
+
+# --- Baseline Comparison ---
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float,
+                          min_latency_delta_ms: float = MIN_LATENCY_DELTA_MS) -> list:
+    """Returns human-readable regressions: throughput below, or latency above, baseline by more than `tolerance`."""
+    regressions = []
+
+    def check(label, now, before, higher_is_better):
+        if not now or not before:
+            return
+        change = (now - before) / before
+        worse = -change if higher_is_better else change
+        regressed = worse > tolerance and (higher_is_better or now - before > min_latency_delta_ms)
+        print(f"  {label:<62} {before:10.2f} -> {now:10.2f} ({change:+7.1%}) {'REGRESSION' if regressed else 'ok'}")
+        if regressed:
+            regressions.append(f"{label}: {before:.2f} -> {now:.2f} ({change:+.1%})")
+
+    for run in ("full", "incremental"):
+        now = current.get("ingestion", {}).get(run, {})
+        before = baseline.get("ingestion", {}).get(run, {})
+        check(f"ingestion.{run} rows/s", now.get("rows_per_second"), before.get("rows_per_second"), True)
+    for backend in ("azure", "local"):
+        for mode, stats in current.get("queries", {}).get(backend, {}).items():
+            before = baseline.get("queries", {}).get(backend, {}).get(mode)
+            if not isinstance(stats, dict) or not isinstance(before, dict):
+                continue
+            for quantile in ("p50", "p95"):
+                check(f"queries.{backend}.{mode} {quantile} ms", stats["latency_ms"].get(quantile),
+                      before.get("latency_ms", {}).get(quantile), False)
+    return regressions
+
+
+# --- Command Line ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion throughput and query latency against local fakes.")
+    parser.add_argument("--csv", help="movies_metadata.csv to ingest (default: a synthetic catalog).")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows to ingest (and to generate for the synthetic catalog).")
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--replay", nargs="*", default=[],
+                        help="Processed JSONL files/stores (globs allowed) whose vectors the Ollama fake replays.")
+    parser.add_argument("--ollama-latency-ms", type=float, default=5.0, help="Fixed cost of each embedding request.")
+    parser.add_argument("--ollama-per-text-ms", type=float, default=2.0, help="Added per text in a request.")
+    parser.add_argument("--ollama-serial", action="store_true", help="Fake a single-runner Ollama host.")
+    parser.add_argument("--azure-latency-ms", type=float, default=10.0, help="Added to every Azure Search request.")
+    parser.add_argument("--azure-throttle-rate", type=float, default=0.0, help="Share of index requests answered with 503.")
+    parser.add_argument("--queries", type=int, default=100, help="Timed queries per search mode.")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed queries per mode before timing.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--skip-queries", action="store_true")
+    parser.add_argument("--output", help=f"Report path (default: {os.path.relpath(DEFAULT_RESULTS_DIR)}/<timestamp>.json).")
+    parser.add_argument("--baseline", help="Earlier report to compare against; exits 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="Allowed relative slowdown before a metric counts as a regression.")
+    parser.add_argument("--min-latency-delta-ms", type=float, default=MIN_LATENCY_DELTA_MS,
+                        help="Latency increases smaller than this never count as regressions.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="movie-search-bench-")
+    try:
+        csv_path = args.csv
+        if not csv_path:
+            csv_path = os.path.join(work_dir, "movies_metadata.csv")
+            generate_movies_csv(csv_path, args.rows)
+        fakes = FakeServices(
+            ollama_options={"dimension": args.dimension, "latency_ms": args.ollama_latency_ms,
+                            "per_text_ms": args.ollama_per_text_ms, "serial": args.ollama_serial},
+            azure_options={"latency_ms": args.azure_latency_ms, "throttle_rate": args.azure_throttle_rate},
+            replay_paths=args.replay,
+        )
+        with fakes:
+            if args.replay:
+                print(f"Replaying {fakes.replayed_vectors} recorded vectors.")
+            report = {
+                "schema": REPORT_SCHEMA,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "git": git_revision(),
+                "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                                "cpu_count": os.cpu_count()},
+                "config": {
+                    "source": os.path.basename(args.csv) if args.csv else "synthetic",
+                    "rows": args.rows,
+                    "dimension": args.dimension,
+                    "replayed_vectors": fakes.replayed_vectors,
+                    "ollama_latency_ms": args.ollama_latency_ms,
+                    "ollama_per_text_ms": args.ollama_per_text_ms,
+                    "ollama_serial": args.ollama_serial,
+                    "azure_latency_ms": args.azure_latency_ms,
+                    "azure_throttle_rate": args.azure_throttle_rate,
+                    "queries_per_mode": args.queries,
+                    "top_k": args.top_k,
+                    "env": {key: value for key, value in os.environ.items()
+                            if key.startswith(TUNING_ENV_PREFIXES) and key not in ("OLLAMA_ENDPOINT", "OLLAMA_ENDPOINTS")},
+                },
+            }
+            report["ingestion"] = benchmark_ingestion(csv_path, args.rows, fakes, args, work_dir)
+            if not args.skip_queries:
+                report["queries"] = benchmark_queries(fakes, os.path.join(work_dir, "embeddings.embstore"), args)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n--- Comparison with {args.baseline} (tolerance {args.tolerance:.0%}) ---")
+        regressions = compare_with_baseline(report, baseline, args.tolerance, args.min_latency_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s):")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, convert_jsonl_to_store, is_embedding_store
+from local_vector_search import RESULT_FIELDS, cosine_to_search_score, normalize_rows, top_k_indices
+
+# --- Configuration Defaults ---
+INDEX_FORMAT = "contoso-ivf-index"
+INDEX_VERSION = 1
+QUANTIZERS = ("pq", "int8")
+DEFAULT_QUANTIZER = "pq"
+DEFAULT_NPROBE = 16 # Lists scanned per query; more lists = higher recall, slower queries
+DEFAULT_RERANK = 100 # Candidates re-scored with full-precision vectors from the store (0 = compressed scores only)
+DEFAULT_TRAIN_SIZE = 50000 # Vectors sampled to train the partition and codebooks
+DEFAULT_ITERATIONS = 10
+PQ_CENTROIDS = 256 # One uint8 code per sub-vector
+PQ_TRAIN_SIZE = 10000 # Codebooks only have 256 entries each; a smaller sample trains them as well
+CHUNK_ROWS = 16384 # Rows read from the store at a time while encoding / exact scoring
+
+
+def default_nlist(count: int) -> int:
+    """Number of coarse lists: about 4 * sqrt(N), so each query scans a small fraction of the catalog."""
+    return max(1, min(count, int(round(4 * np.sqrt(count)))))
+
+
+def kmeans(data: np.ndarray, n_clusters: int, iterations: int = DEFAULT_ITERATIONS, spherical: bool = False,
+           rng=None) -> np.ndarray:
+    """Lloyd's k-means in numpy. `spherical` clusters by cosine (centroids are re-normalized).
+
+    Clusters that end up empty are re-seeded with random points so every centroid stays in use.
+    """
+    rng = rng or np.random.default_rng(0)
+    n_clusters = min(n_clusters, len(data))
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = assign(data, centroids, spherical)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Per-cluster sums over rows sorted by cluster (much faster than np.add.at)
+        order = np.argsort(assignments, kind="stable")
+        used = np.flatnonzero(counts)
+        sums = np.zeros_like(centroids)
+        sums[used] = np.add.reduceat(data[order], np.concatenate(([0], np.cumsum(counts[used])[:-1])), axis=0)
+        empty = counts == 0
+        centroids = sums / np.maximum(counts, 1).astype(np.float32)[:, np.newaxis]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        if spherical:
+            normalize_rows(centroids)
+    return centroids
+
+
+def pq_assign(sub_vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    """Nearest codebook entry (L2) for every sub-vector: (pq_m, n, sub_dim) -> (n, pq_m) codes."""
+    codes = np.empty((sub_vectors.shape[1], len(codebooks)), dtype=np.uint8)
+    for j, codebook in enumerate(codebooks):
+        codes[:, j] = assign(sub_vectors[j], codebook)
+    return codes
+
+
+def pq_kmeans(sub_vectors: np.ndarray, n_centroids: int = PQ_CENTROIDS, iterations: int = DEFAULT_ITERATIONS,
+              rng=None) -> np.ndarray:
+    """Trains all PQ codebooks at once: (pq_m, n, sub_dim) -> (pq_m, n_centroids, sub_dim)."""
+    rng = rng or np.random.default_rng(0)
+    pq_m, count, sub_dimension = sub_vectors.shape
+    n_centroids = min(n_centroids, count)
+    codebooks = sub_vectors[:, rng.choice(count, n_centroids, replace=False)].copy()
+    for _ in range(iterations):
+        # One bincount per sub-dimension over (sub-quantizer, centroid) pairs
+        slots = (pq_assign(sub_vectors, codebooks).T + np.arange(pq_m)[:, np.newaxis] * n_centroids).ravel()
+        counts = np.bincount(slots, minlength=pq_m * n_centroids).reshape(pq_m, n_centroids)
+        for d in range(sub_dimension):
+            sums = np.bincount(slots, weights=sub_vectors[:, :, d].ravel(), minlength=pq_m * n_centroids)
+            codebooks[:, :, d] = sums.reshape(pq_m, n_centroids) / np.maximum(counts, 1)
+        empty = np.argwhere(counts == 0)
+        if len(empty):
+            codebooks[empty[:, 0], empty[:, 1]] = sub_vectors[empty[:, 0], rng.integers(0, count, len(empty))]
+    return codebooks
+
+
+def assign(data: np.ndarray, centroids: np.ndarray, spherical: bool = False) -> np.ndarray:
+    """Returns the nearest centroid per row (highest inner product if `spherical`, else smallest L2)."""
+    assignments = np.empty(len(data), dtype=np.int64)
+    centroid_norms = None if spherical else (centroids ** 2).sum(axis=1)
+    for start in range(0, len(data), CHUNK_ROWS):
+        scores = data[start:start + CHUNK_ROWS] @ centroids.T
+        if not spherical:
+            scores = 2 * scores - centroid_norms # ||x - c||^2 = ||x||^2 - (2 x.c - ||c||^2)
+        assignments[start:start + CHUNK_ROWS] = scores.argmax(axis=1)
+    return assignments
+
+
+class IVFQuantizedIndex:
+    """Approximate cosine search: an inverted-file (IVF) partition with compressed residual codes.
+
+    Documents are grouped by their nearest coarse centroid, and only the difference to that
+    centroid is stored, either as int8 per dimension (4x smaller than float32) or as product
+    quantization codes (one byte per `dimension / pq_m` dimensions, 16x at the default
+    `pq_m = dimension / 4`). A query scores the centroids, scans the `nprobe` best lists with
+    the compressed codes, then re-scores the best `rerank` candidates exactly from the
+    memory-mapped embedding store, which is also where result metadata is read from.
+    Scores use the same cosine -> `@search.score` mapping as Azure vector queries.
+    """
+
+    def __init__(self, centroids, offsets, ids, codes, quantizer: str, store: EmbeddingStore,
+                 scale=None, codebooks=None, nprobe: int = DEFAULT_NPROBE, rerank: int = DEFAULT_RERANK):
+        self.centroids = centroids # (nlist, dimension), L2-normalized
+        self.offsets = offsets # list i holds entries offsets[i]:offsets[i + 1]
+        self.ids = ids # store row per entry, grouped by list
+        self.codes = codes # (count, dimension) int8 or (count, pq_m) uint8, aligned with ids
+        self.quantizer = quantizer
+        self.scale = scale # int8: per-dimension step size
+        self.codebooks = codebooks # pq: (pq_m, PQ_CENTROIDS, dimension / pq_m)
+        self.store = store
+        self.model = store.model
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.count = len(ids)
+        self.dimension = centroids.shape[1]
+        self.nlist = len(centroids)
+        self.list_sizes = np.diff(offsets)
+
+    # --- Building ---
+    @classmethod
+    def build(cls, store: EmbeddingStore, nlist: int = None, quantizer: str = DEFAULT_QUANTIZER, pq_m: int = None,
+              train_size: int = DEFAULT_TRAIN_SIZE, iterations: int = DEFAULT_ITERATIONS, seed: int = 0, **kwargs):
+        """Trains the partition and quantizer on a sample of the store, then encodes every row.
+
+        Only the sample and one chunk of full-precision rows are in memory at a time.
+        """
+        if quantizer not in QUANTIZERS:
+            raise ValueError(f"Unsupported quantizer '{quantizer}'. Expected one of {QUANTIZERS}.")
+        if not store.count:
+            raise ValueError(f"Store '{store.path}' is empty.")
+        dimension = store.dimension
+        pq_m = pq_m or max(1, dimension // 4)
+        if quantizer == "pq" and dimension % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide the vector dimension {dimension}.")
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist or default_nlist(store.count), store.count)
+
+        def read_rows(rows):
+            matrix = np.asarray(store.vectors[rows], dtype=np.float32)
+            return matrix if store.normalized else normalize_rows(matrix)
+
+        # Coarse partition, trained on a sample
+        sample = np.sort(rng.choice(store.count, min(train_size, store.count), replace=False))
+        train = read_rows(sample)
+        centroids = kmeans(train, nlist, iterations, spherical=True, rng=rng)
+        residuals = train - centroids[assign(train, centroids, spherical=True)]
+
+        # Residual quantizer, trained on the same sample
+        scale = codebooks = None
+        if quantizer == "int8":
+            scale = np.maximum(np.abs(residuals).max(axis=0), 1e-12).astype(np.float32) / 127.0
+        else:
+            pq_sample = residuals[:PQ_TRAIN_SIZE] # Already a random sample
+            codebooks = pq_kmeans(pq_sample.reshape(len(pq_sample), pq_m, -1).transpose(1, 0, 2).copy(),
+                                  iterations=iterations, rng=rng)
+
+        # Encode every row, one chunk at a time
+        assignments = np.empty(store.count, dtype=np.int64)
+        codes = np.empty((store.count, dimension if quantizer == "int8" else pq_m),
+                         dtype=np.int8 if quantizer == "int8" else np.uint8)
+        for start in range(0, store.count, CHUNK_ROWS):
+            rows = np.arange(start, min(start + CHUNK_ROWS, store.count))
+            chunk = read_rows(rows)
+            assignments[rows] = assign(chunk, centroids, spherical=True)
+            chunk_residuals = chunk - centroids[assignments[rows]]
+            if quantizer == "int8":
+                codes[rows] = np.clip(np.rint(chunk_residuals / scale), -127, 127)
+            else:
+                codes[rows] = pq_assign(chunk_residuals.reshape(len(rows), pq_m, -1).transpose(1, 0, 2).copy(), codebooks)
+
+        # Group entries by list so each list is one contiguous slice
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=len(centroids)))
+        ids = order.astype(np.int32 if store.count < 2 ** 31 else np.int64)
+        return cls(centroids, offsets, ids, codes[order], quantizer, store,
+                   scale=scale, codebooks=codebooks, **kwargs)
+
+    # --- Persistence ---
+    def save(self, path: str):
+        """Writes the index to a single uncompressed .npz file that refers to its embedding store."""
+        header = {
+            "format": INDEX_FORMAT,
+            "version": INDEX_VERSION,
+            "quantizer": self.quantizer,
+            "model": self.model,
+            "dimension": self.dimension,
+            "count": self.count,
+            # Relative, so the data directory can be moved as a whole
+            "store": os.path.relpath(os.path.abspath(self.store.path), os.path.dirname(os.path.abspath(path))),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        arrays = {"header": np.asarray(json.dumps(header)), "centroids": self.centroids, "offsets": self.offsets,
+                  "ids": self.ids, "codes": self.codes}
+        if self.quantizer == "int8":
+            arrays["scale"] = self.scale
+        else:
+            arrays["codebooks"] = self.codebooks
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str, store_path: str = None, **kwargs):
+        """Loads an index written by `save`; the store is found relative to the index file unless given."""
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data["header"]))
+            if header.get("format") != INDEX_FORMAT:
+                raise ValueError(f"'{path}' is not an IVF index (format: {header.get('format')}).")
+            store = EmbeddingStore(store_path or os.path.join(os.path.dirname(os.path.abspath(path)), header["store"]))
+            if store.count != header["count"] or store.dimension != header["dimension"]:
+                raise ValueError(f"Store '{store.path}' ({store.count} x {store.dimension}) no longer matches "
+                                 f"index '{path}' ({header['count']} x {header['dimension']}); rebuild the index.")
+            return cls(data["centroids"], data["offsets"], data["ids"], data["codes"], header["quantizer"], store,
+                       scale=data["scale"] if "scale" in data else None,
+                       codebooks=data["codebooks"] if "codebooks" in data else None, **kwargs)
+
+    # --- Search ---
+    def memory_bytes(self) -> dict:
+        """In-RAM size of the index parts, next to what the full-precision float32 matrix would take."""
+        sizes = {
+            "codes": self.codes.nbytes,
+            "ids": self.ids.nbytes + self.offsets.nbytes,
+            "centroids": self.centroids.nbytes,
+            "quantizer": (self.scale if self.quantizer == "int8" else self.codebooks).nbytes,
+        }
+        sizes["total"] = sum(sizes.values())
+        sizes["float32"] = self.count * self.dimension * 4
+        return sizes
+
+    def _search_one(self, query: np.ndarray, centroid_scores: np.ndarray, table, k: int, nprobe: int, rerank: int):
+        # Probe the best lists, plus more if they hold fewer than k entries (a k-NN query returns k results)
+        order = np.argsort(-centroid_scores)
+        covered = np.cumsum(self.list_sizes[order])
+        lists = order[:max(nprobe, int(np.searchsorted(covered, k)) + 1)]
+        slices = [slice(self.offsets[i], self.offsets[i + 1]) for i in lists]
+        ids = np.concatenate([self.ids[s] for s in slices])
+        codes = np.concatenate([self.codes[s] for s in slices])
+
+        # q . x = q . centroid + q . residual, the second term from the compressed codes
+        base = np.repeat(centroid_scores[lists], self.list_sizes[lists])
+        if self.quantizer == "int8":
+            residual_scores = codes.astype(np.float32) @ (query * self.scale)
+        else:
+            # Table lookups: entry j of a code selects table[j, code] from the flattened table
+            pq_m, n_centroids = table.shape
+            residual_scores = table.ravel()[codes + np.arange(0, pq_m * n_centroids, n_centroids)].sum(axis=1)
+        approximate = base + residual_scores
+
+        if not rerank:
+            best = top_k_indices(approximate, k)
+            return ids[best], approximate[best]
+
+        # Exact re-rank of the best candidates, read from the memory-mapped store in row order
+        candidates = np.sort(ids[top_k_indices(approximate, max(rerank, k))])
+        vectors = np.asarray(self.store.vectors[candidates], dtype=np.float32)
+        if not self.store.normalized:
+            normalize_rows(vectors)
+        similarities = vectors @ query
+        best = top_k_indices(similarities, k)
+        return candidates[best], similarities[best]
+
+    def search_ids(self, query_vectors, k: int = 5, nprobe: int = None, rerank: int = None) -> list:
+        """Returns (store rows, cosine similarities) per query vector, best first."""
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        if queries.shape[1] != self.dimension:
+            raise ValueError(f"Query dimension {queries.shape[1]} does not match index dimension {self.dimension}.")
+        queries = normalize_rows(queries.copy())
+        nprobe = min(self.nprobe if nprobe is None else nprobe, self.nlist)
+        rerank = self.rerank if rerank is None else rerank
+        centroid_scores = queries @ self.centroids.T
+        tables = [None] * len(queries)
+        if self.quantizer == "pq":
+            # Every query's (pq_m, 256) table of sub-vector . codebook entry, from one batched product
+            pq_m, _, sub_dimension = self.codebooks.shape
+            sub_queries = queries.reshape(len(queries), pq_m, sub_dimension).transpose(1, 2, 0)
+            tables = np.matmul(self.codebooks, sub_queries).transpose(2, 0, 1)
+        return [self._search_one(queries[i], centroid_scores[i], tables[i], k, nprobe, rerank)
+                for i in range(len(queries))]
+
+    def _rows_for(self, rows, similarities) -> list:
+        results = self.store.metadata.take(rows).select(list(RESULT_FIELDS)).to_pylist()
+        for row, similarity in zip(results, similarities):
+            row["@search.score"] = float(cosine_to_search_score(similarity))
+        return results
+
+    def search_batch(self, query_vectors, k: int = 5, nprobe: int = None, rerank: int = None) -> list:
+        """Returns the top-k result rows for each query vector, in the same shape as LocalVectorIndex."""
+        return [self._rows_for(rows, similarities)
+                for rows, similarities in self.search_ids(query_vectors, k, nprobe, rerank)]
+
+    def search(self, query_vector, k: int = 5, nprobe: int = None, rerank: int = None) -> list:
+        """Returns the top-k result rows for a single query vector."""
+        return self.search_batch([query_vector], k, nprobe, rerank)[0]
+
+
+def exact_top_k(store: EmbeddingStore, queries: np.ndarray, k: int) -> np.ndarray:
+    """Exact top-k store rows per (normalized) query, scanning the store in chunks."""
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, store.count, CHUNK_ROWS):
+        chunk = np.array(store.vectors[start:start + CHUNK_ROWS], dtype=np.float32) # A copy: float32 slices of the memmap are read-only views
+        if not store.normalized:
+            normalize_rows(chunk)
+        scores = np.hstack([best_scores, queries @ chunk.T])
+        rows = np.hstack([best_rows, np.broadcast_to(np.arange(start, start + len(chunk)), (len(queries), len(chunk)))])
+        keep = top_k_indices(scores, k)
+        best_rows, best_scores = np.take_along_axis(rows, keep, axis=1), np.take_along_axis(scores, keep, axis=1)
+    return best_rows
+
+
+def sample_queries(store: EmbeddingStore, count: int, noise: float, seed: int = 0) -> np.ndarray:
+    """Stored vectors with Gaussian noise added, so queries aren't trivially their own nearest neighbour."""
+    rng = np.random.default_rng(seed)
+    queries = np.asarray(store.vectors[np.sort(rng.integers(0, store.count, size=count))], dtype=np.float32)
+    normalize_rows(queries)
+    queries += rng.standard_normal(queries.shape).astype(np.float32) * (noise / np.sqrt(store.dimension))
+    return normalize_rows(queries)
+
+
+def measure_recall(index: IVFQuantizedIndex, queries: np.ndarray, k: int, nprobes, rerank: int) -> list:
+    """recall@k against exact search on the same store, plus latency, for each nprobe."""
+    start = time.time()
+    truth = exact_top_k(index.store, queries, k)
+    exact_ms = (time.time() - start) / len(queries) * 1000
+    report = []
+    for nprobe in nprobes:
+        start = time.time()
+        found = index.search_ids(queries, k, nprobe=nprobe, rerank=rerank)
+        elapsed_ms = (time.time() - start) / len(queries) * 1000
+        hits = sum(len(np.intersect1d(rows, expected)) for (rows, _), expected in zip(found, truth))
+        report.append({"nprobe": nprobe, "recall": hits / truth.size, "ms_per_query": elapsed_ms,
+                       "exact_ms_per_query": exact_ms})
+    return report
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build compressed IVF indexes and measure their recall against exact search.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build an index from JSONL backups or an embedding store.")
+    build_parser.add_argument("inputs", nargs="+", help="Processed JSONL file(s) or one .embstore directory.")
+    build_parser.add_argument("--out", required=True, help="Output index file (.npz).")
+    build_parser.add_argument("--store", help="Store to create from JSONL inputs (default: next to --out, ending in .embstore).")
+    build_parser.add_argument("--quantizer", choices=QUANTIZERS, default=DEFAULT_QUANTIZER, help="Residual encoding.")
+    build_parser.add_argument("--nlist", type=int, default=None, help="Coarse lists (default: 4 * sqrt(N)).")
+    build_parser.add_argument("--pq-m", type=int, default=None, help="PQ sub-vectors, i.e. bytes per vector (default: dimension / 4).")
+    build_parser.add_argument("--train-size", type=int, default=DEFAULT_TRAIN_SIZE, help="Vectors sampled for training.")
+    recall_parser = subparsers.add_parser("recall", help="Compare an index with exact search on the same store.")
+    recall_parser.add_argument("index", help="Index file (.npz).")
+    recall_parser.add_argument("--queries", type=int, default=500, help="Number of sampled queries.")
+    recall_parser.add_argument("--noise", type=float, default=0.5, help="Norm of the noise added to sampled query vectors.")
+    recall_parser.add_argument("-k", type=int, default=10, help="Results per query.")
+    recall_parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64], help="nprobe values to try.")
+    recall_parser.add_argument("--rerank", type=int, default=DEFAULT_RERANK, help="Candidates re-ranked exactly (0 = none).")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.time()
+        if len(args.inputs) == 1 and is_embedding_store(args.inputs[0]):
+            store_path = args.inputs[0]
+        else:
+            store_path = args.store or os.path.splitext(args.out)[0] + ".embstore"
+            written = convert_jsonl_to_store(args.inputs, store_path, normalize=True)
+            print(f"Converted {written} rows to {store_path} in {time.time() - start:.2f} seconds.")
+        store = EmbeddingStore(store_path)
+        index = IVFQuantizedIndex.build(store, nlist=args.nlist, quantizer=args.quantizer, pq_m=args.pq_m,
+                                        train_size=args.train_size)
+        index.save(args.out)
+        sizes = index.memory_bytes()
+        print(f"Built {args.quantizer} index over {index.count} vectors (dim {index.dimension}, {index.nlist} lists) "
+              f"in {time.time() - start:.2f} seconds.")
+        print(f"In-memory size: {sizes['total'] / 1e6:.1f} MB vs {sizes['float32'] / 1e6:.1f} MB float32 "
+              f"({sizes['float32'] / sizes['total']:.1f}x smaller).")
+    else:
+        index = IVFQuantizedIndex.load(args.index)
+        sizes = index.memory_bytes()
+        print(f"{index.quantizer} index: {index.count} vectors (dim {index.dimension}), {index.nlist} lists, "
+              f"{sizes['total'] / 1e6:.1f} MB in memory ({sizes['float32'] / sizes['total']:.1f}x smaller than float32).")
+        queries = sample_queries(index.store, args.queries, args.noise)
+        for result in measure_recall(index, queries, args.k, args.nprobe, args.rerank):
+            print(f"nprobe={result['nprobe']:>4}  recall@{args.k}={result['recall']:.3f}  "
+                  f"{result['ms_per_query']:.3f} ms/query (exact: {result['exact_ms_per_query']:.3f} ms/query)")
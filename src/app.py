@@ -1,21 +1,38 @@
 import streamlit as st
 import requests
-import json
+import contextvars
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.models import (
-    VectorizedQuery,
-    QueryType,
-    QueryCaptionType,
-    QueryAnswerType,
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from embedding_cache import EmbeddingCache
+from health_monitor import DEFAULT_KEEP_ALIVE, STATE_CHECKING, STATE_DOWN, STATE_OK, HealthMonitor
+from result_cache import SearchResultCache, files_fingerprint, local_index_name
+from search_service import (
+    SEARCH_MODES,
+    VECTOR_MODES,
+    MODE_KEYWORD,
+    MODE_VECTOR,
+    MODE_HYBRID,
+    MODE_SEMANTIC,
+    SearchResults,
+    get_ollama_session,
+    get_search_client,
+    run_search,
 )
+from tracing import breakdown, get_tracer, summarize_payload
 
 # --- Configuration Loading ---
-try:
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    """Reads .env once per process; later reruns see its values in os.environ already."""
     load_dotenv()
+    return True
+
+try:
+    load_environment()
 except Exception as e:
     # Keep this print for critical load error, but log it properly in production
     print(f"Error loading .env file: {e}")
@@ -23,212 +40,221 @@ except Exception as e:
     st.stop()
 
 
+# Tracing: spans feed in-memory latency histograms; TRACE_FILE / TRACE_METRICS_PORT export them (see src/tracing.py)
+tracer = get_tracer()
+
 # Azure AI Search Config (ensure these are set in your .env or environment)
 AZURE_SEARCH_ENDPOINT = os.environ.get("AZURE_SEARCH_SERVICE_ENDPOINT")
 AZURE_SEARCH_KEY = os.environ.get("AZURE_SEARCH_API_KEY")
 AZURE_SEARCH_INDEX = os.environ.get("AZURE_SEARCH_INDEX_NAME")
+AZURE_SEMANTIC_CONFIGURATION_NAME = os.environ.get("AZURE_SEMANTIC_CONFIGURATION_NAME")
 
 # Ollama Config
 OLLAMA_ENDPOINT = os.getenv("OLLAMA_ENDPOINT", "http://localhost:11434/api/embed")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "nomic-embed-text")
 VECTOR_DIMENSION = os.getenv("VECTOR_DIMENSION") # Load as string first
-
-# --- Helper Functions --- (Keep functions as they are)
-# @st.cache_data(show_spinner=False) # Keep disabled if testing, re-enable later if needed
-def get_ollama_embedding(text: str, model: str, endpoint: str, expected_dimension: int):
-    """Calls the local Ollama API (/api/embed) to get a single embedding.""" # Docstring updated
+MATRYOSHKA_DIMENSION = None # Optional reduced dimension (MATRYOSHKA_DIMENSION), validated below
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE) # Keeps the model loaded between queries
+
+# Search Backend Config ("azure" or "local"; local serves queries in-process from the processed embeddings)
+BACKEND_AZURE = "Azure AI Search"
+BACKEND_LOCAL = "Local (in-process)"
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "azure").lower()
+LOCAL_EMBEDDINGS_PATH = os.getenv("LOCAL_EMBEDDINGS_PATH") # JSONL glob or an .embstore directory; default filled in when the local backend is selected
+LOCAL_TEXT_INDEX_PATH = os.getenv("LOCAL_TEXT_INDEX_PATH") # Optional saved BM25 index (.npz); built and saved on first use
+LOCAL_ANN_INDEX_PATH = os.getenv("LOCAL_ANN_INDEX_PATH") # Optional compressed IVF index (.npz) for local vector queries
+LOCAL_ANN_NPROBE = os.getenv("LOCAL_ANN_NPROBE") # Clusters the compressed index scans per query; default filled in likewise
+LOCAL_SUPPORTED_MODES = (MODE_KEYWORD, MODE_VECTOR, MODE_HYBRID)
+
+# --- Query Embedding Cache ---
+@st.cache_resource
+def get_embedding_cache():
+    """One cache per process; its on-disk tier is shared with other workers and survives restarts."""
+    return EmbeddingCache.from_env()
+
+# --- Search Result Cache ---
+@st.cache_resource
+def get_result_cache():
+    """Materialized results shared by every session (and, via its SQLite tier, every worker)."""
+    return SearchResultCache.from_env()
+
+# --- Local Search Backend ---
+@st.cache_resource(show_spinner="Loading local embeddings...")
+def load_local_vector_index(path: str, dimension: int, native_dimension: int = None):
+    """Loads the processed embedding files into an in-memory matrix once per process.
+
+    Full-size (`native_dimension`) backups are truncated to `dimension` if MATRYOSHKA_DIMENSION is set.
+    """
+    from matryoshka import load_vector_index # Local-backend modules pull in numpy and pyarrow, so they're imported on first use
+    return load_vector_index(path, dimension, native_dimension)
+
+@st.cache_resource(show_spinner="Loading compressed vector index...")
+def load_local_ann_index(index_path: str, dimension: int, nprobe: int):
+    """Loads the IVF index; full-precision vectors stay on disk and are only read for re-ranking."""
+    from ann_index import IVFQuantizedIndex
+    index = IVFQuantizedIndex.load(index_path, nprobe=nprobe)
+    if dimension and index.dimension != dimension:
+        raise ValueError(f"Index '{index_path}' has dimension {index.dimension}, expected {dimension}.")
+    return index
+
+def get_local_vector_index():
+    """The compressed ANN index if LOCAL_ANN_INDEX_PATH is set, otherwise exact search over the embeddings."""
+    if LOCAL_ANN_INDEX_PATH:
+        return load_local_ann_index(LOCAL_ANN_INDEX_PATH, INDEX_DIMENSION, LOCAL_ANN_NPROBE)
+    return load_local_vector_index(LOCAL_EMBEDDINGS_PATH, INDEX_DIMENSION, VECTOR_DIMENSION)
+
+@st.cache_resource(show_spinner="Loading local keyword index...")
+def load_local_text_index(index_path: str, embeddings_path: str, dimension: int):
+    """Loads the saved BM25 index, or builds it from the same documents as the local vector index.
+
+    A saved index is only reused if it was built from the current embeddings files; otherwise
+    it's rebuilt and saved again.
+    """
+    from local_text_search import BM25Index
+    source = files_fingerprint(embeddings_path)
+    if index_path and os.path.exists(index_path):
+        text_index = BM25Index.load(index_path)
+        if text_index.source == source:
+            return text_index
+        print(f"Warning: {index_path} was built from different embeddings; rebuilding the keyword index.")
+    vector_index = load_local_vector_index(embeddings_path, dimension, VECTOR_DIMENSION)
+    documents = (
+        dict(zip(vector_index.metadata, values))
+        for values in zip(*vector_index.metadata.values())
+    )
+    text_index = BM25Index.build(documents)
+    text_index.source = source
+    if index_path:
+        text_index.save(index_path) # Next start-up loads instead of rebuilding
+    return text_index
+
+# --- Shared Worker Pool ---
+@st.cache_resource
+def get_search_executor():
+    """Process-wide pool used to overlap embedding generation with independent searches."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+def submit_with_script_ctx(executor, fn, *args):
+    """Submits fn to the pool with this script run's context attached, so st.* calls work in the worker.
+
+    The contextvars are copied too, so spans started in the worker join the caller's trace.
+    """
+    ctx = get_script_run_ctx()
+    context = contextvars.copy_context()
+    def run_in_ctx():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return context.run(fn, *args)
+    return executor.submit(run_in_ctx)
+
+# --- Helper Functions ---
+def get_ollama_embedding(text: str, model: str, endpoint: str, expected_dimension: int, output_dimension: int = None):
+    """Calls the local Ollama API (/api/embed) to get a single embedding.
+
+    With `output_dimension`, the vector is Matryoshka-truncated the same way ingestion truncates documents.
+    """
     if not text or not text.strip():
         return None
 
-    # --- Print params *inside function* before request (Optional Debugging) ---
-    print(f"\n--- Inside get_ollama_embedding (Using /api/embed logic) ---")
-    print(f"Received text: '{text}'")
-    print(f"Using model: '{model}'")
-    print(f"Targeting endpoint: '{endpoint}'") # Should now be the /api/embed endpoint
-    # ---
-
-    try:
-        # --- MODIFIED PAYLOAD for /api/embed ---
-        # Send the single text within a list for the "input" key
-        payload = {"model": model, "input": [text]}
-        print(f"DEBUG: Sending Payload to /api/embed: {json.dumps(payload)}")
-        # ---
-
-        response = requests.post(
-            endpoint, # Ensure this points to /api/embed
-            json=payload,
-            timeout=60
-        )
-
-        # --- Log response details (Optional Debugging) ---
-        print(f"DEBUG: Response Status Code: {response.status_code}")
-        print(f"DEBUG: Response Headers: {response.headers}")
-        print(f"DEBUG: Response Raw Text: {response.text}")
-        # ---
+    with tracer.span("ollama.embed", model=model) as span:
+        # Serve repeated/near-identical queries from the cache and skip the Ollama round trip entirely.
+        # The cache keys on the normalized text; Ollama still embeds the query as typed.
+        embedding_cache = get_embedding_cache()
+        text = text.strip()
+        cached_embedding = embedding_cache.get(model, text, output_dimension or expected_dimension)
+        span.set("cache_hit", cached_embedding is not None)
+        if cached_embedding is not None:
+            return cached_embedding
+
+        payload = {"model": model, "input": [text]} # /api/embed takes a list of inputs
+        if OLLAMA_KEEP_ALIVE:
+            payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+        tracer.log_payload("request", payload) # Sampled and size-capped (TRACE_PAYLOAD_*)
+        try:
+            response = get_ollama_session().post(endpoint, json=payload, timeout=60)
+            span.set("http_status", response.status_code)
+            response.raise_for_status()
+        except requests.exceptions.Timeout:
+            span.set_error("timeout")
+            st.error(f"Error: Ollama API request timed out ({endpoint}). Is Ollama running?")
+            return None
+        except requests.exceptions.ConnectionError:
+            span.set_error("connection error")
+            st.error(f"Error: Could not connect to Ollama API at {endpoint}. Is Ollama running?")
+            return None
+        except requests.exceptions.RequestException as e:
+            span.set_error(e)
+            st.error(f"Error calling Ollama API: {e}")
+            return None
 
-        response.raise_for_status()
-        response_json = response.json()
-        print(f"DEBUG: Parsed Response JSON from /api/embed: {response_json}")
+        try:
+            response_json = response.json()
+        except ValueError:
+            span.set_error("invalid JSON")
+            st.error(f"Error: Could not decode JSON response from Ollama API. Response Text: {summarize_payload(response.text)}")
+            return None
+        tracer.log_payload("response", response_json)
 
-        embedding = None
-        # --- PARSING LOGIC for /api/embed response ---
         # Expects {"embeddings": [ [vector] ]} for a single input
-        if "embeddings" in response_json and isinstance(response_json["embeddings"], list):
-            embeddings_list = response_json["embeddings"]
-            if len(embeddings_list) == 1 and isinstance(embeddings_list[0], list):
-                 # Successfully got the embedding list for our single input
-                 embedding = embeddings_list[0]
-                 print(f"DEBUG: Extracted embedding vector (Dim: {len(embedding)})") # Log success
-            elif len(embeddings_list) == 0:
-                 st.error(f"Ollama (/api/embed) returned an empty list within 'embeddings'. Response: {response_json}")
-                 print(f"ERROR: Ollama (/api/embed) returned empty list within 'embeddings'. Response: {response_json}")
-                 return None
-            else:
-                # Should not happen for single input, but handle defensively
-                st.error(f"Ollama (/api/embed) returned unexpected number of embeddings ({len(embeddings_list)}) for single input. Response: {response_json}")
-                print(f"ERROR: Ollama (/api/embed) returned unexpected embedding count. Response: {response_json}")
-                return None
-        else:
-             st.error(f"Error: 'embeddings' key missing or invalid in Ollama response from /api/embed. Response: {response_json}")
-             print(f"ERROR: 'embeddings' key missing/invalid from /api/embed. Response: {response_json}")
-             return None
-        # --- END PARSING LOGIC ---
-
-
-        # Validate the found embedding dimension (Keep this check)
-        if embedding:
-            if expected_dimension and len(embedding) != expected_dimension:
-                st.error(f"Ollama returned embedding with dimension {len(embedding)}, expected {expected_dimension}. Check OLLAMA_MODEL/VECTOR_DIMENSION.")
-                print(f"ERROR: Dimension mismatch. Got {len(embedding)}, expected {expected_dimension}.")
-                return None
-            return embedding # Return the valid embedding
-
-    # --- Keep your existing exception handling ---
-    except requests.exceptions.Timeout as e:
-         st.error(f"Error: Ollama API request timed out ({endpoint}). Is Ollama running?")
-         print(f"ERROR: Ollama Timeout - {e}")
-    except requests.exceptions.ConnectionError as e:
-         st.error(f"Error: Could not connect to Ollama API at {endpoint}. Is Ollama running?")
-         print(f"ERROR: Ollama ConnectionError - {e}")
-    except requests.exceptions.RequestException as e:
-         st.error(f"Error calling Ollama API: {e}")
-         print(f"ERROR: Ollama RequestException - {e}")
-    except json.JSONDecodeError as e:
-         raw_text = "Could not get raw text"
-         if 'response' in locals() and hasattr(response, 'text'):
-              raw_text = response.text
-         st.error(f"Error: Could not decode JSON response from Ollama API. Response Text: {raw_text}")
-         print(f"ERROR: Ollama JSONDecodeError - {e} - Raw Text: {raw_text}")
-    return None # Ensure return None on exceptions
-    """Calls the local Ollama API to get a single embedding.
-       Handles both 'embedding' and 'embeddings' keys in response.
-    """
-    if not text or not text.strip():
-        return None
-    try:
-        
-        response = requests.post(
-            endpoint,
-            json={"model": model, "prompt": text},
-            timeout=60
-        )
-        response.raise_for_status()
-        response_json = response.json()
-
-        embedding = None
-        # Check for plural 'embeddings' first (seems to be what was returned)
-        if "embeddings" in response_json and isinstance(response_json["embeddings"], list):
-            if len(response_json["embeddings"]) == 1 and isinstance(response_json["embeddings"][0], list):
-                 embedding = response_json["embeddings"][0] # Take the first embedding if list not empty
-            elif len(response_json["embeddings"]) == 0:
-                 st.error(f"Ollama returned an empty list for 'embeddings'. Response: {response_json}")
-                 return None # Explicitly handle empty list case
-
-        # Fallback check for singular 'embedding'
-        elif "embedding" in response_json and isinstance(response_json["embedding"], list):
-            if len(response_json["embedding"]) > 0:
-                 embedding = response_json["embedding"]
-            else:
-                 st.error(f"Ollama returned an empty list for 'embedding'. Response: {response_json}")
-                 return None # Explicitly handle empty list case
-
-        # Validate the found embedding
-        if embedding:
-            # Validate dimension
-            if expected_dimension and len(embedding) != expected_dimension:
-                st.error(f"Ollama returned embedding with dimension {len(embedding)}, expected {expected_dimension}. Check your OLLAMA_MODEL and VECTOR_DIMENSION settings.")
-                return None
-            return embedding # Return the valid embedding
-        else:
-            # If neither key was found or list was empty (and not handled above)
-            st.error(f"Error: Valid embedding key ('embedding' or 'embeddings') missing or invalid in Ollama response. Response: {response_json}")
+        embeddings = response_json.get("embeddings") if isinstance(response_json, dict) else None
+        if not isinstance(embeddings, list) or len(embeddings) != 1 or not isinstance(embeddings[0], list):
+            span.set_error("unexpected response")
+            st.error(f"Error: Ollama (/api/embed) did not return exactly one embedding. Response: {summarize_payload(response_json)}")
             return None
+        embedding = embeddings[0]
+        if expected_dimension and len(embedding) != expected_dimension:
+            span.set_error(f"dimension {len(embedding)} != {expected_dimension}")
+            st.error(f"Ollama returned embedding with dimension {len(embedding)}, expected {expected_dimension}. Check OLLAMA_MODEL/VECTOR_DIMENSION.")
+            return None
+        if output_dimension:
+            from matryoshka import truncate_embedding # Only needed (with numpy) when truncating
+            embedding = truncate_embedding(embedding, output_dimension)
+        return embedding_cache.put(model, text, output_dimension or expected_dimension, embedding) # Cache and return the valid embedding
 
-    except requests.exceptions.Timeout:
-        st.error(f"Error: Ollama API request timed out ({endpoint}). Is Ollama running and responding?")
-    except requests.exceptions.ConnectionError:
-        st.error(f"Error: Could not connect to Ollama API at {endpoint}. Is Ollama running?")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error calling Ollama API: {e}")
-    except json.JSONDecodeError:
-        st.error(f"Error: Could not decode JSON response from Ollama API. Response Text: {response.text}")
-    return None # Ensure return None on exceptions
 def display_results(results):
     """Displays search results nicely in Streamlit."""
-    try:
-        count = results.get_count()
-        st.subheader(f"Found {count} results:") # Use get_count() for total matching docs
-    except Exception as e:
-        st.error(f"Error getting result count: {e}")
-        st.subheader("Results:") # Fallback
-        return # Stop if we can't even get the count
-
-    if count == 0:
-         st.write("No results found.")
-         return
-
-    for i, result in enumerate(results):
-        score = result.get('@search.score', 'N/A') # Standard relevance score
-        reranker_score = result.get('@search.reranker_score', 'N/A') # Semantic reranker score
-        caption_text = "N/A"
-        caption_highlights = "N/A"
-
-        # Extract semantic captions if available
-        if "@search.captions" in result and result["@search.captions"]:
-            caption = result["@search.captions"][0]
-            caption_text = caption.text
-            caption_highlights = caption.highlights if caption.highlights else caption_text # Fallback
-
-        with st.expander(f"**{i+1}. {result.get('title', 'No Title')}** (Score: {score:.4f}, Reranker Score: {reranker_score})"):
-            st.markdown(f"**Movie ID:** `{result.get('movie_id', 'N/A')}`")
-            st.markdown(f"**Overview:** {result.get('overview', 'N/A')}")
-            st.markdown(f"**Tagline:** *{result.get('tagline', 'N/A')}*")
-            st.markdown(f"**Genres:** {result.get('genres', 'N/A')}")
-
-            # Display semantic caption if present
-            if caption_text != "N/A":
-                st.markdown("---")
-                st.markdown(f"**Semantic Caption:**")
-                st.markdown(caption_highlights, unsafe_allow_html=True) # Use highlights if available
-
-# --- Basic Ollama Check ---
-@st.cache_data(ttl=60) # Cache the check result for 60 seconds
-def check_ollama(endpoint):
-    """Checks if the base Ollama endpoint is reachable."""
-    try:
-        # Use a simpler endpoint like '/' or '/api/tags' for a basic check
-        check_url = endpoint
-        if "/api/embeddings" in endpoint: # Try to get the base URL
-            check_url = endpoint.split("/api/embeddings")[0] + "/"
-        elif "/api/embed" in endpoint: # Handle older possibility
-             check_url = endpoint.split("/api/embed")[0] + "/"
-
-        response = requests.get(check_url, timeout=5) # Check base endpoint
-        response.raise_for_status()
-        return True # Ollama is reachable
-    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.RequestException):
-        # Don't show error directly here, let the caller handle UI feedback
-        return False # Ollama is not reachable
+    with tracer.span("ui.render") as span:
+        try:
+            count = results.get_count()
+            st.subheader(f"Found {count} results:") # Use get_count() for total matching docs
+            span.set("results", count)
+        except Exception as e:
+            st.error(f"Error getting result count: {e}")
+            st.subheader("Results:") # Fallback
+            return # Stop if we can't even get the count
+
+        if count == 0:
+             st.write("No results found.")
+             return
+
+        for i, result in enumerate(results):
+            score = result.get('@search.score', 'N/A') # Standard relevance score
+            reranker_score = result.get('@search.reranker_score', 'N/A') # Semantic reranker score
+            caption_text = "N/A"
+            caption_highlights = "N/A"
+
+            # Extract semantic captions if available
+            if "@search.captions" in result and result["@search.captions"]:
+                caption = result["@search.captions"][0] # Stored as a plain dict (see result_cache.to_plain_row)
+                caption_text = caption.get("text") or "N/A"
+                caption_highlights = caption.get("highlights") or caption_text # Fallback
+
+            with st.expander(f"**{i+1}. {result.get('title', 'No Title')}** (Score: {score:.4f}, Reranker Score: {reranker_score})"):
+                st.markdown(f"**Movie ID:** `{result.get('movie_id', 'N/A')}`")
+                st.markdown(f"**Overview:** {result.get('overview', 'N/A')}")
+                st.markdown(f"**Tagline:** *{result.get('tagline', 'N/A')}*")
+                st.markdown(f"**Genres:** {result.get('genres', 'N/A')}")
+
+                # Display semantic caption if present
+                if caption_text != "N/A":
+                    st.markdown("---")
+                    st.markdown(f"**Semantic Caption:**")
+                    st.markdown(caption_highlights, unsafe_allow_html=True) # Use highlights if available
+
+# --- Background Health Checks & Pre-warm ---
+@st.cache_resource(show_spinner=False)
+def get_health_monitor(ollama_endpoint, ollama_model, azure_settings):
+    """Starts the process-wide monitor; its first pass loads the Ollama model and opens the Azure connection."""
+    return HealthMonitor.from_env(ollama_endpoint, ollama_model, azure_settings).start()
 
 
 # --- Streamlit App UI ---
@@ -238,50 +264,123 @@ st.title("🎬 Movie Search Demo (Azure AI Search + Ollama)")
 
 
 # --- Validate Configuration Early ---
-config_errors = []
-if not AZURE_SEARCH_ENDPOINT: config_errors.append("AZURE_SEARCH_SERVICE_ENDPOINT is not set.")
-if not AZURE_SEARCH_KEY: config_errors.append("AZURE_SEARCH_API_KEY is not set.")
-if not AZURE_SEARCH_INDEX: config_errors.append("AZURE_SEARCH_INDEX_NAME is not set.")
-if not OLLAMA_ENDPOINT: config_errors.append("OLLAMA_ENDPOINT is not set.")
-if not OLLAMA_MODEL: config_errors.append("OLLAMA_MODEL is not set.")
-if not VECTOR_DIMENSION:
-    config_errors.append("VECTOR_DIMENSION is not set.")
-else:
-    try:
-        VECTOR_DIMENSION = int(VECTOR_DIMENSION) # Convert to int now
-    except ValueError:
-        config_errors.append(f"VECTOR_DIMENSION ('{VECTOR_DIMENSION}') is not a valid integer.")
+with tracer.span("app.validate_config") as config_span:
+    config_errors = []
+    azure_config_errors = []
+    if not AZURE_SEARCH_ENDPOINT: azure_config_errors.append("AZURE_SEARCH_SERVICE_ENDPOINT is not set.")
+    if not AZURE_SEARCH_KEY: azure_config_errors.append("AZURE_SEARCH_API_KEY is not set.")
+    if not AZURE_SEARCH_INDEX: azure_config_errors.append("AZURE_SEARCH_INDEX_NAME is not set.")
+    if SEARCH_BACKEND not in ("azure", "local"):
+        config_errors.append(f"SEARCH_BACKEND ('{SEARCH_BACKEND}') must be 'azure' or 'local'.")
+    elif SEARCH_BACKEND == "azure":
+        config_errors.extend(azure_config_errors) # Azure settings are only mandatory for the Azure backend
+    if not OLLAMA_ENDPOINT: config_errors.append("OLLAMA_ENDPOINT is not set.")
+    if not OLLAMA_MODEL: config_errors.append("OLLAMA_MODEL is not set.")
+    if not VECTOR_DIMENSION:
+        config_errors.append("VECTOR_DIMENSION is not set.")
+    else:
+        try:
+            VECTOR_DIMENSION = int(VECTOR_DIMENSION) # Convert to int now
+        except ValueError:
+            config_errors.append(f"VECTOR_DIMENSION ('{VECTOR_DIMENSION}') is not a valid integer.")
+    if os.getenv("MATRYOSHKA_DIMENSION"):
+        from matryoshka import matryoshka_dimension # Only imported (with numpy) when truncation is configured
+        try:
+            MATRYOSHKA_DIMENSION = matryoshka_dimension(VECTOR_DIMENSION if isinstance(VECTOR_DIMENSION, int) else None)
+        except ValueError as e:
+            config_errors.append(str(e))
+    config_span.set("errors", len(config_errors))
 
 # Display config errors prominently if any
 if config_errors:
     st.error("Configuration Errors Found:\n- " + "\n- ".join(config_errors))
     st.stop() # Stop execution if essential config is missing/invalid
+
+# Started on the first run after a deploy, so warm-up overlaps with the user typing a query
+health_monitor = get_health_monitor(
+    OLLAMA_ENDPOINT,
+    OLLAMA_MODEL,
+    None if azure_config_errors else (AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_INDEX, AZURE_SEARCH_KEY),
+)
+
+# Dimension of indexed and query vectors: the model's own, or the Matryoshka-reduced one
+INDEX_DIMENSION = MATRYOSHKA_DIMENSION or VECTOR_DIMENSION
+if MATRYOSHKA_DIMENSION:
+    st.caption(f"Vectors truncated to {MATRYOSHKA_DIMENSION} of {VECTOR_DIMENSION} dimensions (MATRYOSHKA_DIMENSION).")
+
+if azure_config_errors:
+    st.caption(f"Using local embeddings: `{LOCAL_EMBEDDINGS_PATH}` | Ollama Model: `{OLLAMA_MODEL}`")
+    if LOCAL_ANN_INDEX_PATH:
+        st.caption(f"Vector queries use the compressed index `{LOCAL_ANN_INDEX_PATH}` (nprobe={LOCAL_ANN_NPROBE}).")
 else:
     st.caption(f"Using Azure AI Search Index: `{AZURE_SEARCH_INDEX}` | Ollama Model: `{OLLAMA_MODEL}`")
 
+# The Azure backend is offered whenever it's configured; the local one always is
+available_backends = [BACKEND_LOCAL] if azure_config_errors else [BACKEND_AZURE, BACKEND_LOCAL]
+
 # --- Sidebar for Configuration and Controls ---
 with st.sidebar:
     st.header("Configuration Status")
     # Simplified Status: Show general config load status
     st.success("Azure & Ollama Config Loaded")
 
-    # Perform Ollama check and show status
-    ollama_ok = check_ollama(OLLAMA_ENDPOINT)
-    if ollama_ok:
-         st.success("Ollama service reachable.")
+    # Latest background check results; reading them never blocks on the network
+    health = health_monitor.status()
+    ollama_health = health["ollama"]
+    ollama_ok = ollama_health["state"] != STATE_DOWN # Queries still try while the first check (model load) runs
+    if ollama_health["state"] == STATE_OK:
+         st.success(f"Ollama service reachable ({ollama_health['latency_ms']:.0f} ms{', ' + ollama_health['detail'] if ollama_health['detail'] else ''}).")
+    elif ollama_health["state"] == STATE_CHECKING:
+         st.info("Checking Ollama service and loading the model...")
     else:
          st.error("Ollama service NOT reachable. Check terminal & ensure Ollama is running.")
          # Optional: You could stop the app if Ollama is essential for all operations
          # st.stop()
+    azure_health = health.get("azure")
+    if azure_health and azure_health["state"] == STATE_OK:
+         st.success(f"Azure AI Search reachable ({azure_health['latency_ms']:.0f} ms, {azure_health['detail']}).")
+    elif azure_health and azure_health["state"] == STATE_CHECKING:
+         st.info("Connecting to Azure AI Search...")
+    elif azure_health:
+         st.error(f"Azure AI Search NOT reachable: {azure_health['detail']}")
+
+    cache_stats = get_embedding_cache().stats()
+    st.caption(
+        f"Embedding cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits "
+        f"({cache_stats['memory_hits']} memory / {cache_stats['disk_hits']} disk), "
+        f"{cache_stats['misses']} misses"
+    )
+    result_stats = get_result_cache().stats()
+    st.caption(
+        f"Result cache: {result_stats['memory_hits'] + result_stats['disk_hits']} hits, "
+        f"{result_stats['misses']} misses, {result_stats['invalidations']} invalidations"
+    )
 
     # Keep Search Settings section as is
     st.header("Search Settings")
+    search_backend = st.selectbox(
+        "Search Backend:",
+        available_backends,
+        index=available_backends.index(BACKEND_LOCAL) if SEARCH_BACKEND == "local" else 0,
+        key="search_backend_select",
+        help="Local runs exact vector search in-process over the processed embedding files (no network hop)."
+    )
+    if search_backend == BACKEND_LOCAL: # Azure-only sessions never import the local-backend modules
+        from ann_index import DEFAULT_NPROBE
+        from local_vector_search import DEFAULT_EMBEDDINGS_GLOB
+        LOCAL_EMBEDDINGS_PATH = LOCAL_EMBEDDINGS_PATH or DEFAULT_EMBEDDINGS_GLOB
+        LOCAL_ANN_NPROBE = int(LOCAL_ANN_NPROBE or DEFAULT_NPROBE)
     search_mode = st.selectbox(
         "Select Search Mode:",
-        ("Keyword", "Vector", "Hybrid", "Semantic (Keyword + Semantic Reranking)"),
+        SEARCH_MODES,
         key="search_mode_select" # Add a key for stability
     )
     top_k = st.slider("Number of results (k):", min_value=1, max_value=20, value=5, key="top_k_slider")
+    compare_modes = st.checkbox(
+        "Compare all modes side-by-side",
+        key="compare_modes_checkbox",
+        help="Runs all four modes concurrently. Keyword and Semantic start while the query embedding is still being generated."
+    )
 
     st.markdown("---")
     st.markdown(
@@ -291,6 +390,8 @@ with st.sidebar:
         - **Vector:** Semantic similarity search using embeddings. Finds conceptually related items.
         - **Hybrid:** Combines Keyword and Vector results (RRF). Good for balancing relevance and recall.
         - **Semantic:** Uses Keyword search first, then applies a Microsoft deep learning model to re-rank results and optionally extract captions/answers. *Requires Semantic Search enabled on your Azure Search index.*
+
+        **Local backend** supports Keyword (BM25), Vector and Hybrid (RRF); Semantic reranking needs Azure.
         """
     )
 
@@ -300,120 +401,220 @@ query = st.text_input("Enter your movie search query:", placeholder="e.g., futur
 search_button = st.button("Search Movies", key="search_button")
 
 # --- Perform Search on Button Click ---
-if search_button and query:
-    st.write(f"Performing **{search_mode}** search for: *'{query}'*")
-    start_time = time.time()
+def run_local_keyword_leg(k):
+    """Runs the local BM25 search, returning (rows, total matches)."""
+    with tracer.span("local.keyword", k=k):
+        text_index = load_local_text_index(LOCAL_TEXT_INDEX_PATH, LOCAL_EMBEDDINGS_PATH, INDEX_DIMENSION)
+        return text_index.search(query, k=k)
+
+def run_local_search(mode, vector_query, keyword_leg=None):
+    """Runs a search against the in-process backend and wraps the rows like Azure results.
 
-    # --- Initialize Azure Search Client ---
-    search_client = None # Initialize as None
+    For Hybrid, `keyword_leg` may be a future for a BM25 leg already started in the background.
+    """
+    from local_text_search import HYBRID_KEYWORD_CANDIDATES, hybrid_search
+    with tracer.span("local.search", mode=mode, top_k=top_k):
+        if mode == MODE_KEYWORD:
+            rows, total_count = run_local_keyword_leg(top_k)
+            return SearchResults(rows, total_count)
+
+        vector_rows = get_local_vector_index().search(vector_query, k=top_k)
+        if mode == MODE_VECTOR:
+            return SearchResults(vector_rows)
+
+        # Hybrid: fuse the two legs with RRF like Azure does
+        keyword_rows, _ = keyword_leg.result() if keyword_leg else run_local_keyword_leg(HYBRID_KEYWORD_CANDIDATES)
+        rows, total_count = hybrid_search(keyword_rows, vector_rows, k=top_k)
+        return SearchResults(rows, total_count)
+
+# --- Result Cache Helpers ---
+def result_cache_index_name():
+    """Identifies the searched index in result cache keys (and for version stamps bumped by ingestion)."""
+    if search_backend == BACKEND_AZURE:
+        return AZURE_SEARCH_INDEX
+    return local_index_name(LOCAL_EMBEDDINGS_PATH, LOCAL_ANN_INDEX_PATH, LOCAL_ANN_NPROBE)
+
+def result_cache_version(search_client):
+    """Current version of the searched index; None means the cache is bypassed."""
+    with tracer.span("cache.version"):
+        if search_backend == BACKEND_LOCAL:
+            return get_result_cache().index_version(
+                result_cache_index_name(),
+                lambda: files_fingerprint(LOCAL_EMBEDDINGS_PATH, LOCAL_ANN_INDEX_PATH, LOCAL_TEXT_INDEX_PATH),
+            )
+        # The document count changes with uploads/deletes; ingestion also bumps a stamp for in-place updates
+        return get_result_cache().index_version(result_cache_index_name(), search_client.get_document_count)
+
+def result_cache_settings():
+    """Search settings that change results without changing the index: (query vector dimension, semantic configuration)."""
+    return INDEX_DIMENSION, (AZURE_SEMANTIC_CONFIGURATION_NAME if search_backend == BACKEND_AZURE else None)
+
+def get_cached_results(mode, cache_version):
+    """Returns cached SearchResults for the current query, mode and k, or None."""
+    with tracer.span("cache.lookup", mode=mode) as span:
+        entry = get_result_cache().get(query, mode, top_k, OLLAMA_MODEL, result_cache_index_name(), cache_version,
+                                       *result_cache_settings())
+        span.set("hit", entry is not None)
+        return SearchResults(entry["rows"], entry["count"]) if entry else None
+
+def cache_results(mode, cache_version, results):
+    """Stores fresh results and returns them in the same plain-dict form a cache hit has."""
+    entry = get_result_cache().put(query, mode, top_k, OLLAMA_MODEL, result_cache_index_name(), cache_version,
+                                   results.rows, results.get_count(), *result_cache_settings())
+    return SearchResults(entry["rows"], entry["count"])
+
+def execute_search_mode(search_client, mode, vector_query, keyword_leg=None, cache_version=None):
+    """Runs a single mode, turning failures into UI messages. Returns SearchResults or None.
+
+    Successful results are added to the result cache under `cache_version`.
+    """
+    if search_backend == BACKEND_LOCAL and mode not in LOCAL_SUPPORTED_MODES:
+        st.warning(f"{mode} search is not available on the local backend.")
+        return None
+    if mode in VECTOR_MODES and not vector_query:
+        # Warning about skipping vector/hybrid search if embedding failed
+        if ollama_ok: # Only show if Ollama was ok but embedding failed
+            st.warning(f"Skipping {mode} search as query embedding failed.")
+        return None
+    if search_backend == BACKEND_LOCAL:
+        try:
+            return cache_results(mode, cache_version, run_local_search(mode, vector_query, keyword_leg))
+        except Exception as e:
+            st.error(f"An error occurred during local {mode} search: {e}")
+            return None
     try:
-        search_client = SearchClient(
-            endpoint=AZURE_SEARCH_ENDPOINT,
-            index_name=AZURE_SEARCH_INDEX,
-            credential=AzureKeyCredential(AZURE_SEARCH_KEY)
+        results = run_search(
+            search_client,
+            mode,
+            query,
+            query_vector=vector_query,
+            top_k=top_k,
+            semantic_configuration_name=AZURE_SEMANTIC_CONFIGURATION_NAME,
         )
+        if mode == MODE_SEMANTIC:
+            st.info("Note: Semantic search requires a Semantic Configuration to be enabled and set up on your Azure AI Search Index.")
+        return cache_results(mode, cache_version, results)
     except Exception as e:
-        st.error(f"Error creating Azure Search client: {e}")
-        st.stop() # Stop if client can't be created
-
-    results = None
-    vector_query = None
-
-    # --- Generate Query Embedding (if needed) ---
-    if "Vector" in search_mode or "Hybrid" in search_mode:
-        if not ollama_ok: # Check if Ollama was reachable earlier
-             st.error("Cannot perform Vector/Hybrid search because Ollama service is not reachable.")
+        if mode == MODE_SEMANTIC:
+            st.error(f"Semantic Search Error: {e}. Is Semantic Search enabled and configured on the index '{AZURE_SEARCH_INDEX}' with a 'default' configuration?")
         else:
-            with st.spinner(f"Generating query embedding using {OLLAMA_MODEL}..."):
-                vector_query = get_ollama_embedding(query, OLLAMA_MODEL, OLLAMA_ENDPOINT, VECTOR_DIMENSION)
-            if not vector_query:
-                # Error is already shown by get_ollama_embedding if it failed
-                st.warning("Failed to generate query embedding. Cannot perform Vector or Hybrid search.")
-            else:
-                st.success("Query embedding generated.")
-
-    # --- Execute Search Based on Mode ---
-    if search_client: # Proceed only if client was created
-        with st.spinner("Searching..."):
-            try:
-                if search_mode == "Keyword":
-                    results = search_client.search(
-                        search_text=query,
-                        select="movie_id,title,overview,tagline,genres", # Select fields to return
-                        top=top_k,
-                        include_total_count=True
-                    )
-
-                elif search_mode == "Vector":
-                    if vector_query: # Check if embedding succeeded
-                        vector_query_object = VectorizedQuery(vector=vector_query, k_nearest_neighbors=top_k, fields="embedding")
-                        results = search_client.search(
-                            search_text=None, # No keyword search
-                            vector_queries=[vector_query_object],
-                            select="movie_id,title,overview,tagline,genres",
-                            top=top_k,
-                            include_total_count=True
-                        )
-                    else:
-                        # Warning about skipping vector search if embedding failed
-                        if ollama_ok: # Only show if Ollama was ok but embedding failed
-                            st.warning("Skipping Vector search as query embedding failed.")
-
-
-                elif search_mode == "Hybrid":
-                    if vector_query: # Check if embedding succeeded
-                        vector_query_object = VectorizedQuery(vector=vector_query, k_nearest_neighbors=top_k, fields="embedding")
-                        results = search_client.search(
-                            search_text=query, # Keyword part
-                            vector_queries=[vector_query_object], # Vector part
-                            select="movie_id,title,overview,tagline,genres",
-                            top=top_k,
-                            include_total_count=True
-                            # Azure Search handles the RRF ranking automatically
-                        )
-                    else:
-                         # Warning about skipping hybrid search if embedding failed
-                        if ollama_ok: # Only show if Ollama was ok but embedding failed
-                            st.warning("Skipping Hybrid search as query embedding failed.")
-                elif search_mode == "Semantic (Keyword + Semantic Reranking)":
-                    try:
-                        results = search_client.search(
-                            search_text=query,
-                            select="movie_id,title,overview,tagline,genres",
-                            query_type=QueryType.SEMANTIC, 
-                            semantic_configuration_name=os.environ.get("AZURE_SEMANTIC_CONFIGURATION_NAME"), # ASSUMPTION: You have a 'default' semantic config. Change if needed.
-                            query_caption=QueryCaptionType.EXTRACTIVE, # Try to extract captions
-                            query_answer=QueryAnswerType.EXTRACTIVE, # Try to extract answers (may not apply well to movies)
-                            top=top_k,
-                            include_total_count=True
-                        )
-                        st.info("Note: Semantic search requires a Semantic Configuration to be enabled and set up on your Azure AI Search Index.")
-                    except Exception as semantic_error:
-                        st.error(f"Semantic Search Error: {semantic_error}. Is Semantic Search enabled and configured on the index '{AZURE_SEARCH_INDEX}' with a 'default' configuration?")
-                        results = None # Prevent displaying results from failed attempt
-
+            st.error(f"An error occurred during {mode} search: {e}")
+        return None
 
-            except Exception as e:
-                st.error(f"An error occurred during search: {e}")
+def generate_query_embedding():
+    """Generates the query embedding, or returns None if Ollama is unavailable or the call fails."""
+    if not ollama_ok: # Check if Ollama was reachable earlier
+        st.error("Cannot perform Vector/Hybrid search because Ollama service is not reachable.")
+        return None
+    embedding = get_ollama_embedding(query, OLLAMA_MODEL, OLLAMA_ENDPOINT, VECTOR_DIMENSION, MATRYOSHKA_DIMENSION)
+    if not embedding:
+        # Error is already shown by get_ollama_embedding if it failed
+        st.warning("Failed to generate query embedding. Cannot perform Vector or Hybrid search.")
+    return embedding
 
-        end_time = time.time()
-        search_duration = end_time - start_time
-        st.write(f"Search completed in {search_duration:.2f} seconds.")
+if search_button and query:
+    with tracer.span("app.search", mode="all" if compare_modes else search_mode, backend=search_backend) as search_span:
+        start_time = time.time()
 
+        # --- Get the pooled Azure Search Client ---
+        search_client = None
+        if search_backend == BACKEND_AZURE:
+            try:
+                search_client = get_search_client(AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_INDEX, AZURE_SEARCH_KEY)
+            except Exception as e:
+                st.error(f"Error creating Azure Search client: {e}")
+                st.stop() # Stop if client can't be created
+
+        # Repeated queries against an unchanged index are answered without Ollama or Azure
+        cache_version = result_cache_version(search_client)
+
+        if compare_modes:
+            st.write(f"Performing **all modes** side-by-side for: *'{query}'*")
+            executor = get_search_executor()
+            with st.spinner("Searching all modes..."):
+                cached = {mode: get_cached_results(mode, cache_version) for mode in SEARCH_MODES}
+                misses = [mode for mode in SEARCH_MODES if cached[mode] is None]
+                # Keyword-only modes don't need the vector, so they run while the embedding is generated
+                embedding_future = None
+                if any(mode in VECTOR_MODES for mode in misses):
+                    embedding_future = submit_with_script_ctx(executor, generate_query_embedding)
+                futures = {
+                    mode: submit_with_script_ctx(executor, execute_search_mode, search_client, mode, None, None, cache_version)
+                    for mode in misses if mode not in VECTOR_MODES
+                }
+                vector_query = embedding_future.result() if embedding_future else None
+                for mode in VECTOR_MODES:
+                    if mode in misses:
+                        futures[mode] = submit_with_script_ctx(
+                            executor, execute_search_mode, search_client, mode, vector_query, None, cache_version
+                        )
+                results_by_mode = {mode: cached[mode] or futures[mode].result() for mode in SEARCH_MODES}
+
+            search_duration = time.time() - start_time
+            st.write(f"All searches completed in {search_duration:.2f} seconds.")
+            if len(misses) < len(SEARCH_MODES):
+                st.caption(f"{len(SEARCH_MODES) - len(misses)} of {len(SEARCH_MODES)} modes served from the result cache.")
+
+            columns = st.columns(len(SEARCH_MODES))
+            for column, mode in zip(columns, SEARCH_MODES):
+                with column:
+                    st.markdown(f"#### {mode}")
+                    if results_by_mode[mode]:
+                        display_results(results_by_mode[mode])
+                    elif mode not in VECTOR_MODES and mode != MODE_SEMANTIC and search_backend == BACKEND_AZURE:
+                        st.info("No results found for your query.")
 
-        # --- Display Results ---
-        if results:
-            display_results(results)
-        # Handle cases where search was skipped or failed silently
-        elif ("Vector" in search_mode or "Hybrid" in search_mode) and not vector_query:
-             # Error/Warning about embedding failure was already shown
-             pass # Avoid redundant messages
-        elif not results and "Semantic" in search_mode:
-             # Error about semantic failure was already shown
-             pass
-        elif not results:
-             st.info("No results found for your query.")
+        else:
+            st.write(f"Performing **{search_mode}** search for: *'{query}'*")
+            results = get_cached_results(search_mode, cache_version)
+            vector_query = None
+            keyword_leg = None
+            from_cache = results is not None
+
+            if not from_cache:
+                # The local BM25 leg doesn't need the vector, so start it while the embedding is generated
+                if search_backend == BACKEND_LOCAL and search_mode == MODE_HYBRID:
+                    from local_text_search import HYBRID_KEYWORD_CANDIDATES
+                    keyword_leg = submit_with_script_ctx(get_search_executor(), run_local_keyword_leg, HYBRID_KEYWORD_CANDIDATES)
+
+                # --- Generate Query Embedding (if needed) ---
+                if search_mode in VECTOR_MODES:
+                    with st.spinner(f"Generating query embedding using {OLLAMA_MODEL}..."):
+                        vector_query = generate_query_embedding()
+                    if vector_query:
+                        st.success("Query embedding generated.")
+
+                # --- Execute Search Based on Mode ---
+                with st.spinner("Searching..."):
+                    results = execute_search_mode(search_client, search_mode, vector_query, keyword_leg, cache_version)
+
+            end_time = time.time()
+            search_duration = end_time - start_time
+            st.write(f"Search completed in {search_duration:.2f} seconds.")
+            if from_cache:
+                st.caption("Served from the result cache.")
+
+
+            # --- Display Results ---
+            if results:
+                display_results(results)
+            # Handle cases where search was skipped or failed silently
+            elif search_mode in VECTOR_MODES and not vector_query:
+                 # Error/Warning about embedding failure was already shown
+                 pass # Avoid redundant messages
+            elif not results and "Semantic" in search_mode:
+                 # Error about semantic failure was already shown
+                 pass
+            elif search_backend == BACKEND_LOCAL and search_mode not in LOCAL_SUPPORTED_MODES:
+                 pass # Unsupported-mode warning was already shown
+            elif not results:
+                 st.info("No results found for your query.")
+
+    # Where the time went, from this request's spans (TRACE_FILE / TRACE_METRICS_PORT aggregate across requests)
+    with st.expander("Timing breakdown"):
+        st.caption(" | ".join(f"{name} {ms:.0f} ms" for name, ms in breakdown(search_span))
+                   + f" | total {search_span.duration_ms:.0f} ms")
 
 
 elif search_button and not query:
-    st.warning("Please enter a search query.")
\ No newline at end of file
+    st.warning("Please enter a search query.")
@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from dotenv import load_dotenv
+
+from ann_index import DEFAULT_NPROBE, IVFQuantizedIndex
+from embedding_cache import EmbeddingCache, normalize_query_text
+from local_text_search import BM25Index, HYBRID_KEYWORD_CANDIDATES, hybrid_search
+from local_vector_search import DEFAULT_EMBEDDINGS_GLOB
+from matryoshka import load_vector_index, matryoshka_dimension
+from ollama_batch_client import OllamaBatchEmbedder, OllamaUnavailableError
+from result_cache import SearchResultCache, files_fingerprint, local_index_name
+from search_service import (
+    SEARCH_MODES,
+    VECTOR_MODES,
+    MODE_KEYWORD,
+    MODE_VECTOR,
+    MODE_HYBRID,
+    MODE_SEMANTIC,
+    SearchResults,
+    get_search_client,
+    run_search,
+)
+
+# --- Configuration Defaults ---
+MODE_ALIASES = {"keyword": MODE_KEYWORD, "vector": MODE_VECTOR, "hybrid": MODE_HYBRID, "semantic": MODE_SEMANTIC}
+DEFAULT_MODES = ("keyword", "vector", "hybrid")
+DEFAULT_TOP_K = 5
+DEFAULT_CONCURRENCY = 8 # Searches in flight
+DEFAULT_CHUNK_SIZE = 1000 # Queries embedded together; the next chunk is embedded while this one is searched
+LOCAL_SUPPORTED_MODES = (MODE_KEYWORD, MODE_VECTOR, MODE_HYBRID)
+
+
+def resolve_mode(mode: str) -> str:
+    """Accepts the app's mode names or short aliases ("keyword", "vector", "hybrid", "semantic")."""
+    if mode in SEARCH_MODES:
+        return mode
+    try:
+        return MODE_ALIASES[mode.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown search mode '{mode}'. Expected one of {sorted(MODE_ALIASES)}.") from None
+
+
+def read_queries(path: str):
+    """Yields {"query", optional "mode", optional "top_k"} from a query file ("-" for stdin).
+
+    Lines are either plain query text or JSON objects with a "query" key, e.g. a query log
+    export; blank lines are skipped.
+    """
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                if record.get("query"):
+                    yield record
+            else:
+                yield {"query": line}
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _chunked(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- Search Backends ---
+class AzureSearchBackend:
+    """Runs searches through the same pooled client and `run_search` the app uses."""
+
+    def __init__(self, endpoint: str, index_name: str, api_key: str, semantic_configuration_name: str = None):
+        self.client = get_search_client(endpoint, index_name, api_key)
+        self.index_name = index_name
+        self.semantic_configuration_name = semantic_configuration_name
+        self.supported_modes = SEARCH_MODES
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.environ.get("AZURE_SEARCH_SERVICE_ENDPOINT"),
+            os.environ.get("AZURE_SEARCH_INDEX_NAME"),
+            os.environ.get("AZURE_SEARCH_API_KEY"),
+            os.environ.get("AZURE_SEMANTIC_CONFIGURATION_NAME"),
+        )
+
+    def fingerprint(self):
+        return self.client.get_document_count()
+
+    def search(self, mode: str, query: str, vector, top_k: int) -> SearchResults:
+        return run_search(self.client, mode, query, query_vector=vector, top_k=top_k,
+                          semantic_configuration_name=self.semantic_configuration_name)
+
+
+class LocalSearchBackend:
+    """In-process BM25, exact or compressed vector search and RRF, configured like the app's local backend."""
+
+    def __init__(self, embeddings_path: str, text_index_path: str = None, ann_index_path: str = None,
+                 nprobe: int = DEFAULT_NPROBE, dimension: int = None, native_dimension: int = None):
+        self.embeddings_path = embeddings_path
+        self.text_index_path = text_index_path
+        self.ann_index_path = ann_index_path
+        self.nprobe = nprobe
+        self.dimension = dimension
+        self.native_dimension = native_dimension # Full-size backups are truncated to `dimension` on load
+        self.index_name = local_index_name(embeddings_path, ann_index_path, nprobe)
+        self.semantic_configuration_name = None # No semantic ranker locally
+        self.supported_modes = LOCAL_SUPPORTED_MODES
+        self._vector_index = None
+        self._text_index = None
+        self._lock = threading.Lock() # Indexes are loaded on first use, once
+
+    @classmethod
+    def from_env(cls, dimension: int = None, native_dimension: int = None):
+        return cls(
+            os.getenv("LOCAL_EMBEDDINGS_PATH", DEFAULT_EMBEDDINGS_GLOB),
+            os.getenv("LOCAL_TEXT_INDEX_PATH"),
+            os.getenv("LOCAL_ANN_INDEX_PATH"),
+            int(os.getenv("LOCAL_ANN_NPROBE", DEFAULT_NPROBE)),
+            dimension,
+            native_dimension,
+        )
+
+    def fingerprint(self):
+        return files_fingerprint(self.embeddings_path, self.ann_index_path, self.text_index_path)
+
+    def vector_index(self):
+        with self._lock:
+            if self._vector_index is None:
+                if self.ann_index_path:
+                    self._vector_index = IVFQuantizedIndex.load(self.ann_index_path, nprobe=self.nprobe)
+                else:
+                    self._vector_index = load_vector_index(self.embeddings_path, self.dimension, self.native_dimension)
+            return self._vector_index
+
+    def text_index(self):
+        with self._lock:
+            if self._text_index is None:
+                source = files_fingerprint(self.embeddings_path)
+                if self.text_index_path and os.path.exists(self.text_index_path):
+                    self._text_index = BM25Index.load(self.text_index_path)
+                    if self._text_index.source != source: # Built from other embeddings than the vector leg's
+                        self._text_index = None
+                if self._text_index is None:
+                    vector_index = load_vector_index(self.embeddings_path, self.dimension, self.native_dimension)
+                    self._text_index = BM25Index.build(
+                        dict(zip(vector_index.metadata, values)) for values in zip(*vector_index.metadata.values())
+                    )
+                    self._text_index.source = source
+            return self._text_index
+
+    def search(self, mode: str, query: str, vector, top_k: int) -> SearchResults:
+        if mode == MODE_KEYWORD:
+            return SearchResults(*self.text_index().search(query, k=top_k))
+        vector_rows = self.vector_index().search(vector, k=top_k)
+        if mode == MODE_VECTOR:
+            return SearchResults(vector_rows)
+        keyword_rows, _ = self.text_index().search(query, k=HYBRID_KEYWORD_CANDIDATES)
+        return SearchResults(*hybrid_search(keyword_rows, vector_rows, k=top_k))
+
+
+# --- Runner ---
+class BatchQueryRunner:
+    """Runs many queries across several modes and streams one JSON line per (query, mode).
+
+    Query embeddings are requested in large batches through `OllamaBatchEmbedder`, one
+    chunk of queries at a time, and the next chunk is embedded while the current one is
+    searched. At most `concurrency` searches are in flight. With `embedding_cache` and
+    `result_cache` set (the app's caches, from their *_CACHE_* environment variables),
+    every embedding and result is written to them, so a run over popular queries warms
+    the app after a deploy; cached entries are reused instead of recomputed.
+    """
+
+    def __init__(self, backend, embedder: OllamaBatchEmbedder, model: str, dimension: int = None, modes=DEFAULT_MODES,
+                 top_k: int = DEFAULT_TOP_K, concurrency: int = DEFAULT_CONCURRENCY, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 embedding_cache: EmbeddingCache = None, result_cache: SearchResultCache = None):
+        self.backend = backend
+        self.embedder = embedder
+        self.model = model
+        self.dimension = dimension
+        self.modes = [resolve_mode(mode) for mode in modes]
+        self.top_k = top_k
+        self.concurrency = max(1, int(concurrency))
+        self.chunk_size = max(1, int(chunk_size))
+        self.embedding_cache = embedding_cache
+        self.result_cache = result_cache
+        self._version = None
+
+    def _embed_chunk(self, chunk: list) -> dict:
+        """Returns normalized text -> (vector or None, amortized embed ms, from cache) for a chunk's vector queries.
+
+        If Ollama is unavailable the chunk's uncached vectors are None, so only its vector and
+        hybrid searches fail and keyword searches still run.
+        """
+        texts = {} # normalized text -> query as first typed, which is what gets embedded
+        for item in chunk:
+            if any(mode in VECTOR_MODES for mode in item["modes"]):
+                texts.setdefault(normalize_query_text(item["query"]), item["query"].strip())
+        vectors = {}
+        if self.embedding_cache is not None:
+            for key, text in texts.items():
+                vector = self.embedding_cache.get(self.model, text, self.dimension)
+                if vector is not None:
+                    vectors[key] = (vector, 0.0, True)
+        missing = sorted(texts.keys() - vectors.keys())
+        if missing:
+            start = time.perf_counter()
+            try:
+                embeddings = self.embedder.embed([texts[key] for key in missing])
+            except OllamaUnavailableError as e:
+                print(f"Warning: Embedding {len(missing)} queries failed; their vector and hybrid searches are marked as errors: {e}", file=sys.stderr)
+                embeddings = [None] * len(missing)
+            per_text_ms = (time.perf_counter() - start) * 1000 / len(missing)
+            for key, vector in zip(missing, embeddings):
+                if vector is not None and self.embedding_cache is not None:
+                    self.embedding_cache.put(self.model, texts[key], self.dimension, vector)
+                vectors[key] = (vector, per_text_ms, False)
+        return vectors
+
+    def _search(self, position: int, item: dict, mode: str, embedding) -> dict:
+        query, top_k = item["query"], item["top_k"]
+        record = {"index": position, "query": query, "mode": mode, "top_k": top_k}
+        vector = None
+        if mode in VECTOR_MODES:
+            vector, record["embed_ms"], record["embedding_cached"] = embedding or (None, 0.0, False)
+        start = time.perf_counter()
+        try:
+            entry = None
+            if self.result_cache is not None:
+                entry = self.result_cache.get(query, mode, top_k, self.model, self.backend.index_name, self._version,
+                                              self.dimension, self.backend.semantic_configuration_name)
+            record["result_cached"] = entry is not None
+            if entry is None:
+                if mode not in self.backend.supported_modes:
+                    raise ValueError(f"{mode} search is not available on this backend.")
+                if mode in VECTOR_MODES and vector is None:
+                    raise ValueError("query embedding failed")
+                results = self.backend.search(mode, query, vector, top_k)
+                rows, count = results.rows, results.get_count()
+                if self.result_cache is not None:
+                    self.result_cache.put(query, mode, top_k, self.model, self.backend.index_name, self._version, rows, count,
+                                          self.dimension, self.backend.semantic_configuration_name)
+            else:
+                rows, count = entry["rows"], entry["count"]
+            record["count"] = count
+            record["results"] = [
+                {"movie_id": row.get("movie_id"), "title": row.get("title"), "score": row.get("@search.score"),
+                 **({"reranker_score": row["@search.reranker_score"]} if row.get("@search.reranker_score") is not None else {})}
+                for row in rows
+            ]
+        except Exception as e:
+            record["error"] = str(e)
+        record["search_ms"] = (time.perf_counter() - start) * 1000
+        return record
+
+    def run(self, queries, output) -> dict:
+        """Runs every query and writes JSON lines to the `output` file object. Returns a summary."""
+        run_start = time.perf_counter()
+        if self.result_cache is not None:
+            self._version = self.result_cache.index_version(self.backend.index_name, self.backend.fingerprint)
+        items = (
+            {"query": record["query"], "top_k": int(record.get("top_k") or self.top_k),
+             "modes": [resolve_mode(record["mode"])] if record.get("mode") else self.modes}
+            for record in queries
+        )
+
+        search_ms = {mode: [] for mode in SEARCH_MODES}
+        totals = {"queries": 0, "searches": 0, "errors": 0, "result_cache_hits": 0, "embedding_cache_hits": 0}
+        pending = set()
+
+        def write_done(block: bool):
+            done = wait(pending, return_when=FIRST_COMPLETED).done if block else [f for f in pending if f.done()]
+            for future in done:
+                pending.discard(future)
+                record = future.result()
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                totals["searches"] += 1
+                totals["errors"] += "error" in record
+                totals["result_cache_hits"] += bool(record.get("result_cached"))
+                if "error" not in record:
+                    search_ms[record["mode"]].append(record["search_ms"])
+
+        search_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-search")
+        embed_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-embed")
+        embed_seconds = 0.0
+        position = 0
+        try:
+            chunks = _chunked(items, self.chunk_size)
+            chunk = next(chunks, None)
+            next_embeddings = embed_pool.submit(self._embed_chunk, chunk) if chunk else None
+            while chunk:
+                wait_start = time.perf_counter()
+                embeddings = next_embeddings.result()
+                embed_seconds += time.perf_counter() - wait_start # Only the time searches were actually held up
+                totals["embedding_cache_hits"] += sum(cached for _, _, cached in embeddings.values())
+                following = next(chunks, None)
+                next_embeddings = embed_pool.submit(self._embed_chunk, following) if following else None
+                for item in chunk:
+                    embedding = embeddings.get(normalize_query_text(item["query"]))
+                    for mode in item["modes"]:
+                        while len(pending) >= self.concurrency * 2: # Bounded, so memory stays flat for long logs
+                            write_done(block=True)
+                        pending.add(search_pool.submit(self._search, position, item, mode, embedding))
+                    position += 1
+                write_done(block=False)
+                chunk = following
+            while pending:
+                write_done(block=True)
+        finally:
+            search_pool.shutdown(wait=True)
+            embed_pool.shutdown(wait=True)
+            output.flush()
+
+        wall_seconds = time.perf_counter() - run_start
+        latencies = [ms for values in search_ms.values() for ms in values]
+        totals.update({
+            "queries": position,
+            "wall_seconds": wall_seconds,
+            "embedding_wait_seconds": embed_seconds,
+            "searches_per_second": totals["searches"] / wall_seconds if wall_seconds else 0.0,
+            "search_ms": {
+                mode: dict(zip(("p50", "p95", "p99"), np.percentile(values, [50, 95, 99]).round(2).tolist()))
+                for mode, values in [("all", latencies)] + list(search_ms.items()) if values
+            },
+            "embedder": self.embedder.stats(),
+        })
+        return totals
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a file of queries through the search backends in bulk, e.g. to "
+                                                 "evaluate a query log offline or to warm the app's caches.")
+    parser.add_argument("queries", help="Query file: one query per line, or JSON lines with a \"query\" key "
+                                        "(optional \"mode\" and \"top_k\" override the flags). \"-\" reads stdin.")
+    parser.add_argument("--out", default="-", help="JSONL output, one line per (query, mode) (default: stdout).")
+    parser.add_argument("--backend", choices=("azure", "local"), default=None,
+                        help="Search backend (default: SEARCH_BACKEND, else azure).")
+    parser.add_argument("--modes", nargs="+", default=list(DEFAULT_MODES), help=f"Modes to run: {', '.join(MODE_ALIASES)}.")
+    parser.add_argument("-k", "--top-k", type=int, default=DEFAULT_TOP_K, help="Results per search.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Searches in flight.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Queries embedded per chunk.")
+    parser.add_argument("--warm-caches", action="store_true",
+                        help="Read and write the app's embedding and result caches (EMBEDDING_CACHE_* / RESULT_CACHE_*).")
+    args = parser.parse_args()
+
+    load_dotenv()
+    model = os.getenv("OLLAMA_MODEL", "nomic-embed-text")
+    native_dimension = int(os.environ["VECTOR_DIMENSION"]) if os.getenv("VECTOR_DIMENSION") else None
+    reduced_dimension = matryoshka_dimension(native_dimension) # Query vectors must match the indexed ones
+    dimension = reduced_dimension or native_dimension
+    backend_name = args.backend or os.getenv("SEARCH_BACKEND", "azure").lower()
+    backend = LocalSearchBackend.from_env(dimension, native_dimension) if backend_name == "local" else AzureSearchBackend.from_env()
+    embedder = OllamaBatchEmbedder.from_env(model=model, dimension=native_dimension, output_dimension=reduced_dimension)
+    runner = BatchQueryRunner(
+        backend, embedder, model, dimension, modes=args.modes, top_k=args.top_k, concurrency=args.concurrency,
+        chunk_size=args.chunk_size,
+        embedding_cache=EmbeddingCache.from_env() if args.warm_caches else None,
+        result_cache=SearchResultCache.from_env() if args.warm_caches else None,
+    )
+    output = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        summary = runner.run(read_queries(args.queries), output)
+    finally:
+        embedder.close()
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(summary, indent=2), file=sys.stderr) # Summary on stderr keeps stdout pure JSONL
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# --- Configuration Defaults ---
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "query_embeddings.sqlite3")
+DEFAULT_MEMORY_ITEMS = 1024
+DEFAULT_DISK_ITEMS = 50000
+EVICTION_POLICIES = ("lru", "fifo")
+
+
+def normalize_query_text(text: str) -> str:
+    """Normalizes a query so trivially different spellings share one cache entry.
+
+    Collapses runs of whitespace and case-folds, so "space battles" and
+    "Space  battles " map to the same key. Only the key is normalized: callers embed the
+    text as typed, and spellings that differ only in case or spacing share the first vector cached.
+    """
+    if not text:
+        return ""
+    return " ".join(str(text).split()).casefold()
+
+
+def make_cache_key(model: str, text: str, dimension) -> str:
+    """Builds the cache key from model name, normalized text and vector dimension."""
+    raw = f"{model}\x1f{dimension or ''}\x1f{normalize_query_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _to_blob(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _from_blob(blob: bytes) -> list:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """Two-tier query embedding cache: an in-memory LRU in front of an on-disk SQLite store.
+
+    The disk tier survives restarts and is shared by every app worker pointing at the
+    same file (SQLite WAL mode handles concurrent readers/writers). Vectors are stored
+    as float32, the same precision Azure AI Search keeps for `Collection(Edm.Single)`.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, memory_items: int = DEFAULT_MEMORY_ITEMS,
+                 disk_items: int = DEFAULT_DISK_ITEMS, eviction: str = "lru", ttl_seconds: float = 0):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{eviction}'. Expected one of {EVICTION_POLICIES}.")
+        self.path = path
+        self.memory_items = max(0, int(memory_items))
+        self.disk_items = max(0, int(disk_items))
+        self.eviction = eviction
+        self.ttl_seconds = float(ttl_seconds or 0)
+
+        self._memory = OrderedDict() # key -> (vector, stored_at)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_count = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.path and self.disk_items > 0:
+            self._open_disk_store()
+
+    @classmethod
+    def from_env(cls):
+        """Creates a cache configured from EMBEDDING_CACHE_* environment variables.
+
+        Set EMBEDDING_CACHE_PATH to an empty string to disable the on-disk tier.
+        """
+        return cls(
+            path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+            memory_items=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", DEFAULT_MEMORY_ITEMS)),
+            disk_items=int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", DEFAULT_DISK_ITEMS)),
+            eviction=os.getenv("EMBEDDING_CACHE_EVICTION", "lru").lower(),
+            ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", 0)),
+        )
+
+    # --- Disk Tier ---
+    def _open_disk_store(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                       key TEXT PRIMARY KEY,
+                       model TEXT NOT NULL,
+                       dimension INTEGER,
+                       text TEXT NOT NULL,
+                       vector BLOB NOT NULL,
+                       created_at REAL NOT NULL,
+                       last_access REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_created_at ON embeddings(created_at)")
+            self._disk_count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error as e:
+            # The cache is an optimization; fall back to memory-only rather than failing the app
+            print(f"Warning: Could not open embedding cache at '{self.path}', using memory-only cache. Error: {e}")
+            self._conn = None
+
+    def _disk_get(self, key: str, now: float):
+        row = self._conn.execute("SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        blob, created_at = row
+        if self.ttl_seconds and now - created_at > self.ttl_seconds:
+            self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            self._disk_count = max(0, self._disk_count - 1)
+            return None
+        if self.eviction == "lru":
+            self._conn.execute("UPDATE embeddings SET last_access = ? WHERE key = ?", (now, key))
+        return _from_blob(blob), created_at
+
+    def _disk_put(self, key: str, model: str, dimension, text: str, vector, now: float):
+        # INSERT OR REPLACE reports one changed row either way, so check whether this adds a row
+        exists = self._conn.execute("SELECT 1 FROM embeddings WHERE key = ?", (key,)).fetchone() is not None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO embeddings (key, model, dimension, text, vector, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, model, dimension, text, _to_blob(vector), now, now),
+        )
+        if not exists:
+            self._disk_count += 1
+        if self._disk_count > self.disk_items:
+            # Re-count before evicting: other workers share this file
+            self._disk_count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            overflow = self._disk_count - self.disk_items
+            if overflow > 0:
+                # Evict a little extra so we don't prune on every single insert
+                to_remove = overflow + max(1, self.disk_items // 20)
+                order_column = "last_access" if self.eviction == "lru" else "created_at"
+                self._conn.execute(
+                    f"DELETE FROM embeddings WHERE key IN "
+                    f"(SELECT key FROM embeddings ORDER BY {order_column} ASC LIMIT ?)",
+                    (to_remove,),
+                )
+                self.evictions += to_remove
+                self._disk_count = max(0, self._disk_count - to_remove)
+
+    # --- Memory Tier ---
+    def _memory_put(self, key: str, vector, stored_at: float):
+        if self.memory_items == 0:
+            return
+        self._memory[key] = (vector, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # --- Public API ---
+    def get(self, model: str, text: str, dimension=None):
+        """Returns the cached embedding for (model, text, dimension), or None on a miss."""
+        key = make_cache_key(model, text, dimension)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                vector, stored_at = entry
+                if not self.ttl_seconds or now - stored_at <= self.ttl_seconds:
+                    if self.eviction == "lru":
+                        self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return vector
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    found = self._disk_get(key, now)
+                except sqlite3.Error as e:
+                    print(f"Warning: Embedding cache read failed: {e}")
+                    found = None
+                if found is not None:
+                    vector, created_at = found
+                    self._memory_put(key, vector, created_at)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, dimension, vector) -> list:
+        """Stores an embedding in both tiers and returns it as the float32-rounded list that was cached."""
+        vector = _from_blob(_to_blob(vector)) # Keep hits and misses bit-identical
+        key = make_cache_key(model, text, dimension)
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, vector, now)
+            if self._conn is not None:
+                try:
+                    self._disk_put(key, model, dimension, normalize_query_text(text), vector, now)
+                except sqlite3.Error as e:
+                    print(f"Warning: Embedding cache write failed: {e}")
+        return vector
+
+    def clear(self):
+        """Drops every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+                self._disk_count = 0
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and current tier sizes."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_count if self._conn is not None else 0,
+            }
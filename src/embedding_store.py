@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- Store Layout ---
+# <name>.embstore/
+#   header.json       model, dimension, dtype, row count
+#   vectors.bin       row-major little-endian float32/float16 matrix, one row per document
+#   metadata.parquet  movie_id, title, overview, tagline, genres (row-aligned with vectors.bin)
+STORE_FORMAT = "contoso-embedding-store"
+STORE_VERSION = 1
+STORE_SUFFIX = ".embstore"
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.bin"
+METADATA_FILE = "metadata.parquet"
+METADATA_FIELDS = ("movie_id", "title", "overview", "tagline", "genres")
+SUPPORTED_DTYPES = ("float32", "float16")
+
+_METADATA_SCHEMA = pa.schema([(field, pa.string()) for field in METADATA_FIELDS])
+
+
+def is_embedding_store(path: str) -> bool:
+    """True if path is a store directory written by EmbeddingStoreWriter."""
+    return os.path.isfile(os.path.join(path, HEADER_FILE))
+
+
+def model_from_jsonl_filename(filename: str):
+    """Extracts the model name from backup names like movie_embeddings_<model>_<N>records.jsonl."""
+    match = re.match(r"movie_embeddings_(?:combined_)?(.+?)_(?:\d+|None)records", os.path.basename(filename))
+    return match.group(1) if match else None
+
+
+class EmbeddingStoreWriter:
+    """Appends documents (metadata + embedding) to a new store, one batch at a time.
+
+    Only the current batch is held in memory, so it can be used as an incremental sink
+    during ingestion. The header's row count is finalized by `close()`.
+    """
+
+    def __init__(self, path: str, model: str, dimension: int, dtype: str = "float32", normalize: bool = False):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype}'. Expected one of {SUPPORTED_DTYPES}.")
+        self.path = path
+        self.model = model
+        self.dimension = int(dimension)
+        self.dtype = dtype
+        self.normalize = normalize
+        self.count = 0
+        os.makedirs(path, exist_ok=True)
+        self._vectors_file = open(os.path.join(path, VECTORS_FILE), "wb")
+        self._metadata_writer = pq.ParquetWriter(os.path.join(path, METADATA_FILE), _METADATA_SCHEMA)
+        self._write_header(complete=False)
+
+    def _write_header(self, complete: bool):
+        header = {
+            "format": STORE_FORMAT,
+            "version": STORE_VERSION,
+            "model": self.model,
+            "dimension": self.dimension,
+            "dtype": self.dtype,
+            "count": self.count,
+            "normalized": self.normalize,
+            "complete": complete,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        temp_path = os.path.join(self.path, HEADER_FILE + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2)
+        os.replace(temp_path, os.path.join(self.path, HEADER_FILE))
+
+    def append(self, documents: list) -> int:
+        """Writes a batch of documents; those without a valid embedding are skipped. Returns rows written."""
+        rows = [doc for doc in documents
+                if doc.get("movie_id") is not None and len(doc.get("embedding") or ()) == self.dimension]
+        if not rows:
+            return 0
+        matrix = np.asarray([doc["embedding"] for doc in rows], dtype=np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        self._vectors_file.write(matrix.astype("<" + ("f4" if self.dtype == "float32" else "f2")).tobytes())
+        columns = {
+            field: [None if doc.get(field) is None else str(doc.get(field)) for doc in rows]
+            for field in METADATA_FIELDS
+        }
+        self._metadata_writer.write_table(pa.table(columns, schema=_METADATA_SCHEMA))
+        self.count += len(rows)
+        return len(rows)
+
+    def close(self):
+        self._vectors_file.close()
+        self._metadata_writer.close()
+        self._write_header(complete=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class EmbeddingStore:
+    """Read side of the store: vectors are memory-mapped (zero-copy), metadata is columnar."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        if self.header.get("format") != STORE_FORMAT:
+            raise ValueError(f"'{path}' is not an embedding store (format: {self.header.get('format')}).")
+        self.model = self.header.get("model")
+        self.dimension = int(self.header["dimension"])
+        self.dtype = self.header.get("dtype", "float32")
+        self.normalized = bool(self.header.get("normalized"))
+        if not self.header.get("complete", True):
+            print(f"Warning: Embedding store '{path}' was not closed cleanly; reading the rows written so far.")
+
+        self.metadata = pq.read_table(os.path.join(path, METADATA_FILE))
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        row_bytes = self.dimension * np.dtype(self.dtype).itemsize
+        # Trust whichever side has fewer complete rows in case a writer was interrupted
+        self.count = min(self.metadata.num_rows, os.path.getsize(vectors_path) // row_bytes)
+        if self.count:
+            self.vectors = np.memmap(vectors_path, dtype="<" + ("f4" if self.dtype == "float32" else "f2"),
+                                     mode="r", shape=(self.count, self.dimension))
+        else:
+            self.vectors = np.empty((0, self.dimension), dtype=self.dtype)
+        if self.metadata.num_rows != self.count:
+            self.metadata = self.metadata.slice(0, self.count)
+        self._row_by_id = None
+
+    def column(self, field: str) -> list:
+        """Returns one metadata column as a Python list, aligned with vector rows."""
+        return self.metadata.column(field).to_pylist()
+
+    def row_of(self, movie_id: str):
+        """Returns the row number of a movie ID, or None if it isn't in the store."""
+        if self._row_by_id is None:
+            self._row_by_id = {movie_id: row for row, movie_id in enumerate(self.column("movie_id"))}
+        return self._row_by_id.get(movie_id)
+
+    def iter_documents(self, batch_size: int = 1000):
+        """Yields batches of upload-ready documents (metadata + embedding list), e.g. for Azure re-uploads."""
+        for start in range(0, self.count, batch_size):
+            end = min(start + batch_size, self.count)
+            columns = {field: self.metadata.column(field).slice(start, end - start).to_pylist() for field in METADATA_FIELDS}
+            vectors = np.asarray(self.vectors[start:end], dtype=np.float32).tolist()
+            yield [
+                {**{field: columns[field][i] for field in METADATA_FIELDS}, "embedding": vectors[i]}
+                for i in range(end - start)
+            ]
+
+
+def convert_jsonl_to_store(jsonl_paths, output_path: str, model: str = None, dimension: int = None,
+                           dtype: str = "float32", normalize: bool = False, batch_size: int = 1000) -> int:
+    """Converts processed embedding JSONL backups into a binary store, streaming in batches.
+
+    Records whose dimension differs from the first record (or `dimension`) and duplicate
+    movie IDs are skipped. Returns the number of rows written.
+    """
+    if isinstance(jsonl_paths, str):
+        jsonl_paths = [jsonl_paths]
+    model = model or model_from_jsonl_filename(jsonl_paths[0])
+    writer = None
+    seen_ids = set()
+    skipped = 0
+    batch = []
+    try:
+        for filename in jsonl_paths:
+            with open(filename, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    embedding = record.get("embedding")
+                    if not isinstance(embedding, list) or record.get("movie_id") in seen_ids:
+                        skipped += 1
+                        continue
+                    if writer is None:
+                        dimension = dimension or len(embedding)
+                        writer = EmbeddingStoreWriter(output_path, model, dimension, dtype=dtype, normalize=normalize)
+                    if len(embedding) != dimension:
+                        skipped += 1
+                        continue
+                    seen_ids.add(record.get("movie_id"))
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        writer.append(batch)
+                        batch = []
+        if writer is None:
+            raise ValueError(f"No embeddings found in {jsonl_paths}")
+        writer.append(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    if skipped:
+        print(f"Warning: Skipped {skipped} records (dimension mismatch, duplicate ID or missing embedding).")
+    return writer.count
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert and inspect binary embedding stores.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert processed JSONL backups into a store.")
+    convert_parser.add_argument("jsonl", nargs="+", help="Input JSONL file(s).")
+    convert_parser.add_argument("--out", required=True, help=f"Output store directory (conventionally ending in {STORE_SUFFIX}).")
+    convert_parser.add_argument("--model", help="Model name for the header (default: parsed from the file name).")
+    convert_parser.add_argument("--float16", action="store_true", help="Store vectors as float16 (half the size).")
+    convert_parser.add_argument("--normalize", action="store_true", help="L2-normalize rows so cosine search can use them as-is.")
+    info_parser = subparsers.add_parser("info", help="Print a store's header and load time.")
+    info_parser.add_argument("store", help="Store directory.")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        start = time.time()
+        written = convert_jsonl_to_store(args.jsonl, args.out, model=args.model,
+                                         dtype="float16" if args.float16 else "float32", normalize=args.normalize)
+        input_bytes = sum(os.path.getsize(f) for f in args.jsonl)
+        output_bytes = sum(os.path.getsize(os.path.join(args.out, f)) for f in os.listdir(args.out))
+        print(f"Wrote {written} rows to {args.out} in {time.time() - start:.2f} seconds "
+              f"({input_bytes / 1e6:.1f} MB JSONL -> {output_bytes / 1e6:.1f} MB store).")
+    else:
+        start = time.time()
+        store = EmbeddingStore(args.store)
+        print(json.dumps(store.header, indent=2))
+        print(f"Opened {store.count} x {store.dimension} {store.dtype} vectors in {(time.time() - start) * 1000:.1f} ms.")
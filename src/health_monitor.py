@@ -0,0 +1,159 @@
+import argparse
+import os
+import threading
+import time
+
+from search_service import get_ollama_session, get_search_client
+from tracing import get_tracer
+
+# --- Configuration Defaults ---
+DEFAULT_INTERVAL_SECONDS = 30
+DEFAULT_KEEP_ALIVE = "30m" # How long Ollama keeps the model loaded after a request (Ollama's own default is 5m)
+DEFAULT_TIMEOUT_SECONDS = 5
+PREWARM_TIMEOUT_SECONDS = 120 # Loading a model from disk can take a while on a cold host
+PREWARM_TEXT = "warm up"
+
+STATE_CHECKING = "checking"
+STATE_OK = "ok"
+STATE_DOWN = "down"
+
+
+def ollama_base_url(endpoint: str) -> str:
+    """Strips /api/embed or /api/embeddings from an Ollama endpoint, leaving the server root."""
+    for suffix in ("/api/embeddings", "/api/embed"):
+        if suffix in endpoint:
+            return endpoint.split(suffix)[0] + "/"
+    return endpoint
+
+
+class HealthMonitor:
+    """Tracks whether Ollama and Azure AI Search are reachable, from a background daemon thread.
+
+    The first pass pre-warms both services: a one-phrase embedding makes Ollama load the model
+    (and keep it loaded for `keep_alive`), and a document count opens the shared SearchClient's
+    pooled connection, TLS handshake included. Later passes are plain probes every
+    `interval_seconds`. `status()` only reads the latest results, so rendering a page never
+    waits on the network.
+    """
+
+    def __init__(self, ollama_endpoint: str, ollama_model: str, azure_settings: tuple = None,
+                 interval_seconds: float = DEFAULT_INTERVAL_SECONDS, keep_alive: str = DEFAULT_KEEP_ALIVE,
+                 prewarm: bool = True, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        self.ollama_endpoint = ollama_endpoint
+        self.ollama_model = ollama_model
+        self.azure_settings = azure_settings # (endpoint, index name, api key), or None if Azure isn't configured
+        self.interval_seconds = max(1.0, float(interval_seconds))
+        self.keep_alive = keep_alive
+        self.prewarm = prewarm
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {"ollama": self._entry(STATE_CHECKING)}
+        if azure_settings:
+            self._status["azure"] = self._entry(STATE_CHECKING)
+
+    @classmethod
+    def from_env(cls, ollama_endpoint: str, ollama_model: str, azure_settings: tuple = None):
+        """Creates a monitor configured from HEALTH_CHECK_INTERVAL_SECONDS, OLLAMA_KEEP_ALIVE and PREWARM."""
+        return cls(
+            ollama_endpoint,
+            ollama_model,
+            azure_settings,
+            interval_seconds=float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", DEFAULT_INTERVAL_SECONDS)),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE),
+            prewarm=os.getenv("PREWARM", "true").lower() != "false",
+        )
+
+    @staticmethod
+    def _entry(state: str, latency_ms: float = None, detail: str = "") -> dict:
+        return {"state": state, "latency_ms": latency_ms, "detail": detail, "checked_at": time.time()}
+
+    # --- Probes ---
+    def _probe_ollama(self, warm: bool) -> str:
+        session = get_ollama_session()
+        if warm:
+            payload = {"model": self.ollama_model, "input": [PREWARM_TEXT]}
+            if self.keep_alive:
+                payload["keep_alive"] = self.keep_alive
+            response = session.post(self.ollama_endpoint, json=payload, timeout=PREWARM_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            return f"model '{self.ollama_model}' loaded"
+        response = session.get(ollama_base_url(self.ollama_endpoint), timeout=self.timeout)
+        response.raise_for_status()
+        return ""
+
+    def _probe_azure(self, warm: bool) -> str:
+        client = get_search_client(*self.azure_settings) # First call imports the Azure SDK, off the page-render path
+        count = client.get_document_count(connection_timeout=self.timeout, read_timeout=self.timeout, retry_total=0)
+        return f"{count} documents"
+
+    def _check(self, name: str, probe, warm: bool):
+        with get_tracer().span(f"health.{name}", prewarm=warm) as span:
+            start = time.time()
+            try:
+                detail = probe(warm)
+                entry = self._entry(STATE_OK, (time.time() - start) * 1000, detail)
+            except Exception as e: # Any failure (connection, HTTP status, auth) means "not usable right now"
+                span.set_error(e)
+                entry = self._entry(STATE_DOWN, None, str(e))
+            span.set("state", entry["state"])
+        with self._lock:
+            self._status[name] = entry
+
+    def check(self, warm: bool = False) -> dict:
+        """Runs one pass over every configured service and returns the resulting status."""
+        self._check("ollama", self._probe_ollama, warm)
+        if self.azure_settings:
+            self._check("azure", self._probe_azure, warm)
+        return self.status()
+
+    # --- Background Thread ---
+    def start(self):
+        """Starts the monitor thread (first pass pre-warms, if enabled). Returns self."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        warm = self.prewarm
+        while not self._stop.is_set():
+            self.check(warm)
+            warm = False
+            self._stop.wait(self.interval_seconds)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=PREWARM_TIMEOUT_SECONDS)
+            self._thread = None
+
+    def status(self) -> dict:
+        """Latest result per service: {"state": checking|ok|down, "latency_ms", "detail", "checked_at"}."""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._status.items()}
+
+
+# --- Command Line: pre-warm after a deploy, before traffic arrives ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Pre-warm Ollama and Azure AI Search and report whether they are reachable.")
+    parser.add_argument("--no-warm", action="store_true", help="Only probe; don't load the model or open the Azure connection.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    azure_settings = tuple(os.environ.get(name) for name in ("AZURE_SEARCH_SERVICE_ENDPOINT", "AZURE_SEARCH_INDEX_NAME", "AZURE_SEARCH_API_KEY"))
+    monitor = HealthMonitor.from_env(
+        os.getenv("OLLAMA_ENDPOINT", "http://localhost:11434/api/embed"),
+        os.getenv("OLLAMA_MODEL", "nomic-embed-text"),
+        azure_settings if all(azure_settings) else None,
+    )
+    healthy = True
+    for name, entry in monitor.check(warm=not args.no_warm).items():
+        healthy = healthy and entry["state"] == STATE_OK
+        latency = f" in {entry['latency_ms']:.0f} ms" if entry["latency_ms"] is not None else ""
+        print(f"{name}: {entry['state']}{latency} {entry['detail']}".rstrip())
+    raise SystemExit(0 if healthy else 1)
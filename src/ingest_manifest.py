@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# --- Configuration Defaults ---
+LOOKUP_CHUNK_SIZE = 500 # IDs per SELECT ... IN (...) query, well under SQLite's parameter limit
+
+
+def content_hash(model: str, text: str, dimension=None) -> str:
+    """Hashes everything that determines a document's embedding: model, dimension and embedded text."""
+    raw = f"{model}\x1f{dimension or ''}\x1f{text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def default_manifest_path(output_dir: str, index_name: str) -> str:
+    """One manifest per search index, kept next to the processed backups."""
+    return os.path.join(output_dir, f"ingest_manifest_{index_name}.sqlite3")
+
+
+class IngestManifest:
+    """Records which content each movie_id had when it was last uploaded successfully.
+
+    A run only embeds and uploads documents whose content hash differs from the recorded
+    one, so an unchanged catalog costs a CSV scan instead of hours of embedding. Entries
+    are written as each upload batch succeeds, which makes the manifest its own
+    checkpoint: an interrupted run picks up where it stopped when re-run.
+    """
+
+    def __init__(self, path: str, model: str, dimension: int = None):
+        self.path = path
+        self.model = model
+        self.dimension = dimension
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock() # Shared by the pipeline's prepare and upload threads
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                   movie_id TEXT PRIMARY KEY,
+                   content_hash TEXT NOT NULL,
+                   uploaded_at REAL NOT NULL
+               )"""
+        )
+
+    def hash(self, text: str) -> str:
+        """Content hash of `text` for this manifest's model and dimension."""
+        return content_hash(self.model, text, self.dimension)
+
+    def lookup(self, movie_ids) -> dict:
+        """Returns {movie_id: content_hash} for the IDs that have been uploaded before."""
+        movie_ids = list(movie_ids)
+        found = {}
+        with self._lock:
+            for start in range(0, len(movie_ids), LOOKUP_CHUNK_SIZE):
+                chunk = movie_ids[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT movie_id, content_hash FROM documents WHERE movie_id IN ({placeholders})", chunk
+                )
+                found.update(rows)
+        return found
+
+    def mark_uploaded(self, entries):
+        """Records (movie_id, content_hash) pairs whose upload succeeded."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (movie_id, content_hash, uploaded_at) VALUES (?, ?, ?)",
+                [(movie_id, digest, now) for movie_id, digest in entries],
+            )
+            self._conn.execute("COMMIT")
+
+    def stale_ids(self, seen_ids) -> list:
+        """IDs recorded in the manifest that weren't seen in the current source file."""
+        with self._lock:
+            recorded = [row[0] for row in self._conn.execute("SELECT movie_id FROM documents")]
+        seen_ids = set(seen_ids)
+        return [movie_id for movie_id in recorded if movie_id not in seen_ids]
+
+    def plan_deletes(self, seen_ids, complete_scan: bool, max_fraction: float) -> tuple:
+        """Decides which IDs to delete from the index after a run: returns (ids, reason skipped).
+
+        Deletes need a complete scan, since rows past a RECORDS_TO_PROCESS limit would look removed.
+        They are also refused when more than `max_fraction` of the recorded documents vanished at
+        once, which usually means a truncated or wrong source file rather than real removals.
+        """
+        if not complete_scan:
+            return [], "only part of the source file was read (RECORDS_TO_PROCESS limit)."
+        stale_ids = self.stale_ids(seen_ids)
+        recorded = self.count()
+        if stale_ids and len(stale_ids) > max_fraction * recorded:
+            return [], (f"{len(stale_ids)} of {recorded} indexed movies are missing from the source, "
+                        f"more than MAX_DELETE_FRACTION={max_fraction}. Check the source file, or raise the limit.")
+        return stale_ids, None
+
+    def remove(self, movie_ids):
+        """Forgets IDs, e.g. after they were deleted from the index."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM documents WHERE movie_id = ?", [(movie_id,) for movie_id in movie_ids])
+            self._conn.execute("COMMIT")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def clear(self):
+        """Drops every entry so the next run re-embeds and re-uploads everything."""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,446 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from embedding_store import EmbeddingStore, EmbeddingStoreWriter, convert_jsonl_to_store
+from movie_documents import COLUMNS_TO_EMBED, COLUMNS_TO_READ, combine_text, prepare_text_and_metadata
+
+# --- Configuration Defaults ---
+CSV_CHUNK_SIZE = 1000 # Rows read from the CSV at a time
+EMBED_BATCH_SIZE = 32 # Texts per embed_fn call
+UPLOAD_BATCH_SIZE = 100 # Documents per upload_fn call
+QUEUE_SIZE = 4 # Batches buffered between stages; bounds peak memory
+REQUIRED_COLUMNS = ['id', 'title', 'overview'] # Rows missing any of these are dropped, as before
+
+_END = object() # Sentinel passed down the queues when a stage has finished
+
+
+# --- Backup Sinks ---
+# Sinks receive every successfully embedded batch as it's produced, so nothing accumulates
+class JsonlBackupSink:
+    """Appends embedded documents to a JSON Lines file (legacy float-as-text format)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = open(path, "w", encoding="utf-8") # Overwrite any previous incomplete file
+
+    def write(self, documents: list):
+        for record in documents:
+            record_to_save = {key: value for key, value in record.items() if key != "@search.action"}
+            self._file.write(json.dumps(record_to_save, ensure_ascii=False) + "\n")
+            self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def jsonl_carry_over_store(jsonl_paths, store_path: str, model: str, dimension: int):
+    """Converts previous JSONL backups into an EmbeddingStore to use as a carry-over store.
+
+    JSONL can't be looked up by movie ID, so unchanged documents' vectors are copied from this
+    temporary store instead. Earlier paths win for duplicate IDs. Returns None if there is
+    nothing to carry over.
+    """
+    paths = [path for path in jsonl_paths if os.path.exists(path) and os.path.getsize(path)]
+    if not paths:
+        return None
+    shutil.rmtree(store_path, ignore_errors=True)
+    try:
+        convert_jsonl_to_store(paths, store_path, model=model, dimension=dimension)
+    except ValueError as e: # Also covers a line cut short by an interrupted run
+        print(f"Warning: Couldn't read the previous JSONL backup {paths}: {e}")
+        shutil.rmtree(store_path, ignore_errors=True)
+        return None
+    return EmbeddingStore(store_path)
+
+
+class StoreBackupSink:
+    """Appends embedded documents to a binary embedding store."""
+
+    def __init__(self, path: str, model: str, dimension: int, dtype: str = "float32"):
+        self.path = path
+        self._writer = EmbeddingStoreWriter(path, model, dimension, dtype=dtype)
+
+    @property
+    def count(self):
+        return self._writer.count
+
+    def write(self, documents: list):
+        self._writer.append(documents)
+
+    def close(self):
+        self._writer.close()
+
+
+# --- Stage Accounting ---
+class StageStats:
+    """Counts items through one stage and the time the stage spent working (not waiting)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.failed = 0
+        self.skipped = 0 # Unchanged since the last upload (incremental runs only)
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+
+    def record(self, items: int, seconds: float, failed: int = 0, skipped: int = 0):
+        self.items += items
+        self.failed += failed
+        self.skipped += skipped
+        self.busy_seconds += seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        """Throughput while busy, i.e. what this stage could sustain if never starved."""
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def summary(self) -> str:
+        wall = (self.finished_at or time.time()) - (self.started_at or time.time())
+        return (f"{self.name:<8} {self.items:>8} ok {self.failed:>6} failed | "
+                f"busy {self.busy_seconds:8.2f}s ({self.rows_per_second:9.1f} rows/s) | wall {wall:8.2f}s"
+                + (f" | {self.skipped} unchanged" if self.skipped else ""))
+
+
+class PipelineReport:
+    """Outcome of one pipeline run."""
+
+    def __init__(self, stages: dict, elapsed_seconds: float, seen_ids=None, complete_scan: bool = False):
+        self.stages = stages
+        self.elapsed_seconds = elapsed_seconds
+        self.seen_ids = seen_ids or set() # Every movie_id in the source, changed or not
+        self.complete_scan = complete_scan # True if the whole source file was read
+
+    @property
+    def rows_read(self):
+        read = self.stages["read"]
+        return read.items + read.failed # Kept plus dropped (missing required columns)
+
+    @property
+    def embedded(self):
+        return self.stages["embed"].items
+
+    @property
+    def uploaded(self):
+        return self.stages["upload"].items
+
+    @property
+    def unchanged(self):
+        return self.stages["prepare"].skipped
+
+    @property
+    def failed(self):
+        return sum(stage.failed for stage in self.stages.values())
+
+    def print_summary(self):
+        print(f"\nPipeline finished in {self.elapsed_seconds:.2f} seconds "
+              f"({self.rows_read / self.elapsed_seconds if self.elapsed_seconds else 0:.1f} rows/s end to end).")
+        for stage in self.stages.values():
+            print("  " + stage.summary())
+
+
+# --- Pipeline ---
+class IngestionPipeline:
+    """Streams movies_metadata.csv through prepare -> embed -> upload, writing backups as it goes.
+
+    Each stage runs in its own thread, connected by bounded queues, so Ollama keeps embedding
+    the next batch while the previous one uploads. Peak memory is bounded by the CSV chunk
+    size plus `queue_size` batches per queue, independent of the catalog size.
+
+    embed_fn(texts) must return a list aligned with `texts` (None entries mark per-item
+    failures) or None if the whole batch failed. upload_fn(documents) must return the keys
+    that were uploaded successfully.
+
+    With a `manifest` (see ingest_manifest.py), documents whose content hash matches the
+    last successful upload are skipped, and each successful upload batch is recorded as it
+    completes. Skipped documents are copied into the backup sinks from `carry_over_stores`
+    (previous runs' EmbeddingStores, searched in order) when their stored text still
+    matches, so the new backup stays a complete snapshot without re-embedding.
+    """
+
+    def __init__(self, embed_fn, upload_fn, sinks=(), dimension: int = None,
+                 csv_chunk_size: int = CSV_CHUNK_SIZE, embed_batch_size: int = EMBED_BATCH_SIZE,
+                 upload_batch_size: int = UPLOAD_BATCH_SIZE, queue_size: int = QUEUE_SIZE,
+                 columns_to_read=COLUMNS_TO_READ, columns_to_embed=COLUMNS_TO_EMBED,
+                 required_columns=REQUIRED_COLUMNS, progress_interval: float = 10.0,
+                 manifest=None, carry_over_stores=(), skip_unchanged: bool = True):
+        self.embed_fn = embed_fn
+        self.upload_fn = upload_fn
+        self.sinks = list(sinks)
+        self.dimension = dimension
+        self.csv_chunk_size = csv_chunk_size
+        self.embed_batch_size = embed_batch_size
+        self.upload_batch_size = upload_batch_size
+        self.queue_size = queue_size
+        self.columns_to_read = columns_to_read
+        self.columns_to_embed = columns_to_embed
+        self.required_columns = required_columns
+        self.progress_interval = progress_interval
+        self.manifest = manifest
+        self.carry_over_stores = list(carry_over_stores)
+        self.skip_unchanged = skip_unchanged
+
+        self.seen_ids = set()
+        self.carried_over = 0
+        self.carry_over_missing = 0
+        self._carry_over_columns = {} # store index -> text columns as lists, loaded on first use
+        self._pending_hashes = {} # movie_id -> content hash, from prepare until the upload succeeds
+        self._complete_scan = False
+        self.stages = {name: StageStats(name) for name in ("read", "prepare", "embed", "upload", "backup")}
+        self._errors = []
+        self._stop = threading.Event()
+
+    # --- Queue helpers that give up promptly once another stage has failed ---
+    def _put(self, q: queue.Queue, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _run_stage(self, name: str, target, *args):
+        stats = self.stages[name]
+        stats.started_at = time.time()
+        try:
+            target(*args)
+        except Exception as e:
+            print(f"Error: Pipeline stage '{name}' failed: {e}")
+            self._errors.append((name, e))
+            self._stop.set()
+        finally:
+            stats.finished_at = time.time()
+
+    # --- Stages ---
+    def _carry_over(self, unchanged: list) -> list:
+        """Builds backup documents for unchanged rows from the previous stores' vectors."""
+        documents = []
+        for meta, digest in unchanged:
+            for store_index, store in enumerate(self.carry_over_stores):
+                row = store.row_of(meta["movie_id"])
+                if row is None:
+                    continue
+                if store_index not in self._carry_over_columns:
+                    self._carry_over_columns[store_index] = {
+                        field: store.column(field) for field in ("title", "overview", "tagline", "genres")
+                    }
+                columns = self._carry_over_columns[store_index]
+                # Only reuse a stored vector if it was embedded from exactly this text
+                stored_text = combine_text({field: values[row] for field, values in columns.items()}, self.columns_to_embed)
+                if self.manifest.hash(stored_text) == digest:
+                    documents.append({**meta, "embedding": np.asarray(store.vectors[row], dtype=np.float32).tolist()})
+                    break
+            else:
+                self.carry_over_missing += 1
+        self.carried_over += len(documents)
+        return documents
+
+    def _filter_unchanged(self, texts: list, metadata: list, backup_queue: queue.Queue):
+        """Drops documents whose content matches the manifest; returns what still needs embedding."""
+        ids = [meta["movie_id"] for meta in metadata]
+        digests = [self.manifest.hash(text) for text in texts]
+        self.seen_ids.update(ids)
+        known = self.manifest.lookup(ids) if self.skip_unchanged else {}
+        changed_texts, changed_metadata, unchanged = [], [], []
+        for text, meta, digest in zip(texts, metadata, digests):
+            if known.get(meta["movie_id"]) == digest:
+                unchanged.append((meta, digest))
+                continue
+            self._pending_hashes[meta["movie_id"]] = digest
+            changed_texts.append(text)
+            changed_metadata.append(meta)
+        if unchanged and self.sinks:
+            documents = self._carry_over(unchanged)
+            if documents:
+                self._put(backup_queue, documents)
+        return changed_texts, changed_metadata, len(unchanged)
+
+    def _read_and_prepare(self, file_path: str, nrows, embed_queue: queue.Queue, backup_queue: queue.Queue):
+        read_stats, prepare_stats = self.stages["read"], self.stages["prepare"]
+        prepare_stats.started_at = time.time() # Prepare shares the reader's thread
+        texts, metadata = [], []
+        raw_rows = 0 # Rows read from the file, before dropping incomplete ones
+        reader = pd.read_csv(
+            file_path,
+            usecols=self.columns_to_read,
+            nrows=None if nrows is None else nrows + 1, # One row past the limit shows whether the file goes on
+            dtype={'id': str}, # Keep ID as string
+            chunksize=self.csv_chunk_size,
+            on_bad_lines='warn'
+        )
+        while not self._stop.is_set():
+            start = time.time()
+            chunk = next(reader, None)
+            if chunk is None:
+                # End of file within the limit: the whole file was read, so IDs missing from it were removed
+                self._complete_scan = True
+                break
+            if nrows is not None and raw_rows + len(chunk) > nrows:
+                chunk = chunk.iloc[:nrows - raw_rows] # The lookahead row is only a marker; don't process it
+                past_limit = True
+            else:
+                past_limit = False
+            rows_in_chunk = len(chunk)
+            raw_rows += rows_in_chunk
+            if self.required_columns:
+                chunk = chunk.dropna(subset=self.required_columns, how='any')
+            read_stats.record(len(chunk), time.time() - start, failed=rows_in_chunk - len(chunk))
+
+            start = time.time()
+            chunk_texts, chunk_metadata = [], []
+            prepare_failed = 0
+            for row_tuple in chunk.itertuples(index=False, name='MovieRow'):
+                combined_text, meta = prepare_text_and_metadata(row_tuple, self.columns_to_embed)
+                if not (combined_text and meta and meta.get("movie_id")):
+                    prepare_failed += 1
+                    continue
+                chunk_texts.append(combined_text)
+                chunk_metadata.append(meta)
+            prepared, unchanged = len(chunk_texts), 0
+            if self.manifest is not None:
+                chunk_texts, chunk_metadata, unchanged = self._filter_unchanged(chunk_texts, chunk_metadata, backup_queue)
+            prepare_stats.record(prepared - unchanged, time.time() - start, failed=prepare_failed, skipped=unchanged)
+
+            texts.extend(chunk_texts)
+            metadata.extend(chunk_metadata)
+            while len(texts) >= self.embed_batch_size:
+                self._put(embed_queue, (texts[:self.embed_batch_size], metadata[:self.embed_batch_size]))
+                texts, metadata = texts[self.embed_batch_size:], metadata[self.embed_batch_size:]
+            if past_limit:
+                break # More rows follow the limit, so this is a partial scan (_complete_scan stays False)
+
+        if texts:
+            self._put(embed_queue, (texts, metadata))
+        prepare_stats.finished_at = time.time()
+        self._put(embed_queue, _END)
+
+    def _embed(self, embed_queue: queue.Queue, upload_queue: queue.Queue, backup_queue: queue.Queue):
+        stats = self.stages["embed"]
+        pending = []
+        while True:
+            item = self._get(embed_queue)
+            if item is _END:
+                break
+            texts, metadata = item
+            start = time.time()
+            embeddings = self.embed_fn(texts)
+            documents = []
+            if embeddings is None or len(embeddings) != len(texts):
+                print(f"  Embed: Failed to get embeddings for {len(texts)} items.")
+            else:
+                for embedding, meta in zip(embeddings, metadata):
+                    if isinstance(embedding, list) and (not self.dimension or len(embedding) == self.dimension):
+                        documents.append({**meta, "embedding": embedding})
+                    elif embedding is not None:
+                        print(f"  Warning: Skipping record ID '{meta.get('movie_id')}' due to invalid embedding vector received in batch.")
+            stats.record(len(documents), time.time() - start, failed=len(texts) - len(documents))
+
+            if documents and self.sinks:
+                self._put(backup_queue, documents)
+            pending.extend(documents)
+            if len(pending) >= self.upload_batch_size:
+                self._put(upload_queue, pending)
+                pending = []
+        if pending:
+            self._put(upload_queue, pending)
+        self._put(upload_queue, _END)
+        self._put(backup_queue, _END)
+
+    def _upload(self, upload_queue: queue.Queue):
+        stats = self.stages["upload"]
+        while True:
+            documents = self._get(upload_queue)
+            if documents is _END:
+                break
+            start = time.time()
+            succeeded = self.upload_fn(documents) or []
+            succeeded_count = len(set(succeeded))
+            if self.manifest is not None and succeeded:
+                # Checkpoint: these documents won't be re-embedded if the run is interrupted now
+                self.manifest.mark_uploaded([(key, self._pending_hashes.pop(key)) for key in set(succeeded)
+                                             if key in self._pending_hashes])
+            stats.record(succeeded_count, time.time() - start, failed=len(documents) - succeeded_count)
+
+    def _backup(self, backup_queue: queue.Queue):
+        stats = self.stages["backup"]
+        while True:
+            documents = self._get(backup_queue)
+            if documents is _END:
+                break
+            start = time.time()
+            for sink in self.sinks:
+                sink.write(documents)
+            stats.record(len(documents), time.time() - start)
+
+    def _print_progress(self, started_at: float):
+        elapsed = time.time() - started_at
+        read, embed, upload = self.stages["read"], self.stages["embed"], self.stages["upload"]
+        print(f"  [{elapsed:7.1f}s] read {read.items} | embedded {embed.items} "
+              f"({embed.items / elapsed if elapsed else 0:.1f}/s) | uploaded {upload.items} "
+              f"({upload.items / elapsed if elapsed else 0:.1f}/s) | failed {sum(s.failed for s in self.stages.values())}")
+
+    def run(self, file_path: str, nrows: int = None) -> PipelineReport:
+        """Runs the pipeline to completion and returns per-stage statistics.
+
+        Raises RuntimeError if any stage failed (after the others have shut down).
+        """
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        upload_queue = queue.Queue(maxsize=self.queue_size)
+        backup_queue = queue.Queue(maxsize=self.queue_size)
+        started_at = time.time()
+        threads = [
+            threading.Thread(target=self._run_stage, args=("read", self._read_and_prepare, file_path, nrows, embed_queue, backup_queue), name="ingest-read"),
+            threading.Thread(target=self._run_stage, args=("embed", self._embed, embed_queue, upload_queue, backup_queue), name="ingest-embed"),
+            threading.Thread(target=self._run_stage, args=("upload", self._upload, upload_queue), name="ingest-upload"),
+            threading.Thread(target=self._run_stage, args=("backup", self._backup, backup_queue), name="ingest-backup"),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(timeout=self.progress_interval)
+                if any(thread.is_alive() for thread in threads):
+                    self._print_progress(started_at)
+        except KeyboardInterrupt:
+            print("Interrupted: stopping pipeline stages...")
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            raise
+        finally:
+            for sink in self.sinks:
+                sink.close()
+
+        report = PipelineReport(self.stages, time.time() - started_at,
+                                seen_ids=self.seen_ids, complete_scan=self._complete_scan and not self._errors)
+        if self.manifest is not None and self.sinks and self.carry_over_missing:
+            print(f"Warning: {self.carry_over_missing} unchanged documents had no matching vector in the previous backup "
+                  f"and are missing from this run's backup. Run with a full re-index to rebuild it.")
+        if self._errors:
+            stage, error = self._errors[0]
+            raise RuntimeError(f"Ingestion pipeline stage '{stage}' failed: {error}") from error
+        return report
+
+
+def run_ingestion_pipeline(file_path: str, embed_fn, upload_fn, nrows: int = None, **kwargs) -> PipelineReport:
+    """Convenience wrapper: builds an IngestionPipeline and runs it over `file_path`."""
+    return IngestionPipeline(embed_fn, upload_fn, **kwargs).run(file_path, nrows=nrows)
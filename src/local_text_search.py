@@ -0,0 +1,321 @@
+import argparse
+import glob
+import json
+import math
+import re
+import time
+from array import array
+
+import numpy as np
+
+from local_vector_search import top_k_indices
+
+# --- Configuration Defaults ---
+TEXT_FIELDS = ("title", "overview", "tagline", "genres")
+RESULT_FIELDS = ("movie_id", "title", "overview", "tagline", "genres")
+# Title matches count double, loosely mirroring a scoring profile that boosts the title field
+DEFAULT_FIELD_WEIGHTS = {"title": 2.0, "overview": 1.0, "tagline": 1.0, "genres": 1.0}
+BM25_K1 = 1.2 # Same defaults as Azure AI Search's BM25 similarity
+BM25_B = 0.75
+RRF_K = 60 # Rank constant Azure AI Search uses for hybrid Reciprocal Rank Fusion
+HYBRID_KEYWORD_CANDIDATES = 50 # Azure's text leg contributes up to 50 results to hybrid fusion
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i in is it its me my of on or our she
+so than that the their them then there these they this to was we were what which who will with
+you your about some
+""".split())
+
+
+def tokenize(text: str, stopwords=STOPWORDS) -> list:
+    """Lower-cases and splits text on non-word characters, dropping common English stopwords."""
+    if not text:
+        return []
+    return [token for token in _TOKEN_PATTERN.findall(str(text).casefold()) if token not in stopwords]
+
+
+# --- Compact String Columns ---
+# Metadata is stored as one UTF-8 blob per field plus offsets, avoiding pickled object arrays
+def _pack_strings(values) -> tuple:
+    blob = bytearray()
+    offsets = array("q", [0])
+    present = array("b")
+    for value in values:
+        if value is None:
+            present.append(0)
+        else:
+            blob.extend(str(value).encode("utf-8"))
+            present.append(1)
+        offsets.append(len(blob))
+    return np.frombuffer(bytes(blob), dtype=np.uint8), np.asarray(offsets, dtype=np.int64), np.asarray(present, dtype=np.bool_)
+
+
+def _unpack_strings(blob: np.ndarray, offsets: np.ndarray, present: np.ndarray) -> list:
+    raw = blob.tobytes()
+    return [
+        raw[offsets[i]:offsets[i + 1]].decode("utf-8") if present[i] else None
+        for i in range(len(present))
+    ]
+
+
+class BM25Index:
+    """In-process BM25 keyword index over the movie text fields.
+
+    Postings are stored CSR-style: for term t, `doc_ids[offsets[t]:offsets[t+1]]` lists the
+    documents containing it and `term_freqs` their field-weighted term frequency. A query
+    only touches the postings of its own terms, so scoring cost depends on how many
+    documents match rather than the catalog size.
+    """
+
+    def __init__(self, vocabulary: dict, offsets, doc_ids, term_freqs, doc_lengths, metadata: dict,
+                 k1: float = BM25_K1, b: float = BM25_B, source: str = ""):
+        self.vocabulary = vocabulary # term -> term id
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.metadata = metadata # field name -> list of values, aligned with document ids
+        self.k1 = k1
+        self.b = b
+        self.source = source # Fingerprint of the data the index was built from ("" if unknown)
+        self.count = len(doc_lengths)
+        self.average_length = float(doc_lengths.mean()) if self.count else 0.0
+
+    # --- Building ---
+    @classmethod
+    def build(cls, documents, field_weights: dict = None, k1: float = BM25_K1, b: float = BM25_B):
+        """Builds the index from metadata dicts as produced by `prepare_text_and_metadata`.
+
+        Documents with a duplicate `movie_id` are skipped (first one wins).
+        """
+        field_weights = field_weights or DEFAULT_FIELD_WEIGHTS
+        vocabulary = {}
+        posting_terms = array("i")
+        posting_docs = array("i")
+        posting_freqs = array("f")
+        doc_lengths = array("f")
+        metadata = {field: [] for field in RESULT_FIELDS}
+        seen_ids = set()
+
+        for document in documents:
+            movie_id = document.get("movie_id")
+            if movie_id is None or movie_id in seen_ids:
+                continue
+            seen_ids.add(movie_id)
+            doc_id = len(doc_lengths)
+
+            weighted_counts = {}
+            length = 0.0
+            for field in TEXT_FIELDS:
+                weight = field_weights.get(field, 1.0)
+                for token in tokenize(document.get(field)):
+                    weighted_counts[token] = weighted_counts.get(token, 0.0) + weight
+                    length += weight
+            for token, frequency in weighted_counts.items():
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                posting_terms.append(term_id)
+                posting_docs.append(doc_id)
+                posting_freqs.append(frequency)
+            doc_lengths.append(length)
+            for field in RESULT_FIELDS:
+                metadata[field].append(document.get(field))
+
+        # Group postings by term (stable, so doc ids stay ascending within each term)
+        terms = np.frombuffer(posting_terms, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(
+            vocabulary,
+            offsets,
+            np.frombuffer(posting_docs, dtype=np.int32)[order],
+            np.frombuffer(posting_freqs, dtype=np.float32)[order],
+            np.frombuffer(doc_lengths, dtype=np.float32).copy(),
+            metadata,
+            k1=k1,
+            b=b,
+        )
+
+    @classmethod
+    def from_jsonl(cls, paths, **kwargs):
+        """Builds the index from processed embedding JSONL files (only the metadata fields are read)."""
+        if isinstance(paths, str):
+            paths = [paths]
+        files = sorted({f for pattern in paths for f in glob.glob(pattern)})
+        if not files:
+            raise FileNotFoundError(f"No files matched {paths}")
+
+        def documents():
+            for filename in files:
+                with open(filename, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            yield {field: record.get(field) for field in RESULT_FIELDS}
+        return cls.build(documents(), **kwargs)
+
+    # --- Persistence ---
+    def save(self, path: str, source: str = None):
+        """Writes the index to a single uncompressed .npz file.
+
+        `source` (default: the index's own) is stored alongside, so a loader can tell whether
+        the saved index still matches the documents it was built from.
+        """
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        arrays = {
+            "offsets": self.offsets,
+            "doc_ids": self.doc_ids,
+            "term_freqs": self.term_freqs,
+            "doc_lengths": self.doc_lengths,
+            "params": np.asarray([self.k1, self.b], dtype=np.float64),
+            "source": np.frombuffer((self.source if source is None else source).encode("utf-8"), dtype=np.uint8),
+        }
+        arrays["terms_blob"], arrays["terms_offsets"], _ = _pack_strings(terms)
+        for field in RESULT_FIELDS:
+            arrays[f"{field}_blob"], arrays[f"{field}_offsets"], arrays[f"{field}_present"] = _pack_strings(self.metadata[field])
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads an index written by `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            term_offsets = data["terms_offsets"]
+            terms = _unpack_strings(data["terms_blob"], term_offsets, np.ones(len(term_offsets) - 1, dtype=np.bool_))
+            metadata = {
+                field: _unpack_strings(data[f"{field}_blob"], data[f"{field}_offsets"], data[f"{field}_present"])
+                for field in RESULT_FIELDS
+            }
+            k1, b = data["params"]
+            source = data["source"].tobytes().decode("utf-8") if "source" in data else "" # Older files have none
+            return cls(
+                {term: term_id for term_id, term in enumerate(terms)},
+                data["offsets"],
+                data["doc_ids"],
+                data["term_freqs"],
+                data["doc_lengths"],
+                metadata,
+                k1=float(k1),
+                b=float(b),
+                source=source,
+            )
+
+    # --- Querying ---
+    def score(self, query: str) -> tuple:
+        """Returns (candidate doc ids, BM25 scores) for every document matching at least one query term."""
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        candidate_docs = []
+        contributions = []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end]
+            document_frequency = end - start
+            idf = math.log(1.0 + (self.count - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[docs] / (self.average_length or 1.0)) # 0.0 when no document has tokens
+            candidate_docs.append(docs)
+            contributions.append(idf * freqs * (self.k1 + 1.0) / (freqs + norm))
+
+        # Sum per-term contributions over the candidate set only
+        docs = np.concatenate(candidate_docs)
+        unique_docs, positions = np.unique(docs, return_inverse=True)
+        scores = np.bincount(positions, weights=np.concatenate(contributions)).astype(np.float32)
+        return unique_docs, scores
+
+    def row(self, doc_id: int, score: float) -> dict:
+        row = {field: self.metadata[field][doc_id] for field in RESULT_FIELDS}
+        row["@search.score"] = float(score)
+        return row
+
+    def search(self, query: str, k: int = 5) -> tuple:
+        """Returns (top-k result rows, total number of matching documents)."""
+        docs, scores = self.score(query)
+        best = top_k_indices(scores, k)
+        return [self.row(docs[i], scores[i]) for i in best], len(docs)
+
+
+# --- Reciprocal Rank Fusion ---
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> list:
+    """Fuses ranked lists of keys into one list of (key, rrf_score), best first.
+
+    Each key scores sum(1 / (k + rank)) over the lists it appears in (rank starts at 1),
+    the same formula Azure AI Search applies to hybrid queries.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_search(keyword_rows: list, vector_rows: list, k: int = 5) -> tuple:
+    """Merges keyword and vector result rows with RRF.
+
+    Returns (top-k rows with fused `@search.score`, number of distinct documents across both legs).
+    """
+    rows_by_id = {}
+    for row in list(vector_rows) + list(keyword_rows):
+        rows_by_id.setdefault(row["movie_id"], row)
+    fused = reciprocal_rank_fusion([
+        [row["movie_id"] for row in keyword_rows],
+        [row["movie_id"] for row in vector_rows],
+    ])
+    results = []
+    for movie_id, rrf_score in fused[:k]:
+        row = dict(rows_by_id[movie_id])
+        row["@search.score"] = rrf_score
+        results.append(row)
+    return results, len(fused)
+
+
+# --- Command Line: build, save and benchmark ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and benchmark the local BM25 keyword index.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="Path to movies_metadata.csv (the ingestion source).")
+    source.add_argument("--jsonl", nargs="+", help="Processed embedding JSONL files or glob patterns.")
+    source.add_argument("--index", help="Load a previously saved .npz index instead of building one.")
+    parser.add_argument("--nrows", type=int, default=None, help="Only read the first N CSV rows.")
+    parser.add_argument("--out", help="Save the built index to this .npz path.")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of benchmark queries to run.")
+    parser.add_argument("-k", type=int, default=10, help="Results per query.")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.index:
+        index = BM25Index.load(args.index)
+        print(f"Loaded index with {index.count} documents in {time.time() - start:.2f} seconds.")
+    else:
+        if args.csv:
+            from movie_documents import iter_movie_documents
+            index = BM25Index.build(metadata for _, metadata in iter_movie_documents(args.csv, nrows=args.nrows))
+        else:
+            index = BM25Index.from_jsonl(args.jsonl)
+        print(f"Built index: {index.count} documents, {len(index.vocabulary)} terms, "
+              f"{len(index.doc_ids)} postings in {time.time() - start:.2f} seconds.")
+    if args.out:
+        save_start = time.time()
+        index.save(args.out)
+        print(f"Saved index to {args.out} in {time.time() - save_start:.2f} seconds.")
+
+    # Queries: a few hand-written ones plus titles sampled from the catalog
+    rng = np.random.default_rng(0)
+    titles = [title for title in index.metadata["title"] if title]
+    queries = [
+        "lonely robot cleaning up a polluted earth",
+        "philosophical look at artificial intelligence in space",
+        "movies about charming thieves who pull off a big heist",
+        "dystopian future where society is divided into factions",
+    ]
+    queries += [titles[i] for i in rng.integers(0, len(titles), size=max(0, args.queries - len(queries)))]
+
+    latencies = []
+    for query in queries:
+        query_start = time.perf_counter()
+        index.search(query, k=args.k)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"Ran {len(queries)} queries: p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms.")
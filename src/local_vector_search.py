@@ -0,0 +1,179 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, is_embedding_store
+
+# --- Configuration Defaults ---
+DEFAULT_EMBEDDINGS_GLOB = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "data", "processed", "movie_embeddings_*.jsonl"
+)
+RESULT_FIELDS = ("movie_id", "title", "overview", "tagline", "genres")
+
+
+def cosine_to_search_score(similarity):
+    """Maps cosine similarity to the `@search.score` Azure AI Search reports for cosine vector fields.
+
+    Azure scores cosine matches as 1 / (1 + distance) with distance = 1 - similarity, so local and
+    Azure results are ranked and displayed on the same scale.
+    """
+    return 1.0 / (2.0 - similarity)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalizes each row in place (zero rows are left as zeros) and returns the matrix."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the indices of the k highest scores per row, best first, without a full sort."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < scores.shape[-1]:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[-1]), scores.shape).copy()
+    candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-candidate_scores, axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+class LocalVectorIndex:
+    """Exact in-process cosine search over a contiguous float32 matrix of L2-normalized rows."""
+
+    def __init__(self, vectors: np.ndarray, metadata: dict, model: str = None):
+        # np.memmap rows from a normalized store pass through without being copied
+        self.vectors = vectors if isinstance(vectors, np.memmap) else np.ascontiguousarray(vectors, dtype=np.float32)
+        self.metadata = metadata # field name -> list of values, aligned with matrix rows
+        self.model = model
+        self.count, self.dimension = self.vectors.shape
+
+    @classmethod
+    def from_jsonl(cls, paths, expected_dimension: int = None):
+        """Loads one or more processed embedding JSONL files (glob patterns allowed).
+
+        Records whose vector dimension doesn't match `expected_dimension` (or the first
+        vector seen, if not given) are skipped, so a glob that also matches files from a
+        different model doesn't corrupt the matrix. Duplicate movie IDs keep the first copy.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        files = sorted({f for pattern in paths for f in glob.glob(pattern)})
+        if not files:
+            raise FileNotFoundError(f"No embedding files matched {paths}")
+
+        rows = []
+        metadata = {field: [] for field in RESULT_FIELDS}
+        seen_ids = set()
+        skipped = 0
+        dimension = expected_dimension
+        for filename in files:
+            with open(filename, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    embedding = record.get("embedding")
+                    movie_id = record.get("movie_id")
+                    if not isinstance(embedding, list) or movie_id is None:
+                        skipped += 1
+                        continue
+                    if dimension is None:
+                        dimension = len(embedding)
+                    if len(embedding) != dimension or movie_id in seen_ids:
+                        skipped += 1
+                        continue
+                    seen_ids.add(movie_id)
+                    rows.append(np.asarray(embedding, dtype=np.float32))
+                    for field in RESULT_FIELDS:
+                        metadata[field].append(record.get(field))
+
+        if not rows:
+            raise ValueError(f"No embeddings with dimension {dimension} found in {files}")
+        if skipped:
+            print(f"Warning: Skipped {skipped} records (dimension mismatch, duplicate ID or missing embedding).")
+        vectors = normalize_rows(np.vstack(rows))
+        return cls(vectors, metadata)
+
+    @classmethod
+    def from_store(cls, path: str, expected_dimension: int = None):
+        """Loads a binary embedding store (see embedding_store.py).
+
+        A normalized float32 store is searched straight from the memory map with no copy;
+        anything else is converted and normalized into RAM once.
+        """
+        store = EmbeddingStore(path)
+        if expected_dimension and store.dimension != expected_dimension:
+            raise ValueError(f"Store '{path}' has dimension {store.dimension}, expected {expected_dimension}.")
+        if store.normalized and store.dtype == "float32":
+            vectors = store.vectors
+        else:
+            vectors = normalize_rows(np.array(store.vectors, dtype=np.float32))
+        metadata = {field: store.column(field) for field in RESULT_FIELDS}
+        return cls(vectors, metadata, model=store.model)
+
+    @classmethod
+    def from_path(cls, path: str, expected_dimension: int = None):
+        """Loads from a store directory if `path` is one, otherwise treats it as JSONL file(s)/glob."""
+        if is_embedding_store(path):
+            return cls.from_store(path, expected_dimension)
+        return cls.from_jsonl(path, expected_dimension)
+
+    def _rows_for(self, indices, similarities) -> list:
+        results = []
+        for doc_index, similarity in zip(indices, similarities):
+            row = {field: self.metadata[field][doc_index] for field in RESULT_FIELDS}
+            row["@search.score"] = float(cosine_to_search_score(similarity))
+            results.append(row)
+        return results
+
+    def search_batch(self, query_vectors, k: int = 5) -> list:
+        """Returns the top-k result rows for each query vector using one matrix product per batch."""
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        if queries.shape[1] != self.dimension:
+            raise ValueError(f"Query dimension {queries.shape[1]} does not match index dimension {self.dimension}.")
+        queries = normalize_rows(queries.copy())
+        similarities = queries @ self.vectors.T # (queries, documents)
+        best = top_k_indices(similarities, k)
+        best_similarities = np.take_along_axis(similarities, best, axis=-1)
+        return [self._rows_for(best[i], best_similarities[i]) for i in range(len(queries))]
+
+    def search(self, query_vector, k: int = 5) -> list:
+        """Returns the top-k result rows for a single query vector."""
+        return self.search_batch([query_vector], k)[0]
+
+
+# --- Command Line: quick load/latency check ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load processed embeddings and measure local exact vector search latency.")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_EMBEDDINGS_GLOB], help="JSONL files, glob patterns or one embedding store directory.")
+    parser.add_argument("--dimension", type=int, default=None, help="Only load vectors of this dimension.")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of random queries to run.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Queries per matrix product.")
+    parser.add_argument("-k", type=int, default=10, help="Results per query.")
+    args = parser.parse_args()
+
+    load_start = time.time()
+    if len(args.paths) == 1 and is_embedding_store(args.paths[0]):
+        index = LocalVectorIndex.from_store(args.paths[0], expected_dimension=args.dimension)
+    else:
+        index = LocalVectorIndex.from_jsonl(args.paths, expected_dimension=args.dimension)
+    print(f"Loaded {index.count} vectors (dim {index.dimension}) in {time.time() - load_start:.2f} seconds.")
+
+    rng = np.random.default_rng(0)
+    queries = index.vectors[rng.integers(0, index.count, size=args.queries)]
+    search_start = time.time()
+    for start in range(0, len(queries), args.batch_size):
+        index.search_batch(queries[start:start + args.batch_size], k=args.k)
+    elapsed = time.time() - search_start
+    print(f"Ran {len(queries)} queries in {elapsed:.3f} seconds ({elapsed / len(queries) * 1000:.3f} ms/query, batch size {args.batch_size}).")
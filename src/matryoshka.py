@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from local_vector_search import DEFAULT_EMBEDDINGS_GLOB, LocalVectorIndex, normalize_rows, top_k_indices
+
+# --- Configuration ---
+# Keep only the first N dimensions of every embedding (e.g. 256 or 512 for nomic-embed-text,
+# which is trained for it). Unset means full-size vectors, i.e. VECTOR_DIMENSION.
+DIMENSION_ENV = "MATRYOSHKA_DIMENSION"
+
+
+def matryoshka_dimension(native_dimension: int = None):
+    """Reduced dimension from MATRYOSHKA_DIMENSION, or None to keep full vectors.
+
+    Raises ValueError if it isn't a positive integer no larger than the model's native dimension.
+    """
+    value = os.getenv(DIMENSION_ENV)
+    if not value:
+        return None
+    try:
+        dimension = int(value)
+    except ValueError:
+        raise ValueError(f"{DIMENSION_ENV} ('{value}') is not a valid integer.") from None
+    if dimension <= 0 or (native_dimension and dimension > native_dimension):
+        raise ValueError(f"{DIMENSION_ENV} ({dimension}) must be between 1 and the model's dimension ({native_dimension}).")
+    return None if dimension == native_dimension else dimension
+
+
+def truncate_matrix(matrix, dimension: int) -> np.ndarray:
+    """Matryoshka reduction of each row: layer norm, keep the first `dimension` values, L2-normalize.
+
+    This is nomic-embed-text's recipe. Ollama's vectors are already unit length and the final
+    normalization removes any scale, so the layer norm reduces to subtracting each row's mean.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    truncated = (matrix - matrix.mean(axis=1, keepdims=True))[:, :dimension]
+    return normalize_rows(np.ascontiguousarray(truncated))
+
+
+def truncate_embedding(vector: list, dimension: int) -> list:
+    """Applies `truncate_matrix` to one vector; returns it unchanged if no reduction is configured."""
+    if not dimension or len(vector) <= dimension:
+        return vector
+    return truncate_matrix([vector], dimension)[0].tolist()
+
+
+def load_vector_index(path: str, dimension: int = None, native_dimension: int = None) -> LocalVectorIndex:
+    """Loads a LocalVectorIndex with `dimension`-sized vectors.
+
+    Backups written before MATRYOSHKA_DIMENSION was set hold `native_dimension` vectors;
+    if no vectors of `dimension` are found, those are truncated on load, the same way
+    query vectors are.
+    """
+    try:
+        return LocalVectorIndex.from_path(path, expected_dimension=dimension)
+    except ValueError:
+        if not dimension or not native_dimension or native_dimension <= dimension:
+            raise
+    index = LocalVectorIndex.from_path(path, expected_dimension=native_dimension)
+    print(f"Truncating {index.count} local vectors from {native_dimension} to {dimension} dimensions ({DIMENSION_ENV}). "
+          f"Re-run ingestion to store them truncated.")
+    return LocalVectorIndex(truncate_matrix(index.vectors, dimension), index.metadata, model=index.model)
+
+
+def compare_recall(vectors: np.ndarray, dimensions, k: int = 10, queries: int = 1000, seed: int = 0) -> list:
+    """recall@k of truncated vectors against the full-dimension neighbours, using documents as queries.
+
+    Each sampled document is a query and is left out of its own results, so the comparison
+    needs no query log. Also reports per-vector storage and JSON upload size.
+    """
+    rng = np.random.default_rng(seed)
+    full = np.asarray(vectors, dtype=np.float32)
+    query_rows = np.sort(rng.choice(len(full), min(queries, len(full)), replace=False))
+    k = min(k, len(full) - 1)
+
+    def neighbours(matrix):
+        found = []
+        for start in range(0, len(query_rows), 256):
+            rows = query_rows[start:start + 256]
+            scores = matrix[rows] @ matrix.T
+            scores[np.arange(len(rows)), rows] = -np.inf # Leave the query document out
+            found.append(top_k_indices(scores, k))
+        return np.vstack(found)
+
+    start = time.time()
+    truth = neighbours(full)
+    full_ms = (time.time() - start) / len(query_rows) * 1000
+    report = [{"dimension": full.shape[1], "recall": 1.0, "ms_per_query": full_ms,
+               "vector_bytes": full.shape[1] * 4, "json_bytes": len(json.dumps(full[0].tolist()))}]
+    for dimension in sorted(d for d in dimensions if d < full.shape[1]):
+        reduced = truncate_matrix(full, dimension)
+        start = time.time()
+        found = neighbours(reduced)
+        elapsed_ms = (time.time() - start) / len(query_rows) * 1000
+        hits = sum(len(np.intersect1d(a, b)) for a, b in zip(found, truth))
+        report.append({"dimension": dimension, "recall": hits / truth.size, "ms_per_query": elapsed_ms,
+                       "vector_bytes": dimension * 4, "json_bytes": len(json.dumps(reduced[0].tolist()))})
+    return report
+
+
+# --- Command Line: recall of reduced dimensions on the processed datasets ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare nearest neighbours of truncated embeddings against full-size ones.")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_EMBEDDINGS_GLOB], help="JSONL files, glob patterns or one embedding store directory.")
+    parser.add_argument("--dimension", type=int, default=None, help="Only load vectors of this (full) dimension.")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[128, 256, 512], help="Reduced dimensions to compare.")
+    parser.add_argument("-k", type=int, default=10, help="Neighbours compared per query.")
+    parser.add_argument("--queries", type=int, default=1000, help="Documents sampled as queries.")
+    args = parser.parse_args()
+
+    if len(args.paths) == 1:
+        index = LocalVectorIndex.from_path(args.paths[0], expected_dimension=args.dimension)
+    else:
+        index = LocalVectorIndex.from_jsonl(args.paths, expected_dimension=args.dimension)
+    print(f"Loaded {index.count} vectors (dim {index.dimension}, model {index.model or 'unknown'}).")
+    for row in compare_recall(index.vectors, args.dimensions, k=args.k, queries=args.queries):
+        print(f"dim {row['dimension']:>5}  recall@{args.k}={row['recall']:.3f}  "
+              f"{row['vector_bytes']:>5} B/vector (float32), ~{row['json_bytes']:>6} B/vector in upload JSON  "
+              f"{row['ms_per_query']:.3f} ms/query (exact)")
@@ -0,0 +1,119 @@
+import ast
+
+import pandas as pd
+
+# --- Source Columns ---
+# Columns read from movies_metadata.csv and the subset combined into the text that gets embedded
+COLUMNS_TO_READ = ['id', 'title', 'overview', 'genres', 'tagline']
+COLUMNS_TO_EMBED = ['title', 'overview', 'genres', 'tagline']
+
+
+# --- Text Preparation Helpers ---
+def combine_text(metadata: dict, columns_to_embed=COLUMNS_TO_EMBED) -> str:
+    """Builds the text that gets embedded from a document's cleaned metadata fields.
+
+    Because it only needs the metadata, the text (and its content hash) can be rebuilt
+    from any backup or index document, not just from the raw CSV row.
+    """
+    text_parts = []
+    if "title" in columns_to_embed and metadata.get("title"):
+        text_parts.append(f"Title: {metadata['title']}") # Adding labels might help
+    if "overview" in columns_to_embed and metadata.get("overview"):
+        text_parts.append(f"Overview: {metadata['overview']}")
+    if "tagline" in columns_to_embed and metadata.get("tagline"):
+        text_parts.append(f"Tagline: {metadata['tagline']}")
+    if "genres" in columns_to_embed and metadata.get("genres"):
+        text_parts.append(f"Genres: {metadata['genres']}")
+    return " ".join(filter(None, text_parts)).strip()
+
+
+def prepare_text_and_metadata(row_tuple, columns_to_embed=COLUMNS_TO_EMBED):
+    """Prepares combined text and metadata from a row tuple.
+
+    Returns (combined_text, metadata) or (None, None) if the row has no usable ID or text.
+    """
+    movie_id = None
+    try:
+        movie_id_raw = getattr(row_tuple, "id", None)
+        movie_title = getattr(row_tuple, "title", "")
+
+        # Added stricter ID check
+        if pd.isna(movie_id_raw) or str(movie_id_raw).strip() == '': return None, None
+        movie_id = str(movie_id_raw).strip()
+
+        # Handle potential NaN/missing titles robustly
+        if pd.isna(movie_title): movie_title = ""
+        if not isinstance(movie_title, str): movie_title = str(movie_title)
+        movie_title = movie_title.strip()
+
+        genre_names = []
+
+        overview_raw = getattr(row_tuple, "overview", "")
+        overview_cleaned = ""
+        if pd.notna(overview_raw) and str(overview_raw).strip():
+             overview_cleaned = str(overview_raw).strip()
+
+        tagline_raw = getattr(row_tuple, "tagline", "")
+        tagline_cleaned = ""
+        if pd.notna(tagline_raw) and str(tagline_raw).strip():
+             tagline_cleaned = str(tagline_raw).strip()
+
+        genres_cleaned_str = None
+        if "genres" in columns_to_embed:
+            genres_str = getattr(row_tuple, "genres", "[]")
+            if pd.notna(genres_str) and isinstance(genres_str, str) and genres_str.strip() not in ('[]', '{}', ''):
+                try:
+                    # Robust parsing for various possible string formats
+                    potential_list = ast.literal_eval(genres_str)
+                    if isinstance(potential_list, list):
+                        for item in potential_list:
+                            if isinstance(item, dict) and 'name' in item and item['name'] and str(item['name']).strip():
+                                genre_names.append(str(item['name']).strip())
+                            elif isinstance(item, str) and item.strip(): # Handle case where it's just a list of strings
+                                genre_names.append(item.strip())
+                except (ValueError, SyntaxError, TypeError):
+                     # Fallback: Treat as simple comma-separated string if literal_eval fails
+                     if ',' in genres_str:
+                         genre_names.extend([g.strip() for g in genres_str.split(',') if g.strip()])
+                     elif genres_str.strip(): # Treat as a single genre if no commas
+                         genre_names.append(genres_str.strip())
+            if genre_names:
+                genres_cleaned_str = ", ".join(genre_names) # For metadata field
+
+        metadata = {
+            "movie_id": movie_id,
+            # Use cleaned versions or None if empty/NaN originally
+            "title": movie_title if movie_title else None,
+            "overview": overview_cleaned if overview_cleaned else None,
+            "tagline": tagline_cleaned if tagline_cleaned else None,
+            "genres": genres_cleaned_str, # Already joined string or None
+        }
+        combined_text = combine_text(metadata, columns_to_embed)
+        # Ensure we have at least an ID and some text to proceed
+        if not combined_text: return None, None
+        return combined_text, metadata
+
+    except Exception as e:
+        print(f"Error preparing text/metadata for potential ID '{getattr(row_tuple, 'id', 'UNKNOWN')}': {e}")
+        return None, None
+
+
+# --- CSV Reader ---
+def iter_movie_documents(file_path: str, nrows: int = None, chunksize: int = 5000, columns_to_embed=COLUMNS_TO_EMBED):
+    """Streams (combined_text, metadata) pairs from movies_metadata.csv without loading the whole file.
+
+    Rows that `prepare_text_and_metadata` rejects are skipped.
+    """
+    reader = pd.read_csv(
+        file_path,
+        usecols=COLUMNS_TO_READ,
+        nrows=nrows,
+        dtype={'id': str}, # Keep ID as string
+        chunksize=chunksize,
+        on_bad_lines='warn'
+    )
+    for chunk in reader:
+        for row_tuple in chunk.itertuples(index=False, name='MovieRow'):
+            combined_text, metadata = prepare_text_and_metadata(row_tuple, columns_to_embed)
+            if combined_text and metadata:
+                yield combined_text, metadata
@@ -0,0 +1,317 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from matryoshka import truncate_matrix
+
+# --- Configuration Defaults ---
+DEFAULT_ENDPOINT = "http://localhost:11434/api/embed"
+MAX_IN_FLIGHT = 4 # Concurrent requests across all endpoints
+INITIAL_BATCH_SIZE = 32
+MIN_BATCH_SIZE = 4
+MAX_BATCH_SIZE = 256
+MAX_IN_FLIGHT_CHARS = 400_000 # Caps text held by outstanding requests (roughly 100k tokens)
+REQUEST_TIMEOUT = 300 # Seconds
+MAX_RETRIES = 3 # Per batch, for timeouts, connection errors and 5xx/429 responses
+BACKOFF_SECONDS = 1.0 # Base for exponential backoff with jitter
+ENDPOINT_COOLDOWN_SECONDS = 30 # How long an endpoint that refused connections is skipped
+RECORD_ERROR_STATUSES = (400, 413, 422) # Rejections that can come from one bad input, so splitting can isolate it
+
+
+class _BatchSizeTuner:
+    """Hill-climbs the batch size on observed throughput (texts/second).
+
+    Every `window` completed batches it compares throughput with the previous window:
+    if it improved it keeps moving the batch size in the same direction, otherwise it
+    turns around. Timeouts and batches slower than `max_latency` halve the size at once.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, max_latency: float,
+                 window: int = 4, step: float = 1.5, enabled: bool = True):
+        self.size = max(minimum, min(maximum, initial))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_latency = max_latency
+        self.window = window
+        self.step = step
+        self.enabled = enabled
+        self._direction = 1
+        self._last_throughput = None
+        self._lock = threading.Lock()
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_texts = 0
+        self._window_batches = 0
+        self._window_started = time.time()
+
+    def _resize(self, factor: float):
+        self.size = max(self.minimum, min(self.maximum, int(round(self.size * factor)) or 1))
+
+    def record(self, texts: int, latency: float, timed_out: bool = False):
+        """Feeds one completed (or timed-out) request into the tuner."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if timed_out or latency > self.max_latency:
+                self._resize(0.5)
+                self._direction = -1
+                self._last_throughput = None
+                self._reset_window()
+                return
+            self._window_texts += texts
+            self._window_batches += 1
+            if self._window_batches < self.window:
+                return
+            throughput = self._window_texts / max(time.time() - self._window_started, 1e-6)
+            if self._last_throughput is not None and throughput < self._last_throughput * 0.95:
+                self._direction = -self._direction
+            self._last_throughput = throughput
+            self._resize(self.step if self._direction > 0 else 1 / self.step)
+            self._reset_window()
+
+
+class _RetriableError(Exception):
+    """Timeouts, connection failures and overload responses: worth retrying as-is."""
+
+
+class _RecordError(ValueError):
+    """A rejection that may be caused by one of the texts: worth splitting the batch."""
+
+
+class OllamaUnavailableError(RuntimeError):
+    """Ollama can't serve the request at all (down, still overloaded after retries, unknown model...).
+
+    Splitting the batch wouldn't help, so `embed` raises this and the caller's run stops.
+    """
+
+
+class OllamaBatchEmbedder:
+    """Embeds texts through Ollama's /api/embed with several batches in flight.
+
+    `embed(texts)` returns a list aligned with `texts`; entries that couldn't be embedded
+    are None. A batch Ollama rejects as a bad request (400/413/422, or a wrong number of
+    vectors) is split in half recursively, so one bad record costs one document instead of
+    the whole batch. Failures of the whole service (connection errors, timeouts and 429/5xx
+    once retries run out, other 4xx such as an unknown model) raise OllamaUnavailableError
+    instead, since every other batch would fail the same way. Requests are spread over
+    `endpoints` (several Ollama hosts, or one host listed once). Vectors are checked against
+    the model's `dimension`; with `output_dimension` they are then Matryoshka-truncated to it.
+    """
+
+    def __init__(self, endpoints, model: str, dimension: int = None, output_dimension: int = None,
+                 max_in_flight: int = MAX_IN_FLIGHT,
+                 batch_size: int = INITIAL_BATCH_SIZE, min_batch_size: int = MIN_BATCH_SIZE,
+                 max_batch_size: int = MAX_BATCH_SIZE, adaptive: bool = True,
+                 max_in_flight_chars: int = MAX_IN_FLIGHT_CHARS, timeout: float = REQUEST_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, backoff_seconds: float = BACKOFF_SECONDS):
+        if isinstance(endpoints, str):
+            endpoints = [endpoint.strip() for endpoint in endpoints.split(",") if endpoint.strip()]
+        if not endpoints:
+            raise ValueError("At least one Ollama endpoint is required.")
+        self.endpoints = list(endpoints)
+        self.model = model
+        self.dimension = dimension
+        self.output_dimension = output_dimension
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_in_flight_chars = max_in_flight_chars
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.tuner = _BatchSizeTuner(batch_size, min(min_batch_size, batch_size), max(max_batch_size, batch_size),
+                                     max_latency=timeout / 3, enabled=adaptive)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=self.max_in_flight)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="ollama-embed")
+
+        self._lock = threading.Condition()
+        self._in_flight_chars = 0
+        self._in_flight_requests = {endpoint: 0 for endpoint in self.endpoints}
+        self._endpoint_down_until = {endpoint: 0.0 for endpoint in self.endpoints}
+
+        self.requests_sent = 0
+        self.retries = 0
+        self.splits = 0
+        self.failed_texts = 0
+        self.embedded_texts = 0
+
+    @classmethod
+    def from_env(cls, model: str = None, dimension: int = None, output_dimension: int = None):
+        """Creates a client configured from OLLAMA_* environment variables."""
+        return cls(
+            endpoints=os.getenv("OLLAMA_ENDPOINTS") or os.getenv("OLLAMA_ENDPOINT", DEFAULT_ENDPOINT),
+            model=model or os.getenv("OLLAMA_MODEL", "nomic-embed-text"),
+            dimension=dimension,
+            output_dimension=output_dimension,
+            max_in_flight=int(os.getenv("OLLAMA_MAX_IN_FLIGHT", MAX_IN_FLIGHT)),
+            batch_size=int(os.getenv("OLLAMA_BATCH_SIZE", INITIAL_BATCH_SIZE)),
+            min_batch_size=int(os.getenv("OLLAMA_MIN_BATCH_SIZE", MIN_BATCH_SIZE)),
+            max_batch_size=int(os.getenv("OLLAMA_MAX_BATCH_SIZE", MAX_BATCH_SIZE)),
+            adaptive=os.getenv("OLLAMA_ADAPTIVE_BATCH", "true").lower() == "true",
+            max_in_flight_chars=int(os.getenv("OLLAMA_MAX_IN_FLIGHT_CHARS", MAX_IN_FLIGHT_CHARS)),
+            timeout=float(os.getenv("OLLAMA_TIMEOUT", REQUEST_TIMEOUT)),
+            max_retries=int(os.getenv("OLLAMA_MAX_RETRIES", MAX_RETRIES)),
+        )
+
+    # --- Endpoint Selection and In-Flight Budget ---
+    def _acquire(self, chars: int) -> str:
+        """Waits for room in the character budget, then picks the least busy healthy endpoint."""
+        with self._lock:
+            # A single oversized batch may always go alone, otherwise it could never be sent
+            self._lock.wait_for(lambda: self._in_flight_chars == 0
+                                or self._in_flight_chars + chars <= self.max_in_flight_chars)
+            self._in_flight_chars += chars
+            now = time.time()
+            healthy = [endpoint for endpoint in self.endpoints if self._endpoint_down_until[endpoint] <= now]
+            endpoint = min(healthy or self.endpoints, key=lambda endpoint: self._in_flight_requests[endpoint])
+            self._in_flight_requests[endpoint] += 1
+            return endpoint
+
+    def _release(self, endpoint: str, chars: int):
+        with self._lock:
+            self._in_flight_chars -= chars
+            self._in_flight_requests[endpoint] -= 1
+            self._lock.notify_all()
+
+    def _mark_down(self, endpoint: str):
+        if len(self.endpoints) > 1:
+            with self._lock:
+                self._endpoint_down_until[endpoint] = time.time() + ENDPOINT_COOLDOWN_SECONDS
+
+    # --- Requests ---
+    def _post(self, texts: list) -> list:
+        """One /api/embed call.
+
+        Raises _RetriableError for transient failures, _RecordError when a text may be at fault
+        and OllamaUnavailableError when the request as a whole was refused.
+        """
+        chars = sum(len(text) for text in texts)
+        endpoint = self._acquire(chars)
+        start = time.time()
+        outcome = None # "ok" or "timeout"; other failures don't say anything about batch size
+        try:
+            self._count("requests_sent")
+            try:
+                response = self._session.post(endpoint, json={"model": self.model, "input": texts}, timeout=self.timeout)
+            except requests.exceptions.Timeout as e:
+                outcome = "timeout"
+                raise _RetriableError(f"timed out after {self.timeout}s") from e
+            except requests.exceptions.ConnectionError as e:
+                self._mark_down(endpoint)
+                raise _RetriableError(f"could not connect to {endpoint}") from e
+            if response.status_code == 429 or response.status_code >= 500:
+                raise _RetriableError(f"HTTP {response.status_code}: {response.text[:200]}")
+            if response.status_code in RECORD_ERROR_STATUSES:
+                raise _RecordError(f"HTTP {response.status_code}: {response.text[:200]}")
+            if response.status_code >= 400:
+                raise OllamaUnavailableError(f"HTTP {response.status_code} from {endpoint}: {response.text[:200]}")
+            try:
+                embeddings = response.json().get("embeddings")
+            except ValueError as e:
+                raise OllamaUnavailableError(f"invalid JSON response from {endpoint}: {response.text[:200]}") from e
+            if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+                raise _RecordError(f"expected {len(texts)} embeddings, got "
+                                 f"{len(embeddings) if isinstance(embeddings, list) else 'none'}")
+            outcome = "ok"
+            return embeddings
+        finally:
+            if outcome:
+                self.tuner.record(len(texts), time.time() - start, timed_out=outcome == "timeout")
+            self._release(endpoint, chars)
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _embed_batch(self, texts: list, abort: threading.Event) -> list:
+        """Embeds one batch with retries; splits it in half when Ollama rejects its content.
+
+        `abort` is set once another batch of the same `embed` call has failed for good; this
+        batch then stops at its next attempt instead of sitting through its own backoff.
+        """
+        embeddings, error = None, None
+        for attempt in range(self.max_retries + 1):
+            if abort.is_set():
+                raise OllamaUnavailableError("stopped: another batch failed")
+            try:
+                embeddings = self._post(texts)
+                break
+            except _RetriableError as e:
+                if attempt == self.max_retries:
+                    raise OllamaUnavailableError(f"giving up after {self.max_retries + 1} attempts: {e}") from e
+                self._count("retries")
+                abort.wait(self.backoff_seconds * (2 ** attempt) * (0.5 + random.random()))
+            except _RecordError as e:
+                error = e
+                break # Retrying the same payload won't help; split it instead
+
+        if embeddings is None:
+            if len(texts) > 1:
+                self._count("splits")
+                middle = len(texts) // 2
+                return self._embed_batch(texts[:middle], abort) + self._embed_batch(texts[middle:], abort)
+            print(f"  Ollama: Giving up on one text ({len(texts[0])} chars): {error}")
+            self._count("failed_texts")
+            return [None]
+
+        results = [embedding if isinstance(embedding, list) and (not self.dimension or len(embedding) == self.dimension)
+                   else None for embedding in embeddings]
+        valid = [i for i, result in enumerate(results) if result is not None]
+        if self.output_dimension and valid:
+            truncated = truncate_matrix([results[i] for i in valid], self.output_dimension).tolist()
+            for i, vector in zip(valid, truncated):
+                results[i] = vector
+        embedded = sum(result is not None for result in results)
+        self._count("embedded_texts", embedded)
+        self._count("failed_texts", len(results) - embedded)
+        return results
+
+    # --- Public API ---
+    def embed(self, texts: list) -> list:
+        """Embeds `texts` using concurrent batches; returns vectors (or None) aligned with `texts`.
+
+        Raises OllamaUnavailableError as soon as one batch fails in a way splitting can't fix.
+        """
+        results = [None] * len(texts)
+        pending = {}
+        abort = threading.Event()
+        start = 0
+        while start < len(texts) or pending:
+            # Batches are cut as slots free up, so the tuned size takes effect mid-call
+            while start < len(texts) and len(pending) < self.max_in_flight:
+                size = self.tuner.size
+                pending[self._executor.submit(self._embed_batch, texts[start:start + size], abort)] = start
+                start += size
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                offset = pending.pop(future)
+                try:
+                    batch = future.result()
+                except Exception:
+                    abort.set() # Batches still in flight stop instead of retrying
+                    wait(pending)
+                    raise
+                results[offset:offset + len(batch)] = batch
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.tuner.size,
+            "requests": self.requests_sent,
+            "retries": self.retries,
+            "splits": self.splits,
+            "embedded": self.embedded_texts,
+            "failed": self.failed_texts,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._session.close()
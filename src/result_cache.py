@@ -0,0 +1,357 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from embedding_cache import normalize_query_text
+
+# --- Configuration Defaults ---
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "search_results.sqlite3")
+DEFAULT_MEMORY_ITEMS = 256
+DEFAULT_DISK_ITEMS = 10000
+DEFAULT_TTL_SECONDS = 3600 # Results also change when relevance settings do; don't keep them forever
+DEFAULT_VERSION_CHECK_SECONDS = 60 # How often the index fingerprint (e.g. document count) is re-read
+
+
+def make_result_key(query: str, mode: str, top_k: int, model: str, index_name: str, version: str,
+                    dimension: int = None, semantic_configuration: str = None) -> str:
+    """Builds the cache key from everything that determines a result list.
+
+    `dimension` is the query vector's (truncated) dimension and `semantic_configuration` the
+    semantic ranker configuration, since both change results without changing the index.
+    """
+    raw = "\x1f".join((model or "", str(dimension or ""), index_name or "", semantic_configuration or "",
+                       mode, str(top_k), version or "", normalize_query_text(query)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def to_plain_row(row: dict) -> dict:
+    """Copies a search result into JSON-serializable form.
+
+    Semantic captions come back from the SDK as objects; they are stored as
+    {"text", "highlights"} dicts so cached and fresh rows look the same to the UI.
+    """
+    plain = dict(row)
+    captions = plain.get("@search.captions")
+    if captions:
+        plain["@search.captions"] = [
+            caption if isinstance(caption, dict)
+            else {"text": getattr(caption, "text", None), "highlights": getattr(caption, "highlights", None)}
+            for caption in captions
+        ]
+    return plain
+
+
+def local_index_name(embeddings_path: str, ann_index_path: str = None, nprobe: int = None) -> str:
+    """Names the local backend's index in cache keys; approximate results also depend on the ANN index and nprobe."""
+    if ann_index_path:
+        return f"local:{embeddings_path}|ann:{ann_index_path}@{nprobe}"
+    return f"local:{embeddings_path}"
+
+
+def files_fingerprint(*patterns) -> str:
+    """Changes whenever files matching the glob patterns are added, removed or rewritten.
+
+    Directories (embedding stores) count by the files directly inside them. Sizes are
+    included so a rewrite within the same second still shows up.
+    """
+    paths = []
+    for pattern in patterns:
+        for path in glob.glob(pattern) if pattern else []:
+            if os.path.isdir(path):
+                paths.extend(entry.path for entry in os.scandir(path) if entry.is_file())
+            else:
+                paths.append(path)
+    stats = [os.stat(path) for path in paths]
+    return (f"{len(paths)}:{sum(stat.st_size for stat in stats)}"
+            f"@{max((stat.st_mtime for stat in stats), default=0):.3f}")
+
+
+class SearchResultCache:
+    """Two-tier cache of materialized search results: an in-memory LRU in front of SQLite.
+
+    Keys cover the normalized query, search mode, k, embedding model, index and the
+    index's current version, so a changed index never serves old results. The version
+    combines a cheap fingerprint the caller supplies (the index's document count) with a
+    stamp that ingestion bumps after each run; it's re-read at most every
+    `version_check_seconds`. Entries also expire after `ttl_seconds`. Like the embedding
+    cache, the disk tier is shared by every app worker using the same file.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, memory_items: int = DEFAULT_MEMORY_ITEMS,
+                 disk_items: int = DEFAULT_DISK_ITEMS, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 version_check_seconds: float = DEFAULT_VERSION_CHECK_SECONDS):
+        self.path = path
+        self.memory_items = max(0, int(memory_items))
+        self.disk_items = max(0, int(disk_items))
+        self.ttl_seconds = float(ttl_seconds or 0)
+        self.version_check_seconds = float(version_check_seconds or 0)
+
+        self._memory = OrderedDict() # key -> (entry dict, stored_at)
+        self._versions = {} # index name -> (version, checked_at)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_count = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if self.path:
+            self._open_disk_store()
+
+    @classmethod
+    def from_env(cls):
+        """Creates a cache configured from RESULT_CACHE_* environment variables.
+
+        Set RESULT_CACHE_PATH to an empty string to keep results (and version stamps) in memory only.
+        """
+        return cls(
+            path=os.getenv("RESULT_CACHE_PATH", DEFAULT_CACHE_PATH),
+            memory_items=int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", DEFAULT_MEMORY_ITEMS)),
+            disk_items=int(os.getenv("RESULT_CACHE_DISK_ITEMS", DEFAULT_DISK_ITEMS)),
+            ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+            version_check_seconds=float(os.getenv("RESULT_CACHE_VERSION_CHECK_SECONDS", DEFAULT_VERSION_CHECK_SECONDS)),
+        )
+
+    # --- Disk Tier ---
+    def _open_disk_store(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                       key TEXT PRIMARY KEY,
+                       index_name TEXT NOT NULL,
+                       version TEXT NOT NULL,
+                       entry TEXT NOT NULL,
+                       created_at REAL NOT NULL,
+                       last_access REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS index_versions (
+                       index_name TEXT PRIMARY KEY,
+                       stamp INTEGER NOT NULL,
+                       updated_at REAL NOT NULL
+                   )"""
+            )
+            self._disk_count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except sqlite3.Error as e:
+            # The cache is an optimization; fall back to memory-only rather than failing the app
+            print(f"Warning: Could not open result cache at '{self.path}', using memory-only cache. Error: {e}")
+            self._conn = None
+
+    def _disk_get(self, key: str, now: float):
+        row = self._conn.execute("SELECT entry, created_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        entry, created_at = row
+        if self.ttl_seconds and now - created_at > self.ttl_seconds:
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._disk_count = max(0, self._disk_count - 1)
+            return None
+        self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(entry), created_at
+
+    def _disk_put(self, key: str, index_name: str, version: str, entry: dict, now: float):
+        cursor = self._conn.execute(
+            "INSERT OR REPLACE INTO results (key, index_name, version, entry, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, index_name, version, json.dumps(entry, ensure_ascii=False, default=str), now, now),
+        )
+        if cursor.rowcount:
+            self._disk_count += 1
+        if self._disk_count > self.disk_items:
+            # Re-count before evicting: other workers share this file
+            self._disk_count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            overflow = self._disk_count - self.disk_items
+            if overflow > 0:
+                to_remove = overflow + max(1, self.disk_items // 20) # Evict a little extra so we don't prune on every insert
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access ASC LIMIT ?)",
+                    (to_remove,),
+                )
+                self.evictions += to_remove
+                self._disk_count = max(0, self._disk_count - to_remove)
+
+    # --- Memory Tier ---
+    def _memory_put(self, key: str, entry: dict, stored_at: float):
+        if self.memory_items == 0:
+            return
+        self._memory[key] = (entry, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # --- Index Versions ---
+    def _stamp(self, index_name: str) -> int:
+        if self._conn is None:
+            return 0
+        row = self._conn.execute("SELECT stamp FROM index_versions WHERE index_name = ?", (index_name,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, index_name: str) -> int:
+        """Marks the index as changed (call after ingestion); every worker's cached results for it become stale."""
+        with self._lock:
+            self._versions.pop(index_name, None)
+            if self._conn is None:
+                self._memory.clear()
+                return 0
+            now = time.time()
+            self._conn.execute(
+                "INSERT INTO index_versions (index_name, stamp, updated_at) VALUES (?, 1, ?) "
+                "ON CONFLICT(index_name) DO UPDATE SET stamp = stamp + 1, updated_at = excluded.updated_at",
+                (index_name, now),
+            )
+            return self._stamp(index_name)
+
+    def index_version(self, index_name: str, fingerprint_fn) -> str:
+        """Current version of `index_name`, re-read at most every `version_check_seconds`.
+
+        `fingerprint_fn()` returns something that changes with the index contents, e.g. its
+        document count. Returns None (meaning: don't use the cache) if no version is known.
+        """
+        now = time.time()
+        with self._lock:
+            known = self._versions.get(index_name)
+            if known and now - known[1] < self.version_check_seconds:
+                return known[0]
+        try:
+            fingerprint = fingerprint_fn()
+        except Exception as e:
+            print(f"Warning: Could not read the version of index '{index_name}': {e}")
+            return known[0] if known else None # Keep serving the last version we saw
+        with self._lock:
+            try:
+                stamp = self._stamp(index_name)
+            except sqlite3.Error as e:
+                print(f"Warning: Result cache read failed: {e}")
+                stamp = 0
+            version = f"{fingerprint}:{stamp}"
+            if known and known[0] != version:
+                self._drop_index(index_name, keep_version=version)
+            self._versions[index_name] = (version, now)
+            return version
+
+    def _drop_index(self, index_name: str, keep_version: str = None):
+        """Removes an index's entries from older versions (they can never be hit again)."""
+        self.invalidations += 1
+        self._memory = OrderedDict(
+            (key, value) for key, value in self._memory.items()
+            if value[0].get("index_name") != index_name or value[0].get("version") == keep_version
+        )
+        if self._conn is not None:
+            try:
+                self._conn.execute("DELETE FROM results WHERE index_name = ? AND version != ?", (index_name, keep_version or ""))
+                self._disk_count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"Warning: Result cache invalidation failed: {e}")
+
+    # --- Public API ---
+    def get(self, query: str, mode: str, top_k: int, model: str, index_name: str, version: str,
+            dimension: int = None, semantic_configuration: str = None):
+        """Returns the cached {"rows", "count"} for this search, or None on a miss."""
+        if version is None:
+            return None
+        key = make_result_key(query, mode, top_k, model, index_name, version, dimension, semantic_configuration)
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                entry, stored_at = cached
+                if not self.ttl_seconds or now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    found = self._disk_get(key, now)
+                except sqlite3.Error as e:
+                    print(f"Warning: Result cache read failed: {e}")
+                    found = None
+                if found is not None:
+                    entry, created_at = found
+                    self._memory_put(key, entry, created_at)
+                    self.disk_hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, mode: str, top_k: int, model: str, index_name: str, version: str,
+            rows: list, count=None, dimension: int = None, semantic_configuration: str = None) -> dict:
+        """Caches a materialized result list and returns the stored {"rows", "count"} entry."""
+        entry = {"rows": [to_plain_row(row) for row in rows], "count": len(rows) if count is None else count,
+                 "index_name": index_name, "version": version}
+        if version is None:
+            return entry
+        key = make_result_key(query, mode, top_k, model, index_name, version, dimension, semantic_configuration)
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, entry, now)
+            if self._conn is not None:
+                try:
+                    self._disk_put(key, index_name, version, entry, now)
+                except sqlite3.Error as e:
+                    print(f"Warning: Result cache write failed: {e}")
+        return entry
+
+    def clear(self):
+        """Drops every cached result from both tiers (version stamps are kept)."""
+        with self._lock:
+            self._memory.clear()
+            self._versions.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM results")
+                self._disk_count = 0
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and current tier sizes."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_count if self._conn is not None else 0,
+            }
+
+
+# --- Command Line: invalidate after out-of-band index changes ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the shared search result cache.")
+    parser.add_argument("command", choices=("bump", "clear", "stats"),
+                        help="bump: mark an index as changed; clear: drop all cached results; stats: show sizes.")
+    parser.add_argument("index_name", nargs="?", help="Index to bump (required for 'bump').")
+    args = parser.parse_args()
+
+    cache = SearchResultCache.from_env()
+    if args.command == "bump":
+        if not args.index_name:
+            parser.error("'bump' needs an index name.")
+        print(f"Index '{args.index_name}' is now at version stamp {cache.bump_version(args.index_name)}.")
+    elif args.command == "clear":
+        cache.clear()
+        print(f"Cleared cached results in '{cache.path}'.")
+    else:
+        print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,142 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tracing import get_tracer
+
+# The Azure SDK takes longer to import than the rest of the app together, so it is imported
+# on first use: the local backend never loads it, and the app's first page render doesn't wait for it.
+
+# --- Search Modes (labels match the Streamlit selector) ---
+MODE_KEYWORD = "Keyword"
+MODE_VECTOR = "Vector"
+MODE_HYBRID = "Hybrid"
+MODE_SEMANTIC = "Semantic (Keyword + Semantic Reranking)"
+SEARCH_MODES = (MODE_KEYWORD, MODE_VECTOR, MODE_HYBRID, MODE_SEMANTIC)
+VECTOR_MODES = (MODE_VECTOR, MODE_HYBRID)
+
+SELECT_FIELDS = "movie_id,title,overview,tagline,genres"
+
+# --- Process-wide Pooled Clients ---
+# Module state lives for the life of the process, so Streamlit reruns (which re-execute
+# app.py but not imported modules) keep reusing the same connections.
+_clients_lock = threading.Lock()
+_ollama_session = None
+_search_clients = {}
+
+
+def get_ollama_session(pool_size: int = 16) -> requests.Session:
+    """Returns the shared keep-alive session used for every Ollama request."""
+    global _ollama_session
+    with _clients_lock:
+        if _ollama_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _ollama_session = session
+        return _ollama_session
+
+
+def get_search_client(endpoint: str, index_name: str, api_key: str) -> "SearchClient":
+    """Returns the shared SearchClient for (endpoint, index), building it on first use."""
+    cache_key = (endpoint, index_name, api_key)
+    with _clients_lock:
+        client = _search_clients.get(cache_key)
+        if client is None:
+            from azure.core.credentials import AzureKeyCredential
+            from azure.search.documents import SearchClient
+            client = SearchClient(endpoint=endpoint, index_name=index_name, credential=AzureKeyCredential(api_key))
+            _search_clients[cache_key] = client
+        return client
+
+
+# --- Result Materialization ---
+class SearchResults:
+    """Fully materialized search results exposing the same surface `display_results` uses.
+
+    Azure's `SearchItemPaged` is lazy: the HTTP request only happens on `get_count()` or
+    the first iteration. Materializing inside the worker thread is what lets several
+    searches actually run concurrently.
+
+    `get_count()` and iteration on the pager each start their own page iterator, i.e. their
+    own HTTP request, so rows and count are both read from a single `by_page()` iterator.
+    """
+
+    def __init__(self, rows: list, count=None):
+        self.rows = rows
+        self.count = len(rows) if count is None else count
+
+    @classmethod
+    def from_paged(cls, paged):
+        tracer = get_tracer()
+        pages = paged.by_page()
+        with tracer.span("azure.request"):
+            first_page = next(pages) # Sends the search request
+        with tracer.span("azure.iterate_results"):
+            rows = list(first_page)
+            for page in pages: # Later pages, if any, are fetched here
+                rows.extend(page)
+            count = pages.get_count() # From the response already received; no extra request
+        return cls(rows, count)
+
+    def get_count(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+def run_search(search_client: "SearchClient", search_mode: str, query: str, query_vector=None,
+               top_k: int = 5, semantic_configuration_name: str = None) -> SearchResults:
+    """Runs one search in the given mode and returns materialized results.
+
+    Vector and Hybrid require `query_vector`; callers are expected to check that first.
+    Exceptions from the Azure SDK propagate to the caller.
+    """
+    if search_mode in VECTOR_MODES and not query_vector:
+        raise ValueError(f"{search_mode} search requires a query embedding.")
+    from azure.search.documents.models import VectorizedQuery, QueryType, QueryCaptionType, QueryAnswerType
+
+    if search_mode == MODE_KEYWORD:
+        paged = search_client.search(
+            search_text=query,
+            select=SELECT_FIELDS,
+            top=top_k,
+            include_total_count=True
+        )
+    elif search_mode == MODE_VECTOR:
+        paged = search_client.search(
+            search_text=None, # No keyword search
+            vector_queries=[VectorizedQuery(vector=query_vector, k_nearest_neighbors=top_k, fields="embedding")],
+            select=SELECT_FIELDS,
+            top=top_k,
+            include_total_count=True
+        )
+    elif search_mode == MODE_HYBRID:
+        paged = search_client.search(
+            search_text=query, # Keyword part; Azure Search fuses both legs with RRF
+            vector_queries=[VectorizedQuery(vector=query_vector, k_nearest_neighbors=top_k, fields="embedding")],
+            select=SELECT_FIELDS,
+            top=top_k,
+            include_total_count=True
+        )
+    elif search_mode == MODE_SEMANTIC:
+        paged = search_client.search(
+            search_text=query,
+            select=SELECT_FIELDS,
+            query_type=QueryType.SEMANTIC,
+            semantic_configuration_name=semantic_configuration_name,
+            query_caption=QueryCaptionType.EXTRACTIVE,
+            query_answer=QueryAnswerType.EXTRACTIVE,
+            top=top_k,
+            include_total_count=True
+        )
+    else:
+        raise ValueError(f"Unknown search mode '{search_mode}'. Expected one of {SEARCH_MODES}.")
+
+    with get_tracer().span("azure.search", mode=search_mode, top_k=top_k) as span:
+        results = SearchResults.from_paged(paged)
+        span.set("results", len(results.rows))
+    return results
@@ -0,0 +1,216 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Configuration Defaults ---
+MAX_BATCH_DOCUMENTS = 1000 # Azure AI Search's per-request document limit
+MAX_BATCH_BYTES = 4 * 1024 * 1024 # Well under the 16 MB request limit; 768-dim vectors are ~15 KB of JSON each
+MAX_WORKERS = 4 # Concurrent index requests
+MAX_RETRIES = 5 # Per batch, for throttling and retriable per-document failures
+BACKOFF_SECONDS = 1.0 # Base for exponential backoff with jitter
+RETRIABLE_STATUS_CODES = (409, 422, 429, 503) # Per-document or whole-request statuses worth retrying
+REQUEST_TIMEOUT = 120 # Seconds per index request
+KEY_FIELD = "movie_id"
+SEARCH_API_VERSION = "2024-07-01" # Same REST version azure-search-documents 11.5 uses
+INDEX_ACTIONS = ("upload", "merge", "mergeOrUpload", "delete")
+
+
+def estimate_document_bytes(document: dict) -> int:
+    """Approximate JSON size of one index action, used to keep requests under the size budget."""
+    return len(json.dumps(document, ensure_ascii=False, separators=(",", ":"))) + 32 # + "@search.action" overhead
+
+
+def make_batches(documents: list, max_documents: int = MAX_BATCH_DOCUMENTS, max_bytes: int = MAX_BATCH_BYTES) -> list:
+    """Cuts documents into batches bounded by both document count and estimated payload bytes."""
+    batches, batch, batch_bytes = [], [], 0
+    for document in documents:
+        size = estimate_document_bytes(document)
+        if batch and (len(batch) >= max_documents or batch_bytes + size > max_bytes):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(document)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class UploadReport:
+    """Outcome of one `SearchUploader.upload` call."""
+
+    def __init__(self):
+        self.succeeded = [] # Keys indexed successfully
+        self.failures = {} # key -> (status_code, error message) for documents that never succeeded
+        self.duplicates = 0 # Documents dropped because a later document had the same key
+        self.batches = 0
+        self.retries = 0
+        self.splits = 0
+        self.elapsed_seconds = 0.0
+
+    @property
+    def documents_per_second(self) -> float:
+        return len(self.succeeded) / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def print_summary(self, label: str = "Upload", max_failures: int = 10):
+        print(f"  {label} finished: {len(self.succeeded)} succeeded, {len(self.failures)} failed in {self.batches} batches "
+              f"({self.retries} retries, {self.splits} splits, {self.documents_per_second:.1f} docs/s).")
+        if self.duplicates:
+            print(f"    Warning: {self.duplicates} documents had a duplicate key; only the last one per key was sent.")
+        for key, (status_code, message) in list(self.failures.items())[:max_failures]:
+            message = str(message)
+            if len(message) > 500:
+                message = message[:500] + "... (truncated)"
+            print(f"    Failed doc ID '{key}' (status {status_code}): {message}")
+        if len(self.failures) > max_failures:
+            print(f"    ... and {len(self.failures) - max_failures} more failures.")
+
+
+class SearchUploader:
+    """Uploads documents to an Azure AI Search index with several batches in flight.
+
+    Batches are bounded by count and payload bytes. Throttled requests (429/503) and
+    retriable per-document statuses inside a 207 response are retried with backoff; only
+    the documents that failed are resent. A batch the service still rejects as too large
+    (413) is split in half until it fits.
+
+    Requests go straight to the documented REST endpoint over a pooled keep-alive session:
+    the SDK's built-in 413 split fails in azure-search-documents 11.5.2, and its own retry
+    policy would hide throttling from the report.
+    """
+
+    def __init__(self, endpoint: str, index_name: str, api_key: str, key_field: str = KEY_FIELD,
+                 max_batch_documents: int = MAX_BATCH_DOCUMENTS, max_batch_bytes: int = MAX_BATCH_BYTES,
+                 max_workers: int = MAX_WORKERS, max_retries: int = MAX_RETRIES,
+                 backoff_seconds: float = BACKOFF_SECONDS, timeout: float = REQUEST_TIMEOUT):
+        self.key_field = key_field
+        self.max_batch_documents = max_batch_documents
+        self.max_batch_bytes = max_batch_bytes
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.url = f"{endpoint.rstrip('/')}/indexes('{index_name}')/docs/search.index?api-version={SEARCH_API_VERSION}"
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"api-key": api_key, "Content-Type": "application/json"})
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="search-upload")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, endpoint: str, index_name: str, api_key: str, **kwargs):
+        """Creates an uploader tuned by UPLOAD_* environment variables."""
+        return cls(
+            endpoint, index_name, api_key,
+            max_batch_documents=int(os.getenv("UPLOAD_BATCH_SIZE", MAX_BATCH_DOCUMENTS)),
+            max_batch_bytes=int(float(os.getenv("UPLOAD_MAX_BATCH_MB", MAX_BATCH_BYTES / 1024 / 1024)) * 1024 * 1024),
+            max_workers=int(os.getenv("UPLOAD_CONCURRENCY", MAX_WORKERS)),
+            max_retries=int(os.getenv("UPLOAD_MAX_RETRIES", MAX_RETRIES)),
+            **kwargs,
+        )
+
+    def _send(self, documents: list, action: str) -> requests.Response:
+        """One index request for `documents`."""
+        actions = [{**{key: value for key, value in doc.items() if key != "@search.action"}, "@search.action": action}
+                   for doc in documents]
+        return self._session.post(self.url, data=json.dumps({"value": actions}, ensure_ascii=False).encode("utf-8"),
+                                  timeout=self.timeout)
+
+    def _upload_batch(self, documents: list, action: str, report: UploadReport):
+        pending = {doc[self.key_field]: doc for doc in documents}
+        last_errors = {}
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._lock:
+                    report.retries += 1
+                time.sleep(self.backoff_seconds * (2 ** (attempt - 1)) * (0.5 + random.random()))
+            try:
+                response = self._send(list(pending.values()), action)
+            except requests.exceptions.RequestException as e:
+                last_errors = {key: (None, str(e)) for key in pending} # Timeouts and connection problems: retry
+                continue
+
+            if response.status_code == 413:
+                if len(pending) == 1:
+                    last_errors = {key: (413, "document exceeds the request size limit") for key in pending}
+                    break
+                with self._lock:
+                    report.splits += 1
+                documents = list(pending.values())
+                middle = len(documents) // 2
+                self._upload_batch(documents[:middle], action, report)
+                self._upload_batch(documents[middle:], action, report)
+                return
+            if response.status_code not in (200, 207):
+                last_errors = {key: (response.status_code, response.text[:500]) for key in pending}
+                if response.status_code in RETRIABLE_STATUS_CODES or response.status_code >= 500:
+                    continue
+                break # Bad request, auth or missing index: resending won't help
+
+            try:
+                results = response.json().get("value", [])
+            except ValueError: # A proxy or gateway answering with a non-JSON body
+                last_errors = {key: (response.status_code, f"invalid JSON response: {response.text[:200]}") for key in pending}
+                continue
+
+            succeeded, retry = [], {}
+            for result in results:
+                key, status_code = result.get("key"), result.get("statusCode")
+                if key not in pending:
+                    continue
+                if result.get("status"):
+                    succeeded.append(key)
+                    pending.pop(key)
+                elif status_code in RETRIABLE_STATUS_CODES:
+                    last_errors[key] = (status_code, result.get("errorMessage"))
+                    retry[key] = pending.pop(key)
+                else:
+                    pending.pop(key)
+                    with self._lock:
+                        report.failures[key] = (status_code, result.get("errorMessage"))
+            for key, doc in pending.items(): # Documents the response didn't mention
+                last_errors[key] = (None, "no result returned")
+                retry[key] = doc
+            with self._lock:
+                report.succeeded.extend(succeeded)
+            pending = retry
+            if not pending:
+                return
+
+        with self._lock:
+            for key in pending:
+                report.failures[key] = last_errors.get(key, (None, "retries exhausted"))
+
+    def upload(self, documents: list, action: str = "mergeOrUpload") -> UploadReport:
+        """Sends `documents` (dicts with the key field) as `action` and returns per-key results.
+
+        For action="delete" the documents only need the key field.
+        """
+        if action not in INDEX_ACTIONS:
+            raise ValueError(f"Unknown index action '{action}'. Expected one of {INDEX_ACTIONS}.")
+        report = UploadReport()
+        start = time.time()
+        # One action per key: results are reported per key, so duplicates can't be told apart
+        unique = {}
+        for document in documents:
+            unique[document[self.key_field]] = document
+        report.duplicates = len(documents) - len(unique)
+        batches = make_batches(list(unique.values()), self.max_batch_documents, self.max_batch_bytes)
+        report.batches = len(batches)
+        for future in [self._executor.submit(self._upload_batch, batch, action, report) for batch in batches]:
+            future.result()
+        report.elapsed_seconds = time.time() - start
+        return report
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._session.close()
+
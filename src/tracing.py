@@ -0,0 +1,344 @@
+import argparse
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration Defaults ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # Seconds
+PAYLOAD_MAX_CHARS = 512 # Logged payloads are cut to this many characters
+VECTOR_PREVIEW = 4 # Numbers kept when a long list of floats (an embedding) is summarized
+METRICS_PREFIX = "movie_search"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def summarize_payload(payload, max_chars: int = PAYLOAD_MAX_CHARS) -> str:
+    """JSON-ish rendering of a request/response body for logs: vectors collapsed, size capped.
+
+    A 768-float embedding becomes "<768 floats: 0.0123, -0.0456, ...>" instead of ~15 KB of text.
+    """
+    def shrink(value):
+        if isinstance(value, dict):
+            return {key: shrink(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            if len(value) > VECTOR_PREVIEW * 2 and all(isinstance(item, (int, float)) for item in value[:VECTOR_PREVIEW * 2]):
+                preview = ", ".join(f"{item:.4f}" for item in value[:VECTOR_PREVIEW])
+                return f"<{len(value)} floats: {preview}, ...>"
+            return [shrink(item) for item in value]
+        return value
+
+    try:
+        text = json.dumps(shrink(payload), ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        text = repr(payload)
+    return text if len(text) <= max_chars else text[:max_chars] + f"... ({len(text) - max_chars} more chars)"
+
+
+# --- Spans ---
+class _Trace:
+    """The spans of one request (a root span and everything started under it)."""
+
+    def __init__(self, sampled: bool):
+        self.trace_id = uuid.uuid4().hex
+        self.sampled = sampled # Only sampled traces are written to exporters; metrics see every span
+        self.spans = [] # Finished spans, in finishing order
+        self.exported = False
+        self.lock = threading.Lock()
+
+
+class Span:
+    """One timed operation. Attributes and errors set on it end up in the trace file."""
+
+    __slots__ = ("name", "span_id", "parent_id", "trace", "attributes", "error", "start", "duration")
+
+    def __init__(self, name: str, trace: _Trace, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.trace = trace
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.start = time.time()
+        self.duration = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        """Marks the span failed without raising (for errors the caller handles itself)."""
+        self.error = str(message)[:PAYLOAD_MAX_CHARS]
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.duration or 0.0) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration_ms, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+# --- Metrics ---
+class SpanMetrics:
+    """Per-span-name latency histograms and error counters, rendered in Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, prefix: str = METRICS_PREFIX):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {} # span name -> ([cumulative bucket counts..., total count], sum of seconds)
+        self._errors = {}
+
+    def record(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            counts, total = self._histograms.get(name) or ([0] * (len(self.buckets) + 1), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._histograms[name] = (counts, total + seconds)
+            if error:
+                self._errors[name] = self._errors.get(name, 0) + 1
+
+    def render(self) -> str:
+        metric = f"{self.prefix}_span_duration_seconds"
+        lines = [f"# HELP {metric} Time spent in each traced operation.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            for name, (counts, total) in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{metric}_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {counts[-1]}')
+                lines.append(f'{metric}_sum{{span="{name}"}} {total:.6f}')
+                lines.append(f'{metric}_count{{span="{name}"}} {counts[-1]}')
+            errors = f"{self.prefix}_span_errors_total"
+            lines += [f"# HELP {errors} Traced operations that failed.", f"# TYPE {errors} counter"]
+            for name, count in sorted(self._errors.items()):
+                lines.append(f'{errors}{{span="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+# --- Exporters ---
+class JsonlSpanExporter:
+    """Appends finished spans to a JSON Lines file, one trace at a time."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, spans: list):
+        lines = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusEndpoint:
+    """Serves `metrics.render()` at http://<host>:<port>/metrics from a daemon thread."""
+
+    def __init__(self, metrics: SpanMetrics, port: int, host: str = "127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass # Scrapes every few seconds would otherwise flood stderr
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="metrics-endpoint", daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Tracer ---
+class Tracer:
+    """Records spans for timed operations and hands sampled traces to exporters.
+
+    Every span feeds the in-memory latency histograms (cheap, always on). Whole traces are
+    written to exporters for a `sample_rate` share of root spans, and request/response
+    payloads are logged for a separate, usually much smaller, `payload_sample_rate` share
+    and capped at `payload_max_chars`. Spans nest through contextvars, so work submitted to
+    a thread pool joins the caller's trace when run inside a copied context.
+    """
+
+    def __init__(self, exporters=(), sample_rate: float = 1.0, payload_sample_rate: float = 0.0,
+                 payload_max_chars: int = PAYLOAD_MAX_CHARS, metrics: SpanMetrics = None):
+        self.exporters = list(exporters)
+        self.sample_rate = sample_rate
+        self.payload_sample_rate = payload_sample_rate
+        self.payload_max_chars = payload_max_chars
+        self.metrics = metrics or SpanMetrics()
+        self.metrics_endpoint = None
+
+    @classmethod
+    def from_env(cls):
+        """Creates a tracer configured from TRACE_* environment variables.
+
+        TRACE_FILE enables the JSONL exporter; TRACE_METRICS_PORT starts the Prometheus endpoint.
+        """
+        exporters = []
+        trace_file = os.getenv("TRACE_FILE")
+        if trace_file:
+            exporters.append(JsonlSpanExporter(trace_file))
+        tracer = cls(
+            exporters=exporters,
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", 1.0)),
+            payload_sample_rate=float(os.getenv("TRACE_PAYLOAD_SAMPLE_RATE", 0.0)),
+            payload_max_chars=int(os.getenv("TRACE_PAYLOAD_MAX_CHARS", PAYLOAD_MAX_CHARS)),
+        )
+        metrics_port = os.getenv("TRACE_METRICS_PORT")
+        if metrics_port:
+            try:
+                tracer.metrics_endpoint = PrometheusEndpoint(tracer.metrics, int(metrics_port),
+                                                             host=os.getenv("TRACE_METRICS_HOST", "127.0.0.1"))
+                print(f"Tracing: Prometheus metrics at http://{os.getenv('TRACE_METRICS_HOST', '127.0.0.1')}:{metrics_port}/metrics")
+            except OSError as e:
+                # Another worker on this host already serves the port; keep tracing without it
+                print(f"Warning: Could not start the metrics endpoint on port {metrics_port}: {e}")
+        return tracer
+
+    def current_span(self):
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Times the enclosed block as a span; exceptions mark it failed and propagate."""
+        parent = _current_span.get()
+        if parent is None:
+            trace = _Trace(sampled=bool(self.exporters) and random.random() < self.sample_rate)
+            span = Span(name, trace, attributes=attributes)
+        else:
+            span = Span(name, parent.trace, parent_id=parent.span_id, attributes=attributes)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self._finish(span, is_root=parent is None)
+
+    def _finish(self, span: Span, is_root: bool):
+        self.metrics.record(span.name, span.duration, error=span.error is not None)
+        trace = span.trace
+        with trace.lock:
+            trace.spans.append(span)
+            if not trace.sampled:
+                return
+            if is_root:
+                trace.exported = True
+                spans = list(trace.spans)
+            elif trace.exported:
+                spans = [span] # Background work that outlived its request
+            else:
+                return
+        for exporter in self.exporters:
+            exporter.export(spans)
+
+    def log_payload(self, label: str, payload):
+        """Attaches a capped summary of `payload` to the current span, for a sampled share of calls."""
+        span = _current_span.get()
+        if span is None or not self.payload_sample_rate or random.random() >= self.payload_sample_rate:
+            return
+        span.set(f"payload.{label}", summarize_payload(payload, self.payload_max_chars))
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+        if self.metrics_endpoint:
+            self.metrics_endpoint.close()
+
+
+def breakdown(span: Span) -> list:
+    """(name, milliseconds) for the finished spans in `span`'s trace, excluding `span` itself, in start order."""
+    with span.trace.lock:
+        spans = [child for child in span.trace.spans if child is not span]
+    spans.sort(key=lambda child: child.start)
+    return [(child.name + (f"[{child.attributes['mode']}]" if "mode" in child.attributes else ""), child.duration_ms)
+            for child in spans]
+
+
+# --- Process-wide Tracer ---
+_tracer_lock = threading.Lock()
+_tracer = None
+
+
+def get_tracer() -> Tracer:
+    """Returns the process-wide tracer (built from the environment on first use)."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer.from_env()
+        return _tracer
+
+
+# --- Command Line: latency summary of a trace file ---
+def summarize_trace_file(path: str) -> dict:
+    """Returns {span name: {"count", "errors", "p50", "p95", "p99", "max"}} (milliseconds) for a JSONL trace file."""
+    durations, errors = {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            span = json.loads(line)
+            durations.setdefault(span["name"], []).append(span["duration_ms"])
+            if span.get("status") == "error":
+                errors[span["name"]] = errors.get(span["name"], 0) + 1
+
+    def percentile(values, q):
+        return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {"count": len(values), "errors": errors.get(name, 0), "p50": percentile(values, 50),
+                         "p95": percentile(values, 95), "p99": percentile(values, 99), "max": values[-1]}
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize span latencies from a JSONL trace file (TRACE_FILE).")
+    parser.add_argument("path", help="Trace file written by the app.")
+    args = parser.parse_args()
+
+    summary = summarize_trace_file(args.path)
+    print(f"{'span':<28} {'count':>7} {'errors':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]["p99"]):
+        print(f"{name:<28} {stats['count']:>7} {stats['errors']:>7} {stats['p50']:>10.2f} {stats['p95']:>10.2f} "
+              f"{stats['p99']:>10.2f} {stats['max']:>10.2f}")
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Tests import the flat modules in src/, the same way the notebooks and benchmarks do, and the fakes in benchmarks/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+
+@pytest.fixture
+def movies_csv(tmp_path):
+    """Factory writing a movies_metadata.csv-shaped file with ids 0..count-1.
+
+    Rows in `empty_overviews` have no overview (the pipeline drops them); rows in `edited` get
+    a different overview, i.e. a new content hash.
+    """
+    def write(count: int, empty_overviews=(), edited=(), name: str = "movies.csv") -> str:
+        path = tmp_path / name
+        pd.DataFrame({
+            "id": [str(i) for i in range(count)],
+            "title": [f"Movie {i}" for i in range(count)],
+            "overview": ["" if i in empty_overviews else f"Overview of movie {i}" + (" (director's cut)" if i in edited else "") for i in range(count)],
+            "genres": ["[{'id': 18, 'name': 'Drama'}]"] * count,
+            "tagline": [f"Tagline {i}" for i in range(count)],
+        }).to_csv(path, index=False)
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def make_documents():
+    """Factory for upload-shaped documents with random (unnormalized) embeddings."""
+    def make(count: int, dimension: int = 8, seed: int = 0, start_id: int = 0) -> list:
+        rng = np.random.default_rng(seed)
+        vectors = rng.normal(size=(count, dimension)).astype(np.float32)
+        return [{"movie_id": str(start_id + i), "title": f"Movie {start_id + i}", "overview": f"Overview {start_id + i}",
+                 "tagline": None, "genres": "Drama", "embedding": vectors[i].tolist()} for i in range(count)]
+    return make
+
+
+@pytest.fixture
+def write_jsonl(tmp_path):
+    """Writes documents as a processed-embeddings JSONL backup and returns its path."""
+    def write(documents: list, name: str = "movie_embeddings_nomic-embed-text_100records.jsonl") -> str:
+        path = tmp_path / name
+        with open(path, "w", encoding="utf-8") as f:
+            for document in documents:
+                f.write(json.dumps(document) + "\n")
+        return str(path)
+    return write
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFQuantizedIndex, exact_top_k, measure_recall, sample_queries
+from embedding_store import EmbeddingStore, EmbeddingStoreWriter
+from local_vector_search import LocalVectorIndex
+
+DIMENSION = 32
+NLIST = 16
+
+
+@pytest.fixture
+def store_path(tmp_path, make_documents):
+    path = str(tmp_path / "movies.embstore")
+    with EmbeddingStoreWriter(path, "nomic-embed-text", DIMENSION) as writer:
+        writer.append(make_documents(2000, dimension=DIMENSION))
+    return path
+
+
+@pytest.fixture
+def queries(store_path):
+    return sample_queries(EmbeddingStore(store_path), 50, noise=0.5)
+
+
+@pytest.mark.parametrize("quantizer", ["pq", "int8"])
+def test_save_load_round_trip(tmp_path, store_path, queries, quantizer):
+    index = IVFQuantizedIndex.build(EmbeddingStore(store_path), nlist=NLIST, quantizer=quantizer)
+    path = str(tmp_path / f"movies_{quantizer}.npz")
+    index.save(path)
+
+    loaded = IVFQuantizedIndex.load(path) # Finds the store next to the index
+    assert (loaded.quantizer, loaded.count, loaded.dimension, loaded.nlist) == (quantizer, 2000, DIMENSION, NLIST)
+    assert loaded.model == "nomic-embed-text"
+    np.testing.assert_array_equal(loaded.codes, index.codes)
+    for nprobe, rerank in ((2, 0), (4, 20)):
+        for (rows, scores), (expected_rows, expected_scores) in zip(loaded.search_ids(queries, 5, nprobe, rerank),
+                                                                     index.search_ids(queries, 5, nprobe, rerank)):
+            np.testing.assert_array_equal(rows, expected_rows)
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+
+@pytest.mark.parametrize("quantizer, compressed_recall", [("pq", 0.5), ("int8", 0.9)])
+def test_recall_against_exact_search(store_path, queries, quantizer, compressed_recall):
+    index = IVFQuantizedIndex.build(EmbeddingStore(store_path), nlist=NLIST, quantizer=quantizer)
+    [everything] = measure_recall(index, queries, k=10, nprobes=[NLIST], rerank=100)
+    assert everything["recall"] >= 0.99 # Every list scanned and re-ranked exactly: only the candidate cut can miss
+    [compressed] = measure_recall(index, queries, k=10, nprobes=[NLIST], rerank=0)
+    assert compressed["recall"] >= compressed_recall
+
+    few, many = measure_recall(index, queries, k=10, nprobes=[1, 8], rerank=100)
+    assert few["recall"] < many["recall"]
+
+
+def test_results_match_the_exact_index(store_path, queries):
+    index = IVFQuantizedIndex.build(EmbeddingStore(store_path), nlist=NLIST, quantizer="int8")
+    exact = LocalVectorIndex.from_store(store_path)
+    approximate_rows = index.search_batch(queries[:5], k=3, nprobe=NLIST)
+    exact_rows = exact.search_batch(queries[:5], k=3)
+    for rows, expected in zip(approximate_rows, exact_rows):
+        assert [row["movie_id"] for row in rows] == [row["movie_id"] for row in expected]
+        assert [row["@search.score"] for row in rows] == pytest.approx([row["@search.score"] for row in expected], rel=1e-5)
+        assert set(rows[0]) == set(expected[0])
+
+
+def test_exact_top_k_matches_a_full_sort(store_path, queries):
+    store = EmbeddingStore(store_path)
+    vectors = np.array(store.vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :5]
+    np.testing.assert_array_equal(exact_top_k(store, queries, 5), expected)
+
+
+def test_small_lists_still_return_k_results(store_path, queries):
+    index = IVFQuantizedIndex.build(EmbeddingStore(store_path), nlist=500, quantizer="int8")
+    for rows, _ in index.search_ids(queries, k=20, nprobe=1):
+        assert len(rows) == 20
+
+
+def test_build_rejects_bad_settings(store_path):
+    store = EmbeddingStore(store_path)
+    with pytest.raises(ValueError):
+        IVFQuantizedIndex.build(store, quantizer="float16")
+    with pytest.raises(ValueError):
+        IVFQuantizedIndex.build(store, quantizer="pq", pq_m=5) # Must divide the dimension
+
+
+def test_query_dimension_is_checked(store_path):
+    index = IVFQuantizedIndex.build(EmbeddingStore(store_path), nlist=NLIST, quantizer="int8")
+    with pytest.raises(ValueError):
+        index.search([0.1] * (DIMENSION // 2))
+
+
+def test_load_rejects_a_store_that_changed(tmp_path, store_path, make_documents):
+    index_path = str(tmp_path / "movies_ivf.npz")
+    IVFQuantizedIndex.build(EmbeddingStore(store_path), nlist=NLIST).save(index_path)
+    other_path = str(tmp_path / "other.embstore")
+    with EmbeddingStoreWriter(other_path, "nomic-embed-text", DIMENSION) as writer:
+        writer.append(make_documents(100, dimension=DIMENSION, seed=1))
+    with pytest.raises(ValueError):
+        IVFQuantizedIndex.load(index_path, store_path=other_path)
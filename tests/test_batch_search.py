@@ -0,0 +1,80 @@
+import io
+import json
+import os
+
+import numpy as np
+
+from batch_search import BatchQueryRunner, LocalSearchBackend
+from ollama_batch_client import OllamaUnavailableError
+
+DIMENSION = 8
+
+
+class StubEmbedder:
+    """embed_fn stand-in: a fixed vector per text, or OllamaUnavailableError for the calls in `fail_calls`."""
+
+    def __init__(self, fail_calls=()):
+        self.fail_calls = set(fail_calls)
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        if len(self.calls) in self.fail_calls:
+            raise OllamaUnavailableError("Ollama is unreachable")
+        return [np.full(DIMENSION, 1.0 + i, dtype=np.float32).tolist() for i, _ in enumerate(texts)]
+
+    def stats(self):
+        return {"calls": len(self.calls)}
+
+
+def run(runner, queries):
+    output = io.StringIO()
+    summary = runner.run(queries, output)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    return summary, sorted(records, key=lambda record: (record["index"], record["mode"]))
+
+
+def make_runner(make_documents, write_jsonl, embedder, **kwargs):
+    backend = LocalSearchBackend(write_jsonl(make_documents(50, dimension=DIMENSION)), dimension=DIMENSION)
+    return BatchQueryRunner(backend, embedder, "nomic-embed-text", dimension=DIMENSION, concurrency=2, **kwargs)
+
+
+def test_every_query_runs_in_every_mode(make_documents, write_jsonl):
+    embedder = StubEmbedder()
+    runner = make_runner(make_documents, write_jsonl, embedder, chunk_size=2)
+    summary, records = run(runner, [{"query": f"Overview {i}"} for i in range(5)])
+    assert summary["queries"] == 5
+    assert summary["searches"] == 15
+    assert summary["errors"] == 0
+    assert len(embedder.calls) == 3 # Chunks of 2, 2 and 1
+    assert all(len(record["results"]) == 5 for record in records)
+
+
+def test_duplicate_queries_are_embedded_once_as_typed(make_documents, write_jsonl):
+    embedder = StubEmbedder()
+    runner = make_runner(make_documents, write_jsonl, embedder, modes=("vector",))
+    run(runner, [{"query": "  Space Robots "}, {"query": "space   robots"}])
+    assert embedder.calls == [["Space Robots"]]
+
+
+def test_ollama_outage_only_fails_the_affected_vector_searches(make_documents, write_jsonl):
+    embedder = StubEmbedder(fail_calls={2})
+    runner = make_runner(make_documents, write_jsonl, embedder, chunk_size=2)
+    summary, records = run(runner, [{"query": f"Overview {i}"} for i in range(6)])
+    assert summary["searches"] == 18 # The run carries on after the failed chunk
+    failed = {(record["index"], record["mode"]) for record in records if "error" in record}
+    assert failed == {(2, "Vector"), (2, "Hybrid"), (3, "Vector"), (3, "Hybrid")}
+    assert summary["errors"] == 4
+    assert all(record.get("results") for record in records if record["mode"] == "Keyword")
+    assert all("embedding failed" in record["error"] for record in records if "error" in record)
+
+
+def test_stale_saved_keyword_index_is_rebuilt(make_documents, write_jsonl, tmp_path):
+    index_path = str(tmp_path / "keyword_index.npz")
+    old = LocalSearchBackend(write_jsonl(make_documents(10), name="old.jsonl"))
+    old.text_index().save(index_path)
+
+    new_path = write_jsonl(make_documents(30), name="new.jsonl")
+    os.utime(new_path, (0, os.path.getmtime(new_path) + 60)) # Rewritten a minute later
+    backend = LocalSearchBackend(new_path, text_index_path=index_path)
+    assert backend.text_index().count == 30
@@ -0,0 +1,112 @@
+import pytest
+
+import embedding_cache
+from embedding_cache import EmbeddingCache, make_cache_key, normalize_query_text
+
+MODEL = "nomic-embed-text"
+
+
+class Clock:
+    """Replaces time.time() inside embedding_cache so TTLs can be tested without sleeping."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(embedding_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embeddings.sqlite3")
+
+
+def vector(value: float) -> list:
+    return [value, 0.5, 0.25]
+
+
+def test_normalized_spellings_share_a_key():
+    assert normalize_query_text("  Space   Battles ") == "space battles"
+    assert make_cache_key(MODEL, "Space  battles", 768) == make_cache_key(MODEL, "space battles ", 768)
+    assert make_cache_key(MODEL, "space battles", 768) != make_cache_key(MODEL, "space battles", 256)
+    assert make_cache_key(MODEL, "space battles", 768) != make_cache_key("bge-m3", "space battles", 768)
+
+
+def test_put_returns_float32_rounded_vector():
+    cache = EmbeddingCache(path="")
+    stored = cache.put(MODEL, "query", 3, [0.1, 0.2, 0.3])
+    assert stored != [0.1, 0.2, 0.3] # float32 rounding
+    assert cache.get(MODEL, "query", 3) == stored
+
+
+@pytest.mark.parametrize("eviction, survivor, evicted", [("lru", "a", "b"), ("fifo", "b", "a")])
+def test_memory_eviction_policy(eviction, survivor, evicted):
+    cache = EmbeddingCache(path="", memory_items=2, eviction=eviction)
+    cache.put(MODEL, "a", 3, vector(1))
+    cache.put(MODEL, "b", 3, vector(2))
+    cache.get(MODEL, "a", 3) # Refreshes "a" under LRU only
+    cache.put(MODEL, "c", 3, vector(3))
+    assert cache.get(MODEL, survivor, 3) is not None
+    assert cache.get(MODEL, evicted, 3) is None
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.parametrize("eviction, kept, dropped", [("lru", ["a"], ["b"]), ("fifo", [], ["a", "b"])])
+def test_disk_eviction_policy(cache_path, clock, eviction, kept, dropped):
+    cache = EmbeddingCache(path=cache_path, memory_items=0, disk_items=20, eviction=eviction)
+    for text in ["a", "b"] + [f"filler {i}" for i in range(18)]:
+        clock.now += 1
+        cache.put(MODEL, text, 3, vector(1))
+    clock.now += 1
+    cache.get(MODEL, "a", 3) # Updates last_access under LRU only
+    clock.now += 1
+    cache.put(MODEL, "one too many", 3, vector(2))
+    # Overflow of 1 plus 5% headroom: the two oldest by last access (LRU) or creation (FIFO) go
+    assert cache.stats()["disk_entries"] == 19
+    assert [text for text in kept if cache.get(MODEL, text, 3) is None] == []
+    assert [text for text in dropped if cache.get(MODEL, text, 3) is not None] == []
+
+
+def test_ttl_expires_both_tiers(cache_path, clock):
+    cache = EmbeddingCache(path=cache_path, ttl_seconds=60)
+    cache.put(MODEL, "query", 3, vector(1))
+    clock.now += 59
+    assert cache.get(MODEL, "query", 3) is not None
+    clock.now += 2
+    assert cache.get(MODEL, "query", 3) is None
+    assert cache.stats()["disk_entries"] == 0
+    assert EmbeddingCache(path=cache_path, ttl_seconds=60).get(MODEL, "query", 3) is None
+
+
+def test_disk_hit_is_promoted_to_memory(cache_path):
+    EmbeddingCache(path=cache_path).put(MODEL, "query", 3, vector(1))
+    cache = EmbeddingCache(path=cache_path) # A restarted worker: empty memory tier, same file
+    assert cache.get(MODEL, "Query ", 3) == vector(1)
+    assert cache.get(MODEL, "query", 3) == vector(1)
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+    assert stats["memory_entries"] == 1
+
+
+def test_replacing_an_entry_does_not_inflate_the_disk_count(cache_path):
+    cache = EmbeddingCache(path=cache_path, disk_items=100)
+    for value in range(5):
+        cache.put(MODEL, "same query", 3, vector(value))
+    assert cache.stats()["disk_entries"] == 1
+    assert cache.get(MODEL, "same query", 3) == vector(4)
+    assert cache.stats()["evictions"] == 0
+
+
+def test_clear_drops_both_tiers(cache_path):
+    cache = EmbeddingCache(path=cache_path)
+    cache.put(MODEL, "query", 3, vector(1))
+    cache.clear()
+    assert cache.get(MODEL, "query", 3) is None
+    assert cache.stats()["disk_entries"] == 0
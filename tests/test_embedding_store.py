@@ -0,0 +1,88 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from embedding_store import (
+    HEADER_FILE,
+    EmbeddingStore,
+    EmbeddingStoreWriter,
+    convert_jsonl_to_store,
+    is_embedding_store,
+    model_from_jsonl_filename,
+)
+
+
+def test_write_read_round_trip(tmp_path, make_documents):
+    documents = make_documents(25, dimension=8)
+    path = str(tmp_path / "movies.embstore")
+    with EmbeddingStoreWriter(path, "nomic-embed-text", 8) as writer:
+        writer.append(documents[:10])
+        writer.append(documents[10:])
+
+    assert is_embedding_store(path)
+    store = EmbeddingStore(path)
+    assert (store.count, store.dimension, store.model, store.dtype) == (25, 8, "nomic-embed-text", "float32")
+    assert isinstance(store.vectors, np.memmap)
+    np.testing.assert_array_equal(store.vectors, np.asarray([d["embedding"] for d in documents], dtype=np.float32))
+    assert store.column("movie_id") == [d["movie_id"] for d in documents]
+    assert store.column("tagline") == [None] * 25
+    assert store.row_of("17") == 17
+    assert store.row_of("missing") is None
+
+    batches = list(store.iter_documents(batch_size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert batches[2][4]["title"] == "Movie 24"
+    assert batches[2][4]["embedding"] == pytest.approx(documents[24]["embedding"])
+
+
+def test_invalid_documents_are_skipped(tmp_path, make_documents):
+    documents = make_documents(3, dimension=8)
+    documents[1]["embedding"] = documents[1]["embedding"][:4] # Wrong dimension
+    documents[2]["movie_id"] = None
+    with EmbeddingStoreWriter(str(tmp_path / "s.embstore"), "m", 8) as writer:
+        assert writer.append(documents) == 1
+    assert EmbeddingStore(str(tmp_path / "s.embstore")).count == 1
+
+
+def test_float16_and_normalized_stores(tmp_path, make_documents):
+    documents = make_documents(5, dimension=8)
+    path = str(tmp_path / "half.embstore")
+    with EmbeddingStoreWriter(path, "m", 8, dtype="float16", normalize=True) as writer:
+        writer.append(documents)
+    store = EmbeddingStore(path)
+    assert store.dtype == "float16" and store.normalized
+    assert os.path.getsize(os.path.join(path, "vectors.bin")) == 5 * 8 * 2
+    np.testing.assert_allclose(np.linalg.norm(np.asarray(store.vectors, dtype=np.float32), axis=1), 1.0, atol=1e-3)
+
+
+def test_interrupted_writer_is_readable(tmp_path, make_documents):
+    path = str(tmp_path / "partial.embstore")
+    writer = EmbeddingStoreWriter(path, "m", 8)
+    writer.append(make_documents(4, dimension=8))
+    writer._vectors_file.flush()
+    writer._metadata_writer.close() # Metadata footer written, header still says incomplete
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        assert json.load(f)["complete"] is False
+    assert EmbeddingStore(path).count == 4
+
+
+def test_convert_jsonl_to_store(tmp_path, make_documents, write_jsonl):
+    documents = make_documents(12, dimension=8)
+    duplicate = dict(documents[0])
+    short = dict(documents[1], movie_id="99", embedding=[0.0] * 4)
+    path = write_jsonl(documents + [duplicate, short])
+    assert model_from_jsonl_filename(path) == "nomic-embed-text"
+
+    output = str(tmp_path / "converted.embstore")
+    assert convert_jsonl_to_store(path, output, batch_size=5) == 12
+    store = EmbeddingStore(output)
+    assert store.model == "nomic-embed-text"
+    assert store.column("movie_id") == [d["movie_id"] for d in documents]
+    np.testing.assert_array_equal(store.vectors, np.asarray([d["embedding"] for d in documents], dtype=np.float32))
+
+
+def test_unsupported_dtype_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported dtype"):
+        EmbeddingStoreWriter(str(tmp_path / "x.embstore"), "m", 8, dtype="int8")
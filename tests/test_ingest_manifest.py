@@ -0,0 +1,151 @@
+import json
+import os
+
+import pytest
+
+from ingest_manifest import IngestManifest, content_hash
+from ingest_pipeline import IngestionPipeline, JsonlBackupSink, jsonl_carry_over_store
+
+DIMENSION = 4
+
+
+class RecordingEmbedder:
+    """embed_fn stub that remembers which texts it was asked to embed."""
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return [[0.5] * DIMENSION for _ in texts]
+
+
+def upload_all(documents):
+    return [document["movie_id"] for document in documents]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.sqlite3"), "nomic-embed-text", DIMENSION)
+    yield manifest
+    manifest.close()
+
+
+def run_pipeline(path, manifest, embed_fn=None, upload_fn=upload_all, nrows=None, **kwargs):
+    pipeline = IngestionPipeline(embed_fn or RecordingEmbedder(), upload_fn, dimension=DIMENSION,
+                                 csv_chunk_size=25, manifest=manifest, progress_interval=60, **kwargs)
+    return pipeline.run(path, nrows=nrows)
+
+
+def test_unchanged_rows_are_skipped(movies_csv, manifest):
+    path = movies_csv(100)
+    first = run_pipeline(path, manifest)
+    assert first.uploaded == 100
+    assert manifest.count() == 100
+
+    embedder = RecordingEmbedder()
+    second = run_pipeline(path, manifest, embed_fn=embedder)
+    assert embedder.texts == []
+    assert second.unchanged == 100
+    assert second.uploaded == 0
+    assert len(second.seen_ids) == 100 # Skipped rows still count as present in the source
+
+
+def test_changed_content_is_reembedded(movies_csv, manifest):
+    run_pipeline(movies_csv(100), manifest)
+    embedder = RecordingEmbedder()
+    report = run_pipeline(movies_csv(100, edited={3, 42}, name="edited.csv"), manifest, embed_fn=embedder)
+    assert len(embedder.texts) == 2
+    assert all("director's cut" in text for text in embedder.texts)
+    assert report.unchanged == 98
+    assert report.uploaded == 2
+
+
+def test_model_or_dimension_change_invalidates_hashes():
+    text = "Title: Movie 1"
+    assert content_hash("nomic-embed-text", text, 768) != content_hash("nomic-embed-text", text, 256)
+    assert content_hash("nomic-embed-text", text, 768) != content_hash("bge-m3", text, 768)
+
+
+def test_failed_uploads_are_retried_on_the_next_run(movies_csv, manifest):
+    path = movies_csv(100)
+    # Only even ids make it into the index, as if the run died halfway through
+    run_pipeline(path, manifest, upload_fn=lambda documents: [d["movie_id"] for d in documents if int(d["movie_id"]) % 2 == 0])
+    assert manifest.count() == 50
+
+    embedder = RecordingEmbedder()
+    report = run_pipeline(path, manifest, embed_fn=embedder)
+    assert report.unchanged == 50
+    assert sorted(int(text.split("Movie ")[1].split()[0]) for text in embedder.texts) == list(range(1, 100, 2))
+    assert manifest.count() == 100
+
+
+def test_missing_ids_are_deleted_after_a_complete_scan(movies_csv, manifest):
+    run_pipeline(movies_csv(100), manifest)
+    report = run_pipeline(movies_csv(95, name="shorter.csv"), manifest)
+    assert report.complete_scan
+    stale_ids, skip_reason = manifest.plan_deletes(report.seen_ids, report.complete_scan, max_fraction=0.2)
+    assert skip_reason is None
+    assert sorted(stale_ids, key=int) == ["95", "96", "97", "98", "99"]
+
+
+def test_missing_ids_are_kept_after_a_partial_scan(movies_csv, manifest):
+    path = movies_csv(100)
+    run_pipeline(path, manifest)
+    report = run_pipeline(path, manifest, nrows=90) # Rows 90-99 weren't read, not removed
+    assert not report.complete_scan
+    stale_ids, skip_reason = manifest.plan_deletes(report.seen_ids, report.complete_scan, max_fraction=0.2)
+    assert stale_ids == []
+    assert "part of the source file" in skip_reason
+
+
+def test_max_delete_fraction_refuses_mass_deletes(movies_csv, manifest):
+    run_pipeline(movies_csv(100), manifest)
+    report = run_pipeline(movies_csv(50, name="truncated.csv"), manifest)
+    assert report.complete_scan
+
+    stale_ids, skip_reason = manifest.plan_deletes(report.seen_ids, report.complete_scan, max_fraction=0.2)
+    assert stale_ids == []
+    assert "50 of 100" in skip_reason
+
+    stale_ids, skip_reason = manifest.plan_deletes(report.seen_ids, report.complete_scan, max_fraction=0.5)
+    assert skip_reason is None
+    assert len(stale_ids) == 50
+
+
+def test_remove_forgets_deleted_ids(movies_csv, manifest):
+    run_pipeline(movies_csv(10), manifest)
+    manifest.remove(["1", "2"])
+    assert manifest.count() == 8
+    assert set(manifest.lookup(["1", "2", "3"])) == {"3"}
+
+
+def run_with_jsonl_backup(path, manifest, backup_path, embed_fn):
+    """Runs the pipeline the way the ingestion notebook does with BACKUP_FORMAT=jsonl."""
+    carry_over_store = jsonl_carry_over_store([backup_path], backup_path + ".carryover.embstore", "nomic-embed-text", DIMENSION)
+    sink = JsonlBackupSink(backup_path + ".tmp")
+    report = run_pipeline(path, manifest, embed_fn=embed_fn, sinks=[sink],
+                          carry_over_stores=[carry_over_store] if carry_over_store else [])
+    os.replace(sink.path, backup_path)
+    with open(backup_path, "r", encoding="utf-8") as f:
+        return report, {record["movie_id"]: record for record in map(json.loads, f)}
+
+
+def test_jsonl_backup_keeps_unchanged_documents(movies_csv, manifest, tmp_path):
+    backup_path = str(tmp_path / "movie_embeddings_nomic-embed-text_100records.jsonl")
+    path = movies_csv(100)
+    first, backup = run_with_jsonl_backup(path, manifest, backup_path, RecordingEmbedder())
+    assert len(backup) == 100
+
+    embedder = RecordingEmbedder()
+    second, backup = run_with_jsonl_backup(movies_csv(100, edited={7}, name="edited.csv"), manifest, backup_path, embedder)
+    assert len(embedder.texts) == 1
+    assert second.unchanged == 99
+    assert len(backup) == 100 # Not just the re-embedded document
+    assert "director's cut" in backup["7"]["overview"]
+    assert backup["8"]["embedding"] == [0.5] * DIMENSION
+
+    third, backup = run_with_jsonl_backup(path, manifest, backup_path, RecordingEmbedder())
+    assert third.unchanged == 99
+    assert len(backup) == 100
+    assert not os.path.exists(backup_path + ".tmp")
@@ -0,0 +1,44 @@
+import pytest
+
+from ingest_pipeline import IngestionPipeline
+
+DIMENSION = 4
+
+
+def fake_embed(texts):
+    return [[0.5] * DIMENSION for _ in texts]
+
+
+def fake_upload(documents):
+    return [document["movie_id"] for document in documents]
+
+
+def run_pipeline(path, nrows=None, csv_chunk_size=30, **kwargs):
+    pipeline = IngestionPipeline(fake_embed, fake_upload, dimension=DIMENSION, csv_chunk_size=csv_chunk_size,
+                                 progress_interval=60, **kwargs)
+    return pipeline.run(path, nrows=nrows)
+
+
+@pytest.mark.parametrize("nrows", [None, 100, 105, 1000])
+def test_reading_the_whole_file_is_a_complete_scan(movies_csv, nrows):
+    # Dropped rows (empty overviews) must not count against the limit
+    path = movies_csv(100, empty_overviews=range(10))
+    report = run_pipeline(path, nrows=nrows)
+    assert report.complete_scan
+    assert report.rows_read == 100
+    assert report.uploaded == 90
+
+
+@pytest.mark.parametrize("csv_chunk_size", [30, 50, 100])
+def test_limit_exactly_at_a_chunk_boundary_is_complete(movies_csv, csv_chunk_size):
+    report = run_pipeline(movies_csv(100), nrows=100, csv_chunk_size=csv_chunk_size)
+    assert report.complete_scan
+    assert report.uploaded == 100
+
+
+@pytest.mark.parametrize("nrows", [50, 60, 99])
+def test_limit_shorter_than_the_file_is_a_partial_scan(movies_csv, nrows):
+    report = run_pipeline(movies_csv(100, empty_overviews=range(10)), nrows=nrows)
+    assert not report.complete_scan
+    assert report.rows_read == nrows # The lookahead row isn't processed
+    assert report.uploaded == nrows - 10
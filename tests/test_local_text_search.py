@@ -0,0 +1,102 @@
+import math
+
+import pytest
+
+from local_text_search import BM25Index, RRF_K, hybrid_search, reciprocal_rank_fusion, tokenize
+
+DOCUMENTS = [
+    {"movie_id": "1", "title": "Space Robot", "overview": "A lonely robot cleans up the earth.", "tagline": None, "genres": "Animation"},
+    {"movie_id": "2", "title": "Ocean Story", "overview": "A fish searches the ocean for his son.", "tagline": "Just keep swimming", "genres": "Animation"},
+    {"movie_id": "3", "title": "Heist", "overview": "A crew plans one last robbery.", "tagline": None, "genres": "Crime"},
+    {"movie_id": "4", "title": "Robot Wars", "overview": "Giant machines fight over the ocean floor.", "tagline": "Robot versus robot", "genres": None},
+    {"movie_id": "1", "title": "Duplicate", "overview": "Skipped because the id repeats.", "tagline": None, "genres": None},
+]
+
+
+def test_tokenize_lowercases_and_drops_stopwords():
+    assert tokenize("The Robot, and THE Ocean!") == ["robot", "ocean"]
+    assert tokenize(None) == []
+
+
+def test_build_skips_duplicate_ids():
+    index = BM25Index.build(DOCUMENTS)
+    assert index.count == 4
+    assert index.metadata["movie_id"] == ["1", "2", "3", "4"]
+    assert "duplicate" not in index.vocabulary
+
+
+def test_score_only_returns_matching_documents():
+    index = BM25Index.build(DOCUMENTS)
+    docs, scores = index.score("robot")
+    assert sorted(index.metadata["movie_id"][d] for d in docs) == ["1", "4"]
+    assert all(score > 0 for score in scores)
+    assert len(index.score("submarine")[0]) == 0
+    assert len(index.score("the and of")[0]) == 0 # Stopwords only
+
+
+def test_score_matches_bm25_formula():
+    index = BM25Index.build(DOCUMENTS, field_weights={"title": 1.0})
+    docs, scores = index.score("heist")
+    assert len(docs) == 1
+    doc = int(docs[0])
+    idf = math.log(1.0 + (4 - 1 + 0.5) / (1 + 0.5))
+    norm = index.k1 * (1.0 - index.b + index.b * index.doc_lengths[doc] / index.average_length)
+    assert scores[0] == pytest.approx(idf * (index.k1 + 1.0) / (1.0 + norm), rel=1e-5)
+
+
+def test_search_ranks_by_weighted_term_frequency():
+    index = BM25Index.build(DOCUMENTS)
+    rows, count = index.search("robot", k=1)
+    assert count == 2
+    assert [row["movie_id"] for row in rows] == ["4"] # Title plus tagline mentions outweigh one
+    assert set(rows[0]) == {"movie_id", "title", "overview", "tagline", "genres", "@search.score"}
+
+
+def test_empty_index_scores_nothing():
+    index = BM25Index.build([])
+    assert index.count == 0
+    assert index.search("robot") == ([], 0)
+
+
+def test_save_load_round_trip(tmp_path):
+    index = BM25Index.build(DOCUMENTS, k1=1.5, b=0.5)
+    path = str(tmp_path / "keyword_index.npz")
+    index.save(path, source="2@123")
+
+    loaded = BM25Index.load(path)
+    assert loaded.source == "2@123"
+    assert (loaded.k1, loaded.b) == (1.5, 0.5)
+    assert loaded.vocabulary == index.vocabulary
+    assert loaded.metadata == index.metadata # None values survive
+    for query in ("robot", "ocean swimming", "crime heist"):
+        assert loaded.search(query, k=4) == index.search(query, k=4)
+
+
+def test_save_defaults_to_the_index_source(tmp_path):
+    index = BM25Index.build(DOCUMENTS)
+    path = str(tmp_path / "keyword_index.npz")
+    index.save(path)
+    assert BM25Index.load(path).source == ""
+    index.source = "1@456"
+    index.save(path)
+    assert BM25Index.load(path).source == "1@456"
+
+
+def test_reciprocal_rank_fusion():
+    fused = dict(reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]]))
+    assert fused["b"] == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert fused["a"] == pytest.approx(1 / (RRF_K + 1))
+    assert fused["d"] == pytest.approx(1 / (RRF_K + 2))
+    assert [key for key, _ in reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])][:2] == ["b", "a"]
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_hybrid_search_fuses_and_counts_distinct_documents():
+    keyword_rows = [{"movie_id": "1", "title": "k1", "@search.score": 9.0}, {"movie_id": "2", "title": "k2", "@search.score": 5.0}]
+    vector_rows = [{"movie_id": "2", "title": "v2", "@search.score": 0.9}, {"movie_id": "3", "title": "v3", "@search.score": 0.8}]
+    rows, count = hybrid_search(keyword_rows, vector_rows, k=2)
+    assert count == 3
+    assert [row["movie_id"] for row in rows] == ["2", "1"] # In both legs beats first in one
+    assert rows[0]["title"] == "v2" # Vector rows win when a document appears in both legs
+    assert rows[0]["@search.score"] == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert vector_rows[0]["@search.score"] == 0.9 # Inputs are not modified
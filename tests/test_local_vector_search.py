@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStoreWriter
+from local_vector_search import LocalVectorIndex, cosine_to_search_score, normalize_rows, top_k_indices
+
+
+def test_cosine_to_search_score_matches_azure_and_keeps_order():
+    similarities = np.array([-1.0, -0.2, 0.0, 0.5, 0.99, 1.0])
+    scores = cosine_to_search_score(similarities)
+    assert np.all(np.diff(scores) > 0)
+    assert scores[-1] == pytest.approx(1.0) # Identical vectors: distance 0
+    assert scores[2] == pytest.approx(0.5) # Orthogonal: distance 1
+    assert scores[0] == pytest.approx(1 / 3)
+
+
+def test_top_k_indices_is_sorted_and_handles_small_k():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.3, 0.2, 0.8, 0.0]])
+    np.testing.assert_array_equal(top_k_indices(scores, 2), [[1, 3], [2, 0]])
+    np.testing.assert_array_equal(top_k_indices(scores, 10), [[1, 3, 2, 0], [2, 0, 1, 3]])
+    assert top_k_indices(scores, 0).shape == (2, 0)
+
+
+def test_normalize_rows_leaves_zero_rows():
+    matrix = normalize_rows(np.array([[3.0, 4.0], [0.0, 0.0]], dtype=np.float32))
+    np.testing.assert_allclose(matrix, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def brute_force(documents, query, k):
+    matrix = normalize_rows(np.asarray([d["embedding"] for d in documents], dtype=np.float32))
+    query = np.asarray(query, dtype=np.float32) / np.linalg.norm(query)
+    return [documents[i]["movie_id"] for i in np.argsort(-(matrix @ query))[:k]]
+
+
+def test_search_matches_brute_force(make_documents, write_jsonl):
+    documents = make_documents(200, dimension=16)
+    index = LocalVectorIndex.from_jsonl(write_jsonl(documents))
+    rng = np.random.default_rng(1)
+    for query in rng.normal(size=(5, 16)):
+        rows = index.search(query.tolist(), k=7)
+        assert [row["movie_id"] for row in rows] == brute_force(documents, query, 7)
+        scores = [row["@search.score"] for row in rows]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_a_document_is_its_own_best_match(make_documents, write_jsonl):
+    documents = make_documents(50, dimension=16)
+    index = LocalVectorIndex.from_jsonl(write_jsonl(documents))
+    results = index.search_batch([d["embedding"] for d in documents[:10]], k=1)
+    assert [rows[0]["movie_id"] for rows in results] == [d["movie_id"] for d in documents[:10]]
+    assert results[0][0]["@search.score"] == pytest.approx(1.0, abs=1e-5)
+    assert results[0][0]["title"] == "Movie 0"
+
+
+def test_jsonl_skips_other_dimensions_and_duplicates(make_documents, write_jsonl):
+    documents = make_documents(10, dimension=16) + make_documents(3, dimension=8, start_id=100)
+    documents.append(dict(documents[0]))
+    index = LocalVectorIndex.from_jsonl(write_jsonl(documents), expected_dimension=16)
+    assert (index.count, index.dimension) == (10, 16)
+    with pytest.raises(ValueError, match="No embeddings"):
+        LocalVectorIndex.from_jsonl(write_jsonl(documents[:10]), expected_dimension=32)
+
+
+def test_store_and_jsonl_give_the_same_results(tmp_path, make_documents, write_jsonl):
+    documents = make_documents(100, dimension=16)
+    path = str(tmp_path / "movies.embstore")
+    with EmbeddingStoreWriter(path, "nomic-embed-text", 16, normalize=True) as writer:
+        writer.append(documents)
+    from_store = LocalVectorIndex.from_path(path, expected_dimension=16)
+    from_jsonl = LocalVectorIndex.from_path(write_jsonl(documents))
+    assert isinstance(from_store.vectors, np.memmap) # Normalized float32 store is searched in place
+    assert from_store.model == "nomic-embed-text"
+    query = documents[3]["embedding"]
+    assert [r["movie_id"] for r in from_store.search(query, 5)] == [r["movie_id"] for r in from_jsonl.search(query, 5)]
+    with pytest.raises(ValueError, match="dimension"):
+        LocalVectorIndex.from_store(path, expected_dimension=32)
+
+
+def test_query_dimension_mismatch_raises(make_documents, write_jsonl):
+    index = LocalVectorIndex.from_jsonl(write_jsonl(make_documents(5, dimension=16)))
+    with pytest.raises(ValueError, match="does not match"):
+        index.search([0.1] * 8)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from matryoshka import load_vector_index, matryoshka_dimension, truncate_embedding, truncate_matrix
+
+
+def test_matryoshka_dimension_validates_the_setting(monkeypatch):
+    monkeypatch.delenv("MATRYOSHKA_DIMENSION", raising=False)
+    assert matryoshka_dimension(768) is None
+    monkeypatch.setenv("MATRYOSHKA_DIMENSION", "256")
+    assert matryoshka_dimension(768) == 256
+    monkeypatch.setenv("MATRYOSHKA_DIMENSION", "768")
+    assert matryoshka_dimension(768) is None # Same as the model: nothing to truncate
+    for value in ("1024", "0", "many"):
+        monkeypatch.setenv("MATRYOSHKA_DIMENSION", value)
+        with pytest.raises(ValueError):
+            matryoshka_dimension(768)
+
+
+def test_truncate_matrix_centers_cuts_and_normalizes():
+    matrix = np.random.default_rng(0).normal(size=(4, 16)).astype(np.float32)
+    reduced = truncate_matrix(matrix, 4)
+    assert reduced.shape == (4, 4)
+    np.testing.assert_allclose(np.linalg.norm(reduced, axis=1), 1.0, rtol=1e-5)
+    expected = (matrix - matrix.mean(axis=1, keepdims=True))[:, :4]
+    np.testing.assert_allclose(reduced, expected / np.linalg.norm(expected, axis=1, keepdims=True), rtol=1e-5)
+
+
+def test_truncate_embedding_matches_the_matrix_version():
+    vector = np.random.default_rng(1).normal(size=16).tolist()
+    np.testing.assert_allclose(truncate_embedding(vector, 4), truncate_matrix([vector], 4)[0], rtol=1e-6)
+    assert truncate_embedding(vector, None) is vector
+    assert truncate_embedding(vector, 16) is vector
+
+
+def test_load_vector_index_uses_already_truncated_backups(make_documents, write_jsonl):
+    index = load_vector_index(write_jsonl(make_documents(20, dimension=4)), dimension=4, native_dimension=16)
+    assert (index.count, index.dimension) == (20, 4)
+
+
+def test_load_vector_index_truncates_full_size_backups(make_documents, write_jsonl):
+    documents = make_documents(20, dimension=16)
+    index = load_vector_index(write_jsonl(documents), dimension=4, native_dimension=16)
+    assert (index.count, index.dimension) == (20, 4)
+    expected = truncate_matrix([d["embedding"] for d in documents], 4)
+    np.testing.assert_allclose(index.vectors, expected, rtol=1e-5, atol=1e-6)
+
+    query = truncate_embedding(documents[3]["embedding"], 4)
+    assert index.search(query, k=1)[0]["movie_id"] == "3"
+
+
+def test_load_vector_index_never_truncates_another_models_vectors(make_documents, write_jsonl):
+    path = write_jsonl(make_documents(5, dimension=32))
+    with pytest.raises(ValueError):
+        load_vector_index(path, dimension=4, native_dimension=16)
+    with pytest.raises(ValueError):
+        load_vector_index(path, dimension=4) # Native dimension unknown
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+
+import pytest
+import requests
+
+from ollama_batch_client import OllamaBatchEmbedder, OllamaUnavailableError
+
+DIMENSION = 3
+
+
+class StubResponse:
+    def __init__(self, status_code: int, payload=None, text: str = ""):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = text
+
+    def json(self):
+        return self._payload
+
+
+class StubSession:
+    """Stands in for requests.Session; `handler(texts)` returns a StubResponse or raises."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def post(self, endpoint, json=None, timeout=None):
+        with self._lock:
+            self.calls += 1
+        return self.handler(json["input"])
+
+    def close(self):
+        pass
+
+
+def vectors_for(texts):
+    # The first component carries the text's number, so tests can check alignment
+    return StubResponse(200, {"embeddings": [[float(text.split()[-1]), 0.0, 1.0] for text in texts]})
+
+
+@pytest.fixture
+def make_embedder():
+    embedders = []
+
+    def make(handler, **kwargs):
+        options = dict(dimension=DIMENSION, batch_size=8, adaptive=False, max_in_flight=4,
+                       max_retries=2, backoff_seconds=0.01)
+        options.update(kwargs)
+        embedder = OllamaBatchEmbedder("http://ollama.test/api/embed", "nomic-embed-text", **options)
+        embedder._session = StubSession(handler)
+        embedders.append(embedder)
+        return embedder
+
+    yield make
+    for embedder in embedders:
+        embedder.close()
+
+
+def texts(count):
+    return [f"movie {i}" for i in range(count)]
+
+
+def test_bad_record_is_isolated_by_bisection(make_embedder):
+    def handler(batch):
+        if "movie 13" in batch:
+            return StubResponse(400, text='{"error":"input contains invalid characters"}')
+        return vectors_for(batch)
+
+    embedder = make_embedder(handler)
+    results = embedder.embed(texts(32))
+    assert results[13] is None
+    assert [vector[0] for i, vector in enumerate(results) if i != 13] == [float(i) for i in range(32) if i != 13]
+    assert embedder.stats()["failed"] == 1
+    assert embedder.stats()["splits"] == 3 # 8 -> 4 -> 2 -> 1
+
+
+def test_endpoint_down_fails_fast(make_embedder):
+    def handler(batch):
+        raise requests.exceptions.ConnectionError("connection refused")
+
+    embedder = make_embedder(handler)
+    start = time.time()
+    with pytest.raises(OllamaUnavailableError, match="could not connect"):
+        embedder.embed(texts(512))
+    assert time.time() - start < 2
+    # At most the batches already in flight try (max_retries + 1) times each; nothing is split
+    assert embedder._session.calls <= embedder.max_in_flight * (embedder.max_retries + 1)
+    assert embedder.stats()["splits"] == 0
+
+
+@pytest.mark.parametrize("status", [404, 401])
+def test_whole_request_errors_are_not_split(make_embedder, status):
+    embedder = make_embedder(lambda batch: StubResponse(status, text='{"error":"model not found"}'))
+    with pytest.raises(OllamaUnavailableError, match=f"HTTP {status}"):
+        embedder.embed(texts(64))
+    assert embedder.stats()["splits"] == 0
+    assert embedder._session.calls <= embedder.max_in_flight
+
+
+def test_transient_errors_are_retried(make_embedder):
+    failures = {"left": 2}
+    lock = threading.Lock()
+
+    def handler(batch):
+        with lock:
+            if failures["left"]:
+                failures["left"] -= 1
+                return StubResponse(503, text="busy")
+        return vectors_for(batch)
+
+    embedder = make_embedder(handler, max_in_flight=1)
+    results = embedder.embed(texts(8))
+    assert [vector[0] for vector in results] == [float(i) for i in range(8)]
+    assert embedder.stats()["retries"] == 2
+
+
+def test_order_is_preserved_under_concurrency(make_embedder):
+    def handler(batch):
+        time.sleep(random.uniform(0, 0.01)) # Batches complete out of order
+        return vectors_for(batch)
+
+    embedder = make_embedder(handler, batch_size=5, max_in_flight=8)
+    results = embedder.embed(texts(203))
+    assert [vector[0] for vector in results] == [float(i) for i in range(203)]
+    assert embedder.stats()["embedded"] == 203
+
+
+def test_wrong_dimension_marks_only_that_text(make_embedder):
+    def handler(batch):
+        return StubResponse(200, {"embeddings": [[1.0] * (2 if text == "movie 5" else DIMENSION) for text in batch]})
+
+    results = make_embedder(handler).embed(texts(10))
+    assert results[5] is None
+    assert sum(result is None for result in results) == 1
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+from result_cache import SearchResultCache, files_fingerprint, local_index_name, make_result_key
+
+MODEL = "nomic-embed-text"
+INDEX = "movies"
+ROWS = [{"movie_id": "1", "title": "Movie 1", "@search.score": 0.9}]
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "results.sqlite3")
+
+
+def make_cache(path, **kwargs):
+    return SearchResultCache(path=path, version_check_seconds=0, **kwargs)
+
+
+class Counter:
+    """Fingerprint function standing in for the index's document count."""
+
+    def __init__(self, value: int = 100):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+
+def test_key_covers_every_setting_that_changes_results():
+    base = make_result_key("space robots", "Vector", 5, MODEL, INDEX, "100:0", 768, "default")
+    assert base == make_result_key("  Space   ROBOTS ", "Vector", 5, MODEL, INDEX, "100:0", 768, "default")
+    variants = [
+        make_result_key("space robots", "Hybrid", 5, MODEL, INDEX, "100:0", 768, "default"),
+        make_result_key("space robots", "Vector", 10, MODEL, INDEX, "100:0", 768, "default"),
+        make_result_key("space robots", "Vector", 5, "bge-m3", INDEX, "100:0", 768, "default"),
+        make_result_key("space robots", "Vector", 5, MODEL, "other", "100:0", 768, "default"),
+        make_result_key("space robots", "Vector", 5, MODEL, INDEX, "101:0", 768, "default"),
+        make_result_key("space robots", "Vector", 5, MODEL, INDEX, "100:0", 256, "default"),
+        make_result_key("space robots", "Vector", 5, MODEL, INDEX, "100:0", 768, "movies-semantic"),
+    ]
+    assert len(set(variants + [base])) == len(variants) + 1
+
+
+def test_round_trip_through_both_tiers(cache_path):
+    cache = make_cache(cache_path)
+    version = cache.index_version(INDEX, Counter())
+    assert cache.get("robots", "Keyword", 5, MODEL, INDEX, version) is None
+    cache.put("robots", "Keyword", 5, MODEL, INDEX, version, ROWS, count=42)
+    assert cache.get("Robots", "Keyword", 5, MODEL, INDEX, version)["count"] == 42
+    assert cache.memory_hits == 1
+
+    other_worker = make_cache(cache_path)
+    entry = other_worker.get("robots", "Keyword", 5, MODEL, INDEX, version)
+    assert entry["rows"] == ROWS
+    assert other_worker.disk_hits == 1
+
+
+def test_dimension_and_semantic_configuration_are_separate_entries(cache_path):
+    cache = make_cache(cache_path)
+    version = cache.index_version(INDEX, Counter())
+    cache.put("robots", "Semantic", 5, MODEL, INDEX, version, ROWS, dimension=768, semantic_configuration="default")
+    assert cache.get("robots", "Semantic", 5, MODEL, INDEX, version, 768, "default") is not None
+    assert cache.get("robots", "Semantic", 5, MODEL, INDEX, version, 256, "default") is None
+    assert cache.get("robots", "Semantic", 5, MODEL, INDEX, version, 768, "other") is None
+
+
+def test_bump_version_invalidates_every_worker(cache_path):
+    app = make_cache(cache_path)
+    version = app.index_version(INDEX, Counter())
+    app.put("robots", "Keyword", 5, MODEL, INDEX, version, ROWS)
+
+    # Ingestion updates documents in place (same count) and bumps the stamp from its own process
+    assert make_cache(cache_path).bump_version(INDEX) == 1
+
+    new_version = app.index_version(INDEX, Counter())
+    assert new_version != version
+    assert app.invalidations == 1
+    assert app.get("robots", "Keyword", 5, MODEL, INDEX, new_version) is None
+    assert app.get("robots", "Keyword", 5, MODEL, INDEX, version) is None # Old entries were dropped from both tiers
+    assert app.stats()["disk_entries"] == 0
+
+
+def test_fingerprint_change_invalidates(cache_path):
+    cache = make_cache(cache_path)
+    count = Counter(100)
+    version = cache.index_version(INDEX, count)
+    cache.put("robots", "Keyword", 5, MODEL, INDEX, version, ROWS)
+    count.value = 101
+    assert cache.index_version(INDEX, count) != version
+    assert cache.invalidations == 1
+
+
+def test_version_is_only_rechecked_after_the_interval(cache_path):
+    cache = SearchResultCache(path=cache_path, version_check_seconds=3600)
+    count = Counter(100)
+    version = cache.index_version(INDEX, count)
+    count.value = 101
+    assert cache.index_version(INDEX, count) == version
+    cache.bump_version(INDEX) # The bumping process forgets its own memoized version
+    assert cache.index_version(INDEX, count) != version
+
+
+def test_unreadable_fingerprint_keeps_the_last_version(cache_path):
+    cache = make_cache(cache_path)
+
+    def unreachable():
+        raise ConnectionError("service down")
+    assert cache.index_version(INDEX, unreachable) is None
+    version = cache.index_version(INDEX, Counter())
+    assert cache.index_version(INDEX, unreachable) == version
+
+
+def test_memory_only_cache(tmp_path):
+    cache = SearchResultCache(path="", version_check_seconds=0)
+    version = cache.index_version(INDEX, Counter())
+    cache.put("robots", "Keyword", 5, MODEL, INDEX, version, ROWS)
+    assert cache.get("robots", "Keyword", 5, MODEL, INDEX, version) is not None
+    cache.bump_version(INDEX)
+    assert cache.get("robots", "Keyword", 5, MODEL, INDEX, version) is None
+
+
+def test_files_fingerprint_sees_rewrites_and_store_directories(tmp_path):
+    path = tmp_path / "embeddings.jsonl"
+    path.write_text("a\n")
+    before = files_fingerprint(str(path))
+    mtime = os.path.getmtime(path)
+    path.write_text("ab\n")
+    os.utime(path, (mtime, mtime)) # Same mtime: the size still differs
+    assert files_fingerprint(str(path)) != before
+
+    store = tmp_path / "movies.embstore"
+    store.mkdir()
+    (store / "vectors.f32").write_bytes(b"\0" * 8)
+    before = files_fingerprint(str(store))
+    assert before.startswith("1:8@")
+    (store / "vectors.f32").write_bytes(b"\0" * 16)
+    assert files_fingerprint(str(store)) != before
+    assert files_fingerprint(None, str(tmp_path / "missing*.jsonl")) == "0:0@0.000"
+
+
+def test_local_index_name_includes_ann_settings():
+    assert local_index_name("data/*.jsonl") == "local:data/*.jsonl"
+    assert local_index_name("data/*.jsonl", "ivf.npz", 8) != local_index_name("data/*.jsonl", "ivf.npz", 16)
@@ -0,0 +1,150 @@
+import pytest
+
+from fakes import FakeAzureSearchServer
+from search_uploader import SearchUploader, estimate_document_bytes, make_batches
+
+
+def documents(count: int, start: int = 0) -> list:
+    return [{"movie_id": str(i), "title": f"Movie {i}", "overview": "x" * 200} for i in range(start, start + count)]
+
+
+@pytest.fixture
+def azure():
+    with FakeAzureSearchServer(latency_ms=0) as server:
+        yield server
+
+
+def make_uploader(server, **kwargs):
+    options = {"max_workers": 2, "backoff_seconds": 0.001, "timeout": 10, **kwargs}
+    return SearchUploader(server.url, "movies", "key", **options)
+
+
+def test_make_batches_respects_count_and_bytes():
+    docs = documents(10)
+    assert [len(b) for b in make_batches(docs, max_documents=4)] == [4, 4, 2]
+    size = estimate_document_bytes(docs[0])
+    assert [len(b) for b in make_batches(docs, max_bytes=size * 3)] == [3, 3, 3, 1]
+    assert make_batches([]) == []
+
+
+def test_upload_indexes_every_document(azure):
+    uploader = make_uploader(azure, max_batch_documents=7)
+    report = uploader.upload(documents(20))
+    uploader.close()
+    assert sorted(report.succeeded, key=int) == [str(i) for i in range(20)]
+    assert report.failures == {}
+    assert report.batches == 3
+    assert len(azure.documents) == 20
+
+
+def test_207_retries_only_the_failed_documents(azure):
+    azure.document_failures = {"3": [409], "5": [429, 422]}
+    uploader = make_uploader(azure)
+    report = uploader.upload(documents(10))
+    uploader.close()
+    assert len(report.succeeded) == 10
+    assert report.failures == {}
+    assert report.retries == 2
+    assert azure.index_requests == [10, 2, 1]
+
+
+def test_207_non_retriable_failures_are_reported(azure):
+    azure.document_failures = {"2": [400]}
+    uploader = make_uploader(azure)
+    report = uploader.upload(documents(5))
+    uploader.close()
+    assert sorted(report.succeeded) == ["0", "1", "3", "4"]
+    assert report.failures["2"][0] == 400
+    assert report.retries == 0
+
+
+def test_413_splits_the_batch_until_it_fits(azure):
+    docs = documents(16)
+    azure.max_request_bytes = sum(estimate_document_bytes(doc) for doc in docs[:5]) # Room for about 5 documents
+    uploader = make_uploader(azure)
+    report = uploader.upload(docs)
+    uploader.close()
+    assert len(report.succeeded) == 16
+    assert report.splits == 3 # 16 -> 8 + 8 -> 4 + 4 + 4 + 4
+    assert azure.index_requests == [4, 4, 4, 4]
+
+
+def test_413_for_a_single_document_fails_it(azure):
+    azure.max_request_bytes = 10
+    uploader = make_uploader(azure)
+    report = uploader.upload(documents(1))
+    uploader.close()
+    assert report.succeeded == []
+    assert report.failures["0"][0] == 413
+
+
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_throttled_requests_back_off_and_retry(azure, status_code):
+    azure.request_failures = [status_code, status_code]
+    uploader = make_uploader(azure)
+    report = uploader.upload(documents(5))
+    uploader.close()
+    assert len(report.succeeded) == 5
+    assert report.retries == 2
+    assert azure.index_requests == [5]
+
+
+def test_throttling_past_max_retries_fails_the_batch(azure):
+    azure.request_failures = [503] * 3
+    uploader = make_uploader(azure, max_retries=2)
+    report = uploader.upload(documents(3))
+    uploader.close()
+    assert report.succeeded == []
+    assert {status for status, _ in report.failures.values()} == {503}
+    assert azure.index_requests == []
+
+
+def test_bad_request_is_not_retried(azure):
+    azure.request_failures = [400]
+    uploader = make_uploader(azure)
+    report = uploader.upload(documents(3))
+    uploader.close()
+    assert report.retries == 0
+    assert len(report.failures) == 3
+
+
+def test_duplicate_keys_are_sent_once(azure, capsys):
+    docs = documents(4) + [{"movie_id": "1", "title": "Movie 1 (updated)", "overview": "y"}]
+    uploader = make_uploader(azure)
+    report = uploader.upload(docs)
+    uploader.close()
+    assert report.duplicates == 1
+    assert sorted(report.succeeded) == ["0", "1", "2", "3"]
+    assert azure.documents["1"]["title"] == "Movie 1 (updated)" # Last one wins
+    report.print_summary()
+    assert "1 documents had a duplicate key" in capsys.readouterr().out
+
+
+def test_non_json_response_is_retried(azure, monkeypatch):
+    uploader = make_uploader(azure)
+    send = uploader._send
+    calls = []
+
+    def garbled_once(batch, action):
+        response = send(batch, action)
+        calls.append(len(batch))
+        if len(calls) == 1:
+            response._content = b"<html>Gateway says OK</html>"
+        return response
+    monkeypatch.setattr(uploader, "_send", garbled_once)
+    report = uploader.upload(documents(3))
+    uploader.close()
+    assert len(report.succeeded) == 3
+    assert report.retries == 1
+    assert calls == [3, 3]
+
+
+def test_delete_and_unknown_action(azure):
+    uploader = make_uploader(azure)
+    uploader.upload(documents(3))
+    report = uploader.upload([{"movie_id": "1"}], action="delete")
+    assert report.succeeded == ["1"]
+    assert sorted(azure.documents) == ["0", "2"]
+    with pytest.raises(ValueError):
+        uploader.upload(documents(1), action="replace")
+    uploader.close()
@@ -0,0 +1,166 @@
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from tracing import JsonlSpanExporter, PrometheusEndpoint, SpanMetrics, Tracer, breakdown, summarize_payload, summarize_trace_file
+
+
+class ListExporter:
+    """Collects exported batches in memory."""
+
+    def __init__(self):
+        self.batches = []
+
+    def export(self, spans):
+        self.batches.append([span.to_dict() for span in spans])
+
+    def close(self):
+        pass
+
+
+def test_spans_nest_and_the_whole_trace_is_exported_with_the_root():
+    exporter = ListExporter()
+    tracer = Tracer(exporters=[exporter])
+    with tracer.span("app.search", mode="Vector") as root:
+        with tracer.span("ollama.embed") as embed:
+            assert tracer.current_span() is embed
+        with tracer.span("azure.search"):
+            pass
+        assert exporter.batches == [] # Nothing is written until the request finishes
+    assert tracer.current_span() is None
+
+    [spans] = exporter.batches
+    assert [span["name"] for span in spans] == ["ollama.embed", "azure.search", "app.search"]
+    assert {span["trace_id"] for span in spans} == {spans[-1]["trace_id"]}
+    assert spans[0]["parent_id"] == spans[1]["parent_id"] == root.span_id
+    assert spans[-1]["parent_id"] is None
+    assert spans[-1]["attributes"] == {"mode": "Vector"}
+    assert [name for name, _ in breakdown(root)] == ["ollama.embed", "azure.search"]
+
+
+def test_exceptions_mark_the_span_failed_and_propagate():
+    exporter = ListExporter()
+    tracer = Tracer(exporters=[exporter])
+    with pytest.raises(ValueError):
+        with tracer.span("azure.search"):
+            raise ValueError("bad query")
+    [[span]] = exporter.batches
+    assert span["status"] == "error"
+    assert span["error"] == "ValueError: bad query"
+    assert 'movie_search_span_errors_total{span="azure.search"} 1' in tracer.metrics.render()
+
+
+def test_set_error_without_raising():
+    tracer = Tracer()
+    with tracer.span("health.ollama") as span:
+        span.set_error("connection refused")
+    assert span.to_dict()["status"] == "error"
+
+
+def test_unsampled_traces_still_feed_metrics():
+    exporter = ListExporter()
+    tracer = Tracer(exporters=[exporter], sample_rate=0.0)
+    for _ in range(3):
+        with tracer.span("app.search"):
+            pass
+    assert exporter.batches == []
+    assert 'movie_search_span_duration_seconds_count{span="app.search"} 3' in tracer.metrics.render()
+
+
+def test_work_in_a_copied_context_joins_the_trace():
+    exporter = ListExporter()
+    tracer = Tracer(exporters=[exporter])
+    release = threading.Event()
+
+    def keyword_leg():
+        with tracer.span("local.keyword"):
+            pass
+
+    def late_work():
+        release.wait(5)
+        with tracer.span("cache.write"):
+            pass
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        with tracer.span("app.search") as root:
+            pool.submit(contextvars.copy_context().run, keyword_leg).result()
+            late = pool.submit(contextvars.copy_context().run, late_work)
+        release.set()
+        late.result()
+
+    first, second = exporter.batches
+    assert [span["name"] for span in first] == ["local.keyword", "app.search"]
+    assert first[0]["parent_id"] == root.span_id
+    assert [span["name"] for span in second] == ["cache.write"] # Outlived its request: exported on its own
+    assert second[0]["trace_id"] == first[0]["trace_id"]
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = SpanMetrics(buckets=(0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.05, 0.5, 5.0):
+        metrics.record("azure.search", seconds)
+    text = metrics.render()
+    for bound, count in (("0.01", 1), ("0.1", 2), ("1.0", 3), ("+Inf", 4)):
+        assert f'movie_search_span_duration_seconds_bucket{{span="azure.search",le="{bound}"}} {count}' in text
+    assert 'movie_search_span_duration_seconds_sum{span="azure.search"} 5.555000' in text
+
+
+def test_prometheus_endpoint_serves_metrics():
+    metrics = SpanMetrics()
+    metrics.record("ollama.embed", 0.02)
+    endpoint = PrometheusEndpoint(metrics, port=0)
+    try:
+        response = requests.get(f"http://127.0.0.1:{endpoint.port}/metrics", timeout=5)
+        assert response.status_code == 200
+        assert 'span="ollama.embed"' in response.text
+        assert requests.get(f"http://127.0.0.1:{endpoint.port}/other", timeout=5).status_code == 404
+    finally:
+        endpoint.close()
+
+
+def test_summarize_payload_collapses_vectors_and_caps_size():
+    text = summarize_payload({"model": "nomic-embed-text", "embeddings": [[0.5] * 768]})
+    assert "<768 floats: 0.5000, 0.5000, 0.5000, 0.5000, ...>" in text
+    assert len(text) < 200
+    assert summarize_payload({"input": ["a", "b"]}) == '{"input": ["a", "b"]}'
+    capped = summarize_payload({"text": "x" * 100}, max_chars=20)
+    assert capped.startswith('{"text": "xxxxxxxxxx') and capped.endswith("more chars)")
+
+
+def test_log_payload_is_sampled():
+    tracer = Tracer(payload_sample_rate=1.0, payload_max_chars=50)
+    with tracer.span("ollama.embed") as span:
+        tracer.log_payload("request", {"input": ["space robots"]})
+    assert span.attributes["payload.request"] == '{"input": ["space robots"]}'
+
+    tracer = Tracer(payload_sample_rate=0.0)
+    with tracer.span("ollama.embed") as span:
+        tracer.log_payload("request", {"input": ["space robots"]})
+    assert span.attributes == {}
+
+
+def test_jsonl_exporter_round_trips_through_the_summary(tmp_path):
+    path = str(tmp_path / "traces" / "spans.jsonl")
+    exporter = JsonlSpanExporter(path)
+    tracer = Tracer(exporters=[exporter])
+    for _ in range(4):
+        with tracer.span("app.search"):
+            with tracer.span("azure.search"):
+                pass
+    with pytest.raises(RuntimeError):
+        with tracer.span("app.search"):
+            raise RuntimeError("boom")
+    tracer.close()
+
+    with open(path, "r", encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f]
+    assert len(spans) == 9
+    summary = summarize_trace_file(path)
+    assert summary["app.search"]["count"] == 5
+    assert summary["app.search"]["errors"] == 1
+    assert summary["azure.search"]["count"] == 4
+    assert summary["azure.search"]["p50"] <= summary["azure.search"]["max"]